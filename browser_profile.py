@@ -0,0 +1,163 @@
+import heapq
+import json
+import logging
+from collections import namedtuple, defaultdict
+
+from config import BROWSER_PROFILE_TOP_COUNT
+
+
+__author__ = 'jayesh'
+
+logger = logging.getLogger(__name__)
+
+# times are in ms since the page was opened , size in bytes
+ResourceTiming = namedtuple('ResourceTiming', 'url status start ttfb end size content_type')
+
+
+def format_size(size):
+    for unit in ('B', 'KB', 'MB'):
+        if size < 1024:
+            return "{:.0f} {}".format(size, unit) if unit == 'B' else "{:.1f} {}".format(size, unit)
+        size /= 1024.0
+    return "{:.1f} GB".format(size)
+
+
+def _keep_top(heap, item, count):
+    if len(heap) < count:
+        heapq.heappush(heap, item)
+    else:
+        heapq.heappushpop(heap, item)
+
+
+class ResourceStats(object):
+    __slots__ = ('url', 'content_type', 'loads', 'total_time', 'timed_count', 'total_ttfb', 'ttfb_count',
+                 'slowest_time', 'slowest_page', 'size', 'total_size')
+
+    def __init__(self, url, content_type):
+        self.url = url
+        self.content_type = content_type
+        self.loads = 0
+        self.total_time = 0
+        self.timed_count = 0
+        self.total_ttfb = 0
+        self.ttfb_count = 0
+        self.slowest_time = -1
+        self.slowest_page = None
+        self.size = 0
+        self.total_size = 0
+
+    def add(self, timing, page_url):
+        self.loads += 1
+        self.size = max(self.size, timing.size)
+        self.total_size += timing.size
+        if timing.start is None or timing.end is None:
+            return
+        duration = timing.end - timing.start
+        self.total_time += duration
+        self.timed_count += 1
+        if timing.ttfb is not None:
+            self.total_ttfb += timing.ttfb - timing.start
+            self.ttfb_count += 1
+        if duration > self.slowest_time:
+            self.slowest_time = duration
+            self.slowest_page = page_url
+
+    def average_time(self):
+        return float(self.total_time) / self.timed_count if self.timed_count else 0.0
+
+    def average_ttfb(self):
+        return float(self.total_ttfb) / self.ttfb_count if self.ttfb_count else 0.0
+
+
+class BrowserProfile(object):
+    """
+    Aggregates the timings reported by the browsers into the slowest and
+    heaviest pages and resources of the site. Only the top_count pages are
+    kept, resources are kept per url so memory grows with the distinct
+    resources of the site, not with the pages. Every page's timings are
+    also written to page_timings.jsonl as they come in, to compare runs.
+    """
+
+    def __init__(self, top_count=BROWSER_PROFILE_TOP_COUNT, timings_file="page_timings.jsonl"):
+        self.top_count = top_count
+        self.slowest_pages = []
+        self.heaviest_pages = []
+        self.resources = dict()
+        self.page_count = 0
+        self.timings_output = open(timings_file, 'w')
+
+    def add(self, resource):
+        if resource.load_time is None:
+            return
+        self.page_count += 1
+        page = (resource.parent, resource.load_time, resource.dom_content_loaded, resource.resource_count,
+                resource.size)
+        _keep_top(self.slowest_pages, (resource.load_time, page), self.top_count)
+        _keep_top(self.heaviest_pages, (resource.size, page), self.top_count)
+
+        slowest = None
+        for timing in resource.timings:
+            stats = self.resources.get(timing.url)
+            if stats is None:
+                stats = self.resources[timing.url] = ResourceStats(timing.url, timing.content_type)
+            stats.add(timing, resource.parent)
+            if timing.start is not None and timing.end is not None and \
+                    (slowest is None or timing.end - timing.start > slowest.end - slowest.start):
+                slowest = timing
+
+        self.timings_output.write(json.dumps({
+            'url': resource.parent, 'status': resource.status, 'load_time': resource.load_time,
+            'dom_content_loaded': resource.dom_content_loaded, 'resources': resource.resource_count,
+            'size': resource.size, 'slowest_resource': slowest.url if slowest else None,
+            'slowest_resource_time': slowest.end - slowest.start if slowest else None}) + '\n')
+
+    def write(self, file_name="browser_profile.txt"):
+        self.timings_output.close()
+        resources = self.resources.values()
+        with open(file_name, 'w') as output_file:
+            output_file.write("Profiled {} pages , {} distinct resources\n".format(self.page_count, len(resources)))
+
+            output_file.write("\nSlowest pages ( load , DOMContentLoaded , resources , size ) :\n")
+            for _, page in sorted(self.slowest_pages, reverse=True):
+                output_file.write(_format_page(page))
+
+            output_file.write("\nHeaviest pages ( load , DOMContentLoaded , resources , size ) :\n")
+            for _, page in sorted(self.heaviest_pages, reverse=True):
+                output_file.write(_format_page(page))
+
+            output_file.write("\nSlowest resources ( slowest load , average load , average time to first byte , "
+                              "loads ) :\n")
+            for stats in heapq.nlargest(self.top_count, resources, key=lambda stats: stats.slowest_time):
+                output_file.write(u"{} ms\t{:.0f} ms\t{:.0f} ms\t{}\t{}\t( slowest on {} )\n".format(
+                    stats.slowest_time, stats.average_time(), stats.average_ttfb(), stats.loads, stats.url,
+                    stats.slowest_page).encode('utf8'))
+
+            output_file.write("\nHeaviest resources ( size , content type , loads ) :\n")
+            for stats in heapq.nlargest(self.top_count, resources, key=lambda stats: stats.size):
+                output_file.write(u"{}\t{}\t{}\t{}\n".format(format_size(stats.size), stats.content_type or '-',
+                                                             stats.loads, stats.url).encode('utf8'))
+
+            output_file.write("\nTransferred per content type ( size , loads , distinct resources ) :\n")
+            for content_type, (size, loads, count) in sorted(_totals_per_content_type(resources).items(),
+                                                             key=lambda item: item[1], reverse=True):
+                output_file.write(u"{}\t{}\t{}\t{}\n".format(format_size(size), loads, count,
+                                                             content_type).encode('utf8'))
+        logger.debug("Wrote the browser profile of {} pages to {}".format(self.page_count, file_name))
+
+
+def _format_page(page):
+    url, load_time, dom_content_loaded, resource_count, size = page
+    return u"{} ms\t{}\t{} resources\t{}\t{}\n".format(
+        load_time, "{} ms".format(dom_content_loaded) if dom_content_loaded is not None else '-', resource_count,
+        format_size(size), url).encode('utf8')
+
+
+def _totals_per_content_type(resources):
+    totals = defaultdict(lambda: [0, 0, 0])
+    for stats in resources:
+        # charset and other parameters don't matter here
+        content_type = (stats.content_type or 'unknown').split(';')[0].strip().lower()
+        totals[content_type][0] += stats.total_size
+        totals[content_type][1] += stats.loads
+        totals[content_type][2] += 1
+    return dict((content_type, tuple(total)) for content_type, total in totals.items())
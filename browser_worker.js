@@ -0,0 +1,146 @@
+// Long lived browser worker : reads one url per line from stdin , loads it and
+// writes what it finds to stdout , one JSON message per line ( see PROTOCOL in
+// resource_issue_detector.py ). Every page ends with a "page" message.
+// Exits once stdin is closed.
+var system = require('system');
+var webpage = require('webpage');
+
+var PROTOCOL_VERSION = 1;
+var errorCodes = [403, 404, 500, 505];
+var pageTimeout = parseInt(system.args[1] || '30000', 10);
+
+function emit(type, url, fields) {
+    var message = {'v': PROTOCOL_VERSION, 'type': type, 'url': url};
+    for (var key in fields) {
+        if (fields.hasOwnProperty(key)) {
+            message[key] = fields[key];
+        }
+    }
+    // JSON.stringify escapes quotes and line breaks , a message always stays on one line
+    system.stdout.writeLine(JSON.stringify(message));
+    system.stdout.flush();
+}
+
+function headerValue(headers, name) {
+    for (var i = 0; i < headers.length; i++) {
+        if (headers[i].name.toLowerCase() === name) {
+            return headers[i].value;
+        }
+    }
+    return null;
+}
+
+function formatTrace(trace) {
+    return (trace || []).map(function (frame) {
+        return (frame.file || '') + ':' + frame.line + (frame['function'] ? ' in ' + frame['function'] : '');
+    });
+}
+
+function visitNext() {
+    var url = system.stdin.readLine();
+    if (!url) {
+        phantom.exit();
+        return;
+    }
+    visit(url.trim());
+}
+
+function elapsed(since, time) {
+    return (time ? new Date(time).getTime() : Date.now()) - since;
+}
+
+function visit(url) {
+    var page = webpage.create();
+    var finished = false;
+    var started = Date.now();
+    var domContentLoaded = null;
+    var resourceCount = 0;
+    var transferSize = 0;
+    // request id -> {start, ttfb, size} , times in ms since the page was opened
+    var pending = {};
+    page.settings.resourceTimeout = pageTimeout;
+
+    page.onInitialized = function () {
+        page.evaluate(function () {
+            document.addEventListener('DOMContentLoaded', function () {
+                window.callPhantom('DOMContentLoaded');
+            }, false);
+        });
+    };
+
+    page.onCallback = function (data) {
+        if (data === 'DOMContentLoaded' && domContentLoaded === null) {
+            domContentLoaded = elapsed(started);
+        }
+    };
+
+    page.onResourceRequested = function (request) {
+        pending[request.id] = {'start': elapsed(started, request.time), 'ttfb': null, 'size': 0};
+    };
+
+    page.onResourceReceived = function (resource) {
+        var timing = pending[resource.id] || {'start': null, 'ttfb': null, 'size': 0};
+        if (resource.stage === 'start') {
+            timing.ttfb = elapsed(started, resource.time);
+            timing.size = resource.bodySize || 0;
+            return;
+        }
+        if (resource.stage !== 'end') {
+            return;
+        }
+        delete pending[resource.id];
+        var size = parseInt(headerValue(resource.headers || [], 'content-length'), 10);
+        if (isNaN(size)) {
+            size = timing.size;
+        }
+        var resourceUrl = resource.url.indexOf('data:') === 0 ? 'data(...)' : resource.url;
+        resourceCount += 1;
+        transferSize += size;
+        emit('resource', url, {
+            'resource': resourceUrl,
+            'status': resource.status,
+            'start': timing.start,
+            'ttfb': timing.ttfb,
+            'end': elapsed(started, resource.time),
+            'size': size,
+            'content_type': resource.contentType
+        });
+        if (errorCodes.indexOf(resource.status) >= 0) {
+            emit('broken-resource', url, {
+                'resource': resourceUrl,
+                'status': resource.status,
+                'size': size,
+                'content_type': resource.contentType
+            });
+        }
+    };
+
+    page.onError = function (msg, trace) {
+        emit('error', url, {'message': msg, 'trace': formatTrace(trace)});
+    };
+
+    function finish(status) {
+        if (finished) {
+            return;
+        }
+        finished = true;
+        clearTimeout(timer);
+        emit('page', url, {
+            'status': status,
+            'load_time': elapsed(started),
+            'dom_content_loaded': domContentLoaded,
+            'resources': resourceCount,
+            'size': transferSize
+        });
+        page.close();
+        setTimeout(visitNext, 0);
+    }
+
+    var timer = setTimeout(function () {
+        finish('timeout');
+    }, pageTimeout);
+
+    page.open(url, finish);
+}
+
+visitNext();
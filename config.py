@@ -4,8 +4,19 @@ __author__ = 'jayesh'
 
 START_URL = 'http://www.appdynamics.com/'
 MAX_CONCURRENT_REQUESTS_PER_SERVER = 50
+# Politeness settings applied to every host (sub domain / external site) separately
+MAX_CONCURRENT_REQUESTS_PER_HOST = 10
+# Minimum gap in seconds between two requests dispatched to the same host
+MIN_REQUEST_INTERVAL_PER_HOST = 0
+# Response codes that make the host back off, Retry-After is honoured when sent
+BACKOFF_STATUS_CODES = [429, 503]
+INITIAL_BACKOFF_SECONDS = 1
+MAX_BACKOFF_SECONDS = 120
+MAX_RETRIES_PER_PAGE = 3
+# Polling based termination of the legacy site_spider.py , tornado_spider.py stops once nothing is queued or in flight
 IDLE_PING_COUNT = 300
-# In case to skip a domain of format "http://example.com" give the domain name to skip as '.example.com'
+# Host rules : exact host, '.example.com' for example.com and all its sub domains, '*.example.com' for the
+# sub domains only, glob patterns ( 'www.example.*' ) or regular expressions prefixed with 're:'
 DOMAINS_TO_BE_SKIPPED = ['community.appdynamics.com',
                          'docs.appdynamics.com', 'info.appdynamics.com',
                          'appsphere.appdynamics.com', 'education.appdynamics.com',
@@ -16,18 +27,129 @@ DOMAINS_TO_BE_SKIPPED = ['community.appdynamics.com',
                          'www.appdynamics.il', 'www.appdynamics.de',
                          'www.appdynamics.it']
 
+# Url segment rules : plain substrings, glob patterns or regular expressions prefixed with 're:'
 URL_SEGMENTS_TO_SKIP = ['/blog/']
+# Urls matching an allow rule are crawled even when a skip rule matches them
+DOMAINS_TO_BE_ALLOWED = []
+URL_SEGMENTS_TO_ALLOW = []
+
+# Max hosts kept in the host classification ( public suffix lookup ) cache
+HOST_CACHE_SIZE = 4096
+
+# Url canonicalization used for detecting already seen pages
+CANONICAL_MERGE_HTTP_HTTPS = True
+CANONICAL_SORT_QUERY_PARAMETERS = True
+# fnmatch style patterns of query parameters that don't change the page content
+CANONICAL_QUERY_PARAMETERS_TO_DROP = ['utm_*', 'gclid', 'fbclid']
 PHANTOM_JS_LOCATION = '/usr/bin/phantomjs'
 
+# Seen url bookkeeping : 'exact' keeps the canonical urls, 'fingerprint' keeps 8 byte hashes
+# and 'bloom' a bloom filter of BLOOM_FILTER_CAPACITY urls at the given false positive rate
+SEEN_SET_MODE = 'exact'
+BLOOM_FILTER_CAPACITY = 10000000
+BLOOM_FILTER_FALSE_POSITIVE_RATE = 0.001
+
+# Crawl state settings used with --state-dir
+STATE_COMMIT_INTERVAL = 500
+FRONTIER_BATCH_SIZE = 1000
+FRONTIER_LOW_WATERMARK = 200
+
 PAGE_TIMEOUT = 30
+
+# Metrics ( --metrics-port ) are served on METRICS_ADDRESS , a summary line is printed every
+# METRICS_SUMMARY_INTERVAL seconds ( 0 disables it ). Latency bucket bounds are in seconds
+METRICS_ADDRESS = '127.0.0.1'
+METRICS_SUMMARY_INTERVAL = 10
+METRICS_LATENCY_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30]
+METRICS_MAX_HOSTS = 100
+
+# Shared http client : seconds resolved host names are cached for , HTTP/2 is used over TLS when curl
+# supports it ( falls back to HTTP/1.1 otherwise ). Accept-Encoding covers every encoding curl supports
+DNS_CACHE_TIMEOUT = 300
+USE_HTTP2 = True
+# Sitemaps are streamed , children of a sitemap index are fetched MAX_CONCURRENT_SITEMAP_REQUESTS at a time
+MAX_CONCURRENT_SITEMAP_REQUESTS = 4
+SITEMAP_TIMEOUT = 300
+# How internal pages are fetched : 'head-then-get' , 'get-only' ( body download is aborted when the
+# response is not html ) or 'heuristic' ( HEAD for urls with NON_HTML_EXTENSIONS , GET for the rest )
+FETCH_STRATEGY = 'head-then-get'
+NON_HTML_EXTENSIONS = ['.pdf', '.zip', '.gz', '.tgz', '.exe', '.dmg', '.msi', '.jpg', '.jpeg', '.png', '.gif',
+                       '.svg', '.ico', '.css', '.js', '.json', '.xml', '.txt', '.csv', '.doc', '.docx', '.xls',
+                       '.xlsx', '.ppt', '.pptx', '.mp3', '.mp4', '.mov', '.avi', '.woff', '.woff2', '.ttf', '.eot']
 ERROR_CODES = [-1, 404, 500, 403]
+
+# Report files : 'text' , 'csv' or 'jsonl' ( the page lists stay one url per line ) , echoed to the console when
+# REPORT_ECHO is set ( overridable with --report-format / --no-report-echo )
+REPORT_FORMAT = 'text'
+REPORT_ECHO = True
+REPORT_BUFFER_SIZE = 1024 * 1024
+# The page lists are written sorted , urls are sorted in memory in chunks of this many and merged from disk
+REPORT_SORT_CHUNK = 500000
+# Every link of the crawl is kept in link_graph.bin ( 4 to 8 bytes per link and about 20 per url , the urls stay on
+# disk ) , the broken link reports then list every page linking to a broken page instead of the first one found
+# ( overridable with --no-link-graph )
+LINK_GRAPH = True
+
+# link_diff.py hashes the smaller input in memory , inputs bigger than this many bytes are sort-merged on disk
+# in runs of LINK_DIFF_SORT_CHUNK urls
+LINK_DIFF_MEMORY_LIMIT = 256 * 1024 * 1024
+LINK_DIFF_SORT_CHUNK = 500000
+
+# Javascript / broken resource checks ( --jserrors ) : long lived phantomjs workers take urls from a shared queue ,
+# a page gets BROWSER_PAGE_TIMEOUT seconds ( a hung worker is killed BROWSER_KILL_GRACE_PERIOD seconds later ) and
+# workers are restarted after BROWSER_PAGES_PER_WORKER pages to keep their memory in check
 BROWSER_PROCESS_COUNT = 4
+BROWSER_PAGE_TIMEOUT = 30
+BROWSER_KILL_GRACE_PERIOD = 10
+BROWSER_PAGES_PER_WORKER = 100
+# with --jserrors pages are checked while the crawl goes on , at most this many wait for a browser before the crawl
+# slows down to the browsers' pace
+BROWSER_QUEUE_SIZE = 200
+# pages and resources listed in each section of browser_profile.txt
+BROWSER_PROFILE_TOP_COUNT = 25
 DEFAULT_LOGGER_LEVEL = logging.DEBUG
 
+# Html parsing pool : 'thread', 'process' or 'none' to parse on the IOLoop ,
+# at most PARSER_MAX_PENDING bodies wait for a parser before fetching slows down
+PARSER_POOL_TYPE = 'thread'
+PARSER_POOL_SIZE = 4
+PARSER_MAX_PENDING = 16
+# 'dom' parses the downloaded page in the parser pool , 'streaming' parses the body chunks while downloading
+LINK_EXTRACTOR = 'dom'
+# Check the stylesheets, scripts and images of internal pages along with the links
+CHECK_PAGE_RESOURCES = False
+
 # Hard code link settings
 HARD_CODED_LINKS = ['www.appdynamics.com', 'appdynamics.com']
 HARD_CODED_LINK_EXCLUSIONS = ['www.appdynamics.com/info']
 
+# Distributed crawl ( --partitions ) : urls are hash partitioned by 'host' , which keeps the per host limits exact ,
+# or by 'url' , which spreads a single site over all partitions with the per host limits applied per partition
+PARTITION_KEY = 'host'
+# Links owned by other partitions are forwarded in batches of PARTITION_BATCH_SIZE or every PARTITION_FLUSH_INTERVAL ms
+PARTITION_BATCH_SIZE = 500
+PARTITION_FLUSH_INTERVAL = 200
+# Interval in ms between the coordinator's termination probes
+PARTITION_PROBE_INTERVAL = 500
+
+# Synthetic site of crawl_benchmark.py : pages , links per page , page size in bytes , log-normal response delay
+# ( median in ms , sigma ) , share of broken ( 404 / 500 ) and redirecting links , and the seed everything derives from
+BENCHMARK_PAGES = 2000
+BENCHMARK_FANOUT = 10
+BENCHMARK_PAGE_SIZE = 20000
+BENCHMARK_LATENCY_MEDIAN = 20
+BENCHMARK_LATENCY_SIGMA = 0.5
+BENCHMARK_ERROR_RATE = 0.02
+BENCHMARK_REDIRECT_RATE = 0.02
+BENCHMARK_SEED = 1
+# Slowdown ( fraction of pages/sec , peak RSS or CPU time ) against a baseline that fails crawl_benchmark.py --compare
+BENCHMARK_MAX_REGRESSION = 0.1
+# link_benchmark.py : calls per timing , timings taken ( the best one counts ) and the slowdown against
+# link_benchmark_baseline.json that fails the run
+LINK_BENCHMARK_OPS = 50000
+LINK_BENCHMARK_REPEAT = 5
+LINK_BENCHMARK_MAX_SLOWDOWN = 0.25
+
 # Client implementation
 IMPLEMENTATION_CLIENT = 'tornado'
 # {'TORNADO':'tornado','TWISTED':'twisted'}
@@ -0,0 +1,235 @@
+import argparse
+import json
+import logging
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urlparse
+
+from config import BENCHMARK_MAX_REGRESSION
+from crawl_graph import CRAWL_GRAPH_FILE
+from synthetic_site import add_site_arguments, site_from_arguments
+
+
+__author__ = 'jayesh'
+
+logger = logging.getLogger(__name__)
+
+PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+SERVER_START_TIMEOUT = 10
+BROKEN_INTERNAL_LINKS_FILE = 'broken_internal_links.jsonl'
+# higher is better for pages_per_second , lower for the others
+COMPARED_RESULTS = (('pages_per_second', True), ('peak_rss_mb', False), ('cpu_seconds', False))
+
+
+def _free_port():
+    listener = socket.socket()
+    listener.bind(('127.0.0.1', 0))
+    port = listener.getsockname()[1]
+    listener.close()
+    return port
+
+
+def _median(values):
+    values = sorted(values)
+    middle = len(values) // 2
+    return values[middle] if len(values) % 2 else (values[middle - 1] + values[middle]) / 2.0
+
+
+class SiteServer(object):
+    """
+    synthetic_site.py served from a subprocess , so it doesn't share the
+    spider's CPU time or compete with it for the GIL.
+    """
+
+    def __init__(self, site, port=None):
+        self.site = site
+        self.port = port or _free_port()
+        self.process = None
+
+    def start(self):
+        arguments = [sys.executable, os.path.join(PACKAGE_DIR, 'synthetic_site.py'), '--port', str(self.port)]
+        for name, value in sorted(self.site.describe().items()):
+            arguments += ['--{}'.format(name.replace('_', '-')), str(value)]
+        with open(os.devnull, 'w') as devnull:
+            self.process = subprocess.Popen(arguments, stdout=devnull, stderr=devnull)
+        deadline = time.time() + SERVER_START_TIMEOUT
+        while True:
+            try:
+                socket.create_connection(('127.0.0.1', self.port), 1).close()
+                return
+            except socket.error:
+                if self.process.poll() is not None or time.time() > deadline:
+                    self.stop()
+                    raise RuntimeError("Synthetic site didn't start on port {}".format(self.port))
+                time.sleep(0.1)
+
+    def stop(self):
+        if self.process and self.process.poll() is None:
+            self.process.terminate()
+            self.process.wait()
+
+    def url(self, path='/'):
+        return 'http://localhost:{}{}'.format(self.port, path)
+
+
+def run_spider(server, spider_arguments, work_dir):
+    """
+    Runs tornado_spider.py against the server in work_dir , returns
+    (wall seconds , peak RSS in MB , user + system CPU seconds , exit code).
+    The RSS and CPU time are the spider's own , not those of its parser
+    pool processes.
+    """
+    arguments = [sys.executable, os.path.join(PACKAGE_DIR, 'tornado_spider.py'), '--url={}'.format(server.url()),
+                 '--sitemap-url={}'.format(server.url('/sitemap.xml')), '--report-format=jsonl',
+                 '--no-report-echo'] + list(spider_arguments)
+    # spider.log is the spider's own logger file
+    with open(os.path.join(work_dir, 'spider_output.log'), 'w') as log_file:
+        started = time.time()
+        process = subprocess.Popen(arguments, cwd=work_dir, stdout=log_file, stderr=subprocess.STDOUT)
+        _, status, usage = os.wait4(process.pid, 0)
+        elapsed = time.time() - started
+    # ru_maxrss is in KB on linux
+    return elapsed, usage.ru_maxrss / 1024.0, usage.ru_utime + usage.ru_stime, os.WEXITSTATUS(status)
+
+
+def check_broken_links(site, work_dir):
+    """
+    (missing , unexpected) broken internal links of the crawl against those
+    of the site.
+    """
+    expected = set(site.broken_links().items())
+    found = set()
+    report_file = os.path.join(work_dir, BROKEN_INTERNAL_LINKS_FILE)
+    if os.path.exists(report_file):
+        with open(report_file) as input_file:
+            for line in input_file:
+                data = json.loads(line)
+                found.add((urlparse.urlsplit(data['url']).path.encode('utf8'), data['code']))
+    return sorted(expected - found), sorted(found - expected)
+
+
+def count_pages(work_dir):
+    graph_file = os.path.join(work_dir, CRAWL_GRAPH_FILE)
+    if not os.path.exists(graph_file):
+        return 0
+    with open(graph_file) as input_file:
+        return sum(1 for line in input_file if line.strip())
+
+
+def run_benchmark(site, runs=1, spider_arguments=(), keep_dir=None):
+    """
+    Crawls the site runs times and returns the median results along with
+    the results of every run. A run is correct when the spider exits cleanly
+    after visiting every url of the site and reports exactly its broken links.
+    """
+    server = SiteServer(site)
+    server.start()
+    results = []
+    try:
+        for run in xrange(runs):
+            work_dir = tempfile.mkdtemp(prefix='crawl_benchmark')
+            try:
+                elapsed, peak_rss, cpu_time, exit_code = run_spider(server, spider_arguments, work_dir)
+                pages = count_pages(work_dir)
+                missing, unexpected = check_broken_links(site, work_dir)
+                result = dict(seconds=round(elapsed, 3), pages=pages,
+                              pages_per_second=round(pages / elapsed, 2) if elapsed else 0.0,
+                              peak_rss_mb=round(peak_rss, 1), cpu_seconds=round(cpu_time, 3), exit_code=exit_code,
+                              missing_broken_links=len(missing), unexpected_broken_links=len(unexpected))
+                logger.debug("Run {} : {}".format(run + 1, result))
+                if missing or unexpected:
+                    logger.warning("Run {} missed {} and wrongly reported {} broken links , first ones : {} {}".format(
+                        run + 1, len(missing), len(unexpected), missing[:5], unexpected[:5]))
+                results.append(result)
+            finally:
+                if keep_dir:
+                    target = os.path.join(keep_dir, 'run-{}'.format(run + 1))
+                    if os.path.exists(target):
+                        shutil.rmtree(target)
+                    shutil.move(work_dir, target)
+                else:
+                    shutil.rmtree(work_dir, ignore_errors=True)
+    finally:
+        server.stop()
+
+    summary = dict((name, _median([result[name] for result in results]))
+                   for name in ('seconds', 'pages', 'pages_per_second', 'peak_rss_mb', 'cpu_seconds'))
+    expected_pages = site.expected_pages()
+    summary['correct'] = all(not result['exit_code'] and result['pages'] == expected_pages and
+                             not result['missing_broken_links'] and not result['unexpected_broken_links']
+                             for result in results)
+    return dict(site=site.describe(), spider_arguments=list(spider_arguments), expected_pages=expected_pages,
+                expected_broken_links=len(site.broken_links()), summary=summary, runs=results)
+
+
+def compare_results(baseline, current, max_regression=BENCHMARK_MAX_REGRESSION):
+    """
+    Yields (name , baseline value , current value , change , regressed) for
+    the compared results , change is the relative one ( + is worse ).
+    """
+    for name, higher_is_better in COMPARED_RESULTS:
+        old, new = baseline['summary'][name], current['summary'][name]
+        if not old:
+            continue
+        change = (new - old) / float(old)
+        if higher_is_better:
+            change = -change
+        yield name, old, new, change, change > max_regression
+
+
+def format_results(results):
+    summary = results['summary']
+    return ("Crawled {:.0f} pages ( {} expected ) in {:.1f} s : {:.1f} pages/s , peak RSS {:.1f} MB , CPU {:.1f} s , "
+            "{} broken links expected , results {}").format(
+        summary['pages'], results['expected_pages'], summary['seconds'], summary['pages_per_second'],
+        summary['peak_rss_mb'], summary['cpu_seconds'], results['expected_broken_links'],
+        'correct' if summary['correct'] else 'WRONG')
+
+
+def process_parameters():
+    parser = argparse.ArgumentParser(
+        description='Crawls a local synthetic site with tornado_spider.py and reports pages/s , peak RSS , '
+                    'CPU time and the correctness of the broken link report',
+        epilog='Arguments after -- are passed on to tornado_spider.py')
+    add_site_arguments(parser)
+    parser.add_argument("--runs", type=int, default=1, help="crawls to take the median results of")
+    parser.add_argument("--output", help="file to write the results to as JSON")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    parser.add_argument("--compare", help="results JSON of a baseline run , exits with 1 on a regression")
+    parser.add_argument("--max-regression", dest="max_regression", type=float, default=BENCHMARK_MAX_REGRESSION,
+                        help="relative slowdown against the baseline that counts as a regression")
+    parser.add_argument("--keep-dir", dest="keep_dir", help="directory to keep the crawl outputs of every run in")
+    parser.add_argument("spider_arguments", nargs=argparse.REMAINDER)
+    args = parser.parse_args()
+    if args.spider_arguments and args.spider_arguments[0] == '--':
+        args.spider_arguments = args.spider_arguments[1:]
+    return args
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    args = process_parameters()
+    if args.keep_dir and not os.path.isdir(args.keep_dir):
+        os.makedirs(args.keep_dir)
+    results = run_benchmark(site_from_arguments(args), args.runs, args.spider_arguments,
+                            os.path.abspath(args.keep_dir) if args.keep_dir else None)
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(results, output_file, indent=2, sort_keys=True)
+    print(json.dumps(results, indent=2, sort_keys=True) if args.json else format_results(results))
+
+    failed = not results['summary']['correct']
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)
+        if baseline['site'] != results['site']:
+            logger.warning("The baseline crawled a different site : {}".format(baseline['site']))
+        for name, old, new, change, regressed in compare_results(baseline, results, args.max_regression):
+            print("{} : {} -> {} ( {:+.1%} ){}".format(name, old, new, change, ' REGRESSION' if regressed else ''))
+            failed = failed or regressed
+    sys.exit(1 if failed else 0)
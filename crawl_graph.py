@@ -0,0 +1,159 @@
+import json
+import logging
+import os
+import shutil
+import time
+
+from config import ERROR_CODES
+from crawl_state import PageRecord
+from frontier import create_seen_set
+from url_canonicalizer import canonicalize_url
+
+
+__author__ = 'jayesh'
+
+logger = logging.getLogger(__name__)
+
+CRAWL_GRAPH_FILE = 'crawl_graph.jsonl'
+CRAWL_INFO_FILE = 'crawl_info.json'
+
+
+def _record_from_line(line):
+    data = json.loads(line)
+    parent = PageRecord(data['parent']) if data.get('parent') else None
+    return PageRecord(data['url'], parent, data.get('code', -1), data.get('content_type'), data.get('failure'),
+                      data.get('internal', False), set(data.get('hardcoded', []))), data
+
+
+def read_crawl_graph(graph_file):
+    """
+    Yields (PageRecord, raw json dict) for every page of a crawl graph file.
+    """
+    with open(graph_file) as input_file:
+        for line in input_file:
+            if line.strip():
+                yield _record_from_line(line)
+
+
+class CrawlGraphPages(object):
+    """
+    Re-iterable PageRecords of one or more crawl graph files, used as the
+    visited pages of the reports without loading them all in memory.
+    """
+
+    def __init__(self, graph_files):
+        self.graph_files = graph_files
+        self.count = None
+
+    def __iter__(self):
+        for graph_file in self.graph_files:
+            for record, _ in read_crawl_graph(graph_file):
+                yield record
+
+    def __len__(self):
+        if self.count is None:
+            self.count = sum(1 for _ in self)
+        return self.count
+
+
+class CrawlGraphWriter(object):
+    """
+    Streams one json line per visited page ( status, parent and outgoing
+    links ) so a later run can crawl incrementally against it. The file is
+    written under a temporary name and moved in place once complete. When
+    appending , the pages of a run that already moved its file in place
+    ( an interrupted crawl that drained ) are copied back first.
+    """
+
+    def __init__(self, output_dir='.', append=False):
+        self.graph_file = os.path.join(output_dir, CRAWL_GRAPH_FILE)
+        self.info_file = os.path.join(output_dir, CRAWL_INFO_FILE)
+        self.temp_file = self.graph_file + '.tmp'
+        self.started = time.time()
+        if append and not os.path.exists(self.temp_file) and os.path.exists(self.graph_file):
+            shutil.copyfile(self.graph_file, self.temp_file)
+        if append and os.path.exists(self.info_file):
+            # a later --since run compares against the start of the first part of the crawl
+            with open(self.info_file) as info_file:
+                self.started = json.load(info_file)['started']
+        self.output = open(self.temp_file, 'a' if append else 'w')
+
+    def write_page(self, page, links):
+        self.write_line(json.dumps({'url': page.url, 'parent': page.parent.url if page.parent is not None else None,
+                                    'code': page.response_code, 'content_type': page.content_type,
+                                    'failure': page.failure_message, 'internal': page.is_page_internal(),
+                                    'hardcoded': sorted(page.hardcoded_urls), 'links': sorted(links)}))
+
+    def write_line(self, line):
+        self.output.write(line.rstrip('\n') + '\n')
+
+    def close(self):
+        self.output.close()
+        os.rename(self.temp_file, self.graph_file)
+        with open(self.info_file, 'w') as info_file:
+            json.dump({'started': self.started, 'finished': time.time()}, info_file)
+
+
+class IncrementalCrawl(object):
+    """
+    Page graph of a previous run used by --since : only pages that changed
+    after that run ( sitemap lastmod ) or are new get crawled, their links and
+    previously broken pages are re-checked and everything else is carried
+    over from the previous graph.
+    """
+
+    def __init__(self, previous_run):
+        run_dir = previous_run if os.path.isdir(previous_run) else os.path.dirname(previous_run) or '.'
+        self.graph_file = previous_run if not os.path.isdir(previous_run) \
+            else os.path.join(previous_run, CRAWL_GRAPH_FILE)
+        with open(os.path.join(run_dir, CRAWL_INFO_FILE)) as info_file:
+            self.previous_start = json.load(info_file)['started']
+
+        self.previous_keys = create_seen_set()
+        self.broken_pages = []
+        self.changed_keys = set()
+        self.rechecked_keys = set()
+        # canonical key -> (response code , content type , failure) of the known pages only checked ( HEAD ) ,
+        # their previous record is carried over with the new status
+        self.checked_pages = dict()
+        for record, _ in read_crawl_graph(self.graph_file):
+            self.previous_keys.add(canonicalize_url(record.url))
+            if record.response_code in ERROR_CODES:
+                self.broken_pages.append(record)
+        logger.debug(u"Loaded {} pages , {} broken from {}".format(len(self.previous_keys), len(self.broken_pages),
+                                                                    self.graph_file))
+
+    def is_known(self, key):
+        return key in self.previous_keys
+
+    def is_changed(self, key, last_modified):
+        return not self.is_known(key) or (last_modified is not None and last_modified > self.previous_start)
+
+    def mark_changed(self, key):
+        self.changed_keys.add(key)
+
+    def should_follow_links(self, key):
+        return key in self.changed_keys or not self.is_known(key)
+
+    def mark_checked(self, page):
+        self.checked_pages[page.key] = (page.response_code, page.content_type, page.failure_message)
+
+    def carried_over_pages(self):
+        """
+        Yields (PageRecord, raw json dict, json line) of previous pages not re-crawled in this run , the pages
+        only checked keep their links and hardcoded urls with the status found by the check.
+        """
+        with open(self.graph_file) as input_file:
+            for line in input_file:
+                if not line.strip():
+                    continue
+                record, data = _record_from_line(line)
+                key = canonicalize_url(record.url)
+                if key in self.rechecked_keys:
+                    continue
+                status = self.checked_pages.get(key)
+                if status is not None:
+                    record.response_code, record.content_type, record.failure_message = status
+                    data.update(code=status[0], content_type=status[1], failure=status[2])
+                    line = json.dumps(data)
+                yield record, data, line
@@ -0,0 +1,220 @@
+import bisect
+import logging
+import time
+from collections import Counter, OrderedDict
+
+from tornado.httpserver import HTTPServer
+from tornado.ioloop import PeriodicCallback
+from tornado.web import Application, RequestHandler
+
+from config import METRICS_LATENCY_BUCKETS, METRICS_MAX_HOSTS, METRICS_ADDRESS, METRICS_SUMMARY_INTERVAL
+
+
+__author__ = 'jayesh'
+
+logger = logging.getLogger(__name__)
+
+METRICS_PREFIX = 'spider'
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+# dns / connect / tls only for requests opening a new connection , ttfb from the start of the request ,
+# head / get the whole request , parse the link extraction of a page
+PHASES = ('dns', 'connect', 'tls', 'ttfb', 'head', 'get', 'parse')
+
+
+def _escape_label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram(object):
+    """
+    Latency histogram with fixed bucket upper bounds ( seconds ).
+    """
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets=METRICS_LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        # last count is for values above the last bucket
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, fraction):
+        """
+        Upper bound of the bucket holding the given fraction of the values.
+        """
+        if not self.count:
+            return None
+        rank = fraction * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float('inf')
+
+    def cumulative_counts(self):
+        total = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            total += count
+            yield bound, total
+
+
+class CrawlMetrics(object):
+    """
+    Counters , latency histograms per phase and gauges read from the spider
+    when rendered. Everything is updated on the IOLoop , rendering happens
+    there too so no locking is needed.
+    """
+
+    def __init__(self, buckets=METRICS_LATENCY_BUCKETS):
+        self.started = time.time()
+        self.latency = OrderedDict((phase, Histogram(buckets)) for phase in PHASES)
+        self.counters = Counter()
+        self.status_codes = Counter()
+        self.host_pages = Counter()
+        self.gauges = OrderedDict()
+        self.last_summary = (self.started, 0)
+
+    def add_gauge(self, name, description, read):
+        self.gauges[name] = (description, read)
+
+    def observe(self, phase, seconds):
+        self.latency[phase].observe(seconds)
+
+    def record_transfer(self, method, new_connection, name_lookup, connect, tls_done, first_byte, total, size):
+        """
+        Curl timings of one request , all measured from its start.
+        """
+        self.counters['requests'] += 1
+        self.counters['bytes_downloaded'] += size
+        if new_connection:
+            self.observe('dns', name_lookup)
+            self.observe('connect', connect - name_lookup)
+            if tls_done > 0:
+                self.observe('tls', tls_done - connect)
+        if first_byte > 0:
+            self.observe('ttfb', first_byte)
+        if method == 'HEAD':
+            self.observe('head', total)
+        elif method == 'GET':
+            self.observe('get', total)
+
+    def record_page(self, host, response_code):
+        self.counters['pages'] += 1
+        self.status_codes[response_code] += 1
+        self.host_pages[host] += 1
+
+    def pages_per_second(self):
+        elapsed = time.time() - self.started
+        return self.counters['pages'] / elapsed if elapsed > 0 else 0.0
+
+    def render(self):
+        """
+        Prometheus text exposition format.
+        """
+        lines = []
+
+        def metric(name, metric_type, description, samples):
+            name = '{}_{}'.format(METRICS_PREFIX, name)
+            lines.append('# HELP {} {}'.format(name, description))
+            lines.append('# TYPE {} {}'.format(name, metric_type))
+            for suffix, labels, value in samples:
+                label_text = ','.join('{}="{}"'.format(key, _escape_label(unicode(label)).encode('utf8'))
+                                      for key, label in labels)
+                lines.append('{}{}{} {}'.format(name, suffix, '{' + label_text + '}' if label_text else '',
+                                                _format_value(value)))
+
+        metric('pages_total', 'counter', 'Pages visited.', [('', (), self.counters['pages'])])
+        metric('requests_total', 'counter', 'HTTP requests completed.', [('', (), self.counters['requests'])])
+        metric('bytes_downloaded_total', 'counter', 'Response body bytes downloaded.',
+               [('', (), self.counters['bytes_downloaded'])])
+        metric('pages_per_second', 'gauge', 'Pages visited per second since the crawl started.',
+               [('', (), self.pages_per_second())])
+        for name, (description, read) in self.gauges.items():
+            metric(name, 'gauge', description, [('', (), read())])
+        metric('responses_total', 'counter', 'Visited pages per response code ( -1 when no response ).',
+               [('', (('code', code),), count) for code, count in sorted(self.status_codes.items())])
+        metric('host_pages_total', 'counter', 'Visited pages of the {} busiest hosts.'.format(METRICS_MAX_HOSTS),
+               [('', (('host', host),), count) for host, count in self.host_pages.most_common(METRICS_MAX_HOSTS)])
+
+        samples = []
+        for phase, histogram in self.latency.items():
+            for bound, count in histogram.cumulative_counts():
+                samples.append(('_bucket', (('phase', phase), ('le', '+Inf' if bound == float('inf') else bound)),
+                                count))
+            samples.append(('_sum', (('phase', phase),), histogram.sum))
+            samples.append(('_count', (('phase', phase),), histogram.count))
+        metric('phase_seconds', 'histogram', 'Latency of the request and page processing phases.', samples)
+        return '\n'.join(lines) + '\n'
+
+    def summary_line(self):
+        """
+        One line summary , the page rate is the one since the previous summary.
+        """
+        now, pages = time.time(), self.counters['pages']
+        last_time, last_pages = self.last_summary
+        self.last_summary = (now, pages)
+        recent_rate = (pages - last_pages) / (now - last_time) if now > last_time else 0.0
+        codes = Counter()
+        for code, count in self.status_codes.items():
+            codes['{}xx'.format(code // 100) if code > 0 else 'failed'] += count
+        latencies = []
+        for phase in ('ttfb', 'get', 'parse'):
+            histogram = self.latency[phase]
+            if histogram.count:
+                latencies.append('{} p50 {:.0f} ms p95 {:.0f} ms'.format(
+                    phase, 1000 * histogram.quantile(0.5), 1000 * histogram.quantile(0.95)))
+        gauges = ' , '.join('{} {}'.format(name.replace('_', ' '), read()) for name, (_, read) in self.gauges.items())
+        return "Metrics : {:.1f} pages/s ( {:.1f} overall ) , {} , {:.1f} MB , {} , {}".format(
+            recent_rate, self.pages_per_second(), gauges, self.counters['bytes_downloaded'] / 1048576.0,
+            ' '.join('{} {}'.format(name, count) for name, count in sorted(codes.items())) or 'no responses',
+            ' , '.join(latencies) or 'no timings')
+
+
+class MetricsHandler(RequestHandler):
+    def initialize(self, metrics):
+        self.metrics = metrics
+
+    def get(self):
+        self.set_header('Content-Type', PROMETHEUS_CONTENT_TYPE)
+        self.write(self.metrics.render())
+
+
+class MetricsReporter(object):
+    """
+    Serves the metrics on http://address:port/metrics when a port is given
+    and prints the summary line every summary_interval seconds.
+    """
+
+    def __init__(self, metrics, port=None, address=METRICS_ADDRESS, summary_interval=METRICS_SUMMARY_INTERVAL):
+        self.metrics = metrics
+        self.port = port
+        self.address = address
+        self.server = None
+        self.summary = PeriodicCallback(self.print_summary, summary_interval * 1000) if summary_interval else None
+
+    def start(self):
+        if self.port:
+            self.server = HTTPServer(Application([(r'/metrics', MetricsHandler, dict(metrics=self.metrics))]))
+            self.server.listen(self.port, address=self.address)
+            print("Metrics served on http://{}:{}/metrics".format(self.address, self.port))
+        if self.summary:
+            self.summary.start()
+
+    def print_summary(self):
+        print(self.metrics.summary_line())
+
+    def stop(self):
+        if self.server:
+            self.server.stop()
+        if self.summary:
+            self.summary.stop()
@@ -0,0 +1,194 @@
+import csv
+import heapq
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+from collections import defaultdict
+
+from config import ERROR_CODES, REPORT_FORMAT, REPORT_ECHO, REPORT_BUFFER_SIZE, REPORT_SORT_CHUNK
+from util import is_html_page
+
+
+__author__ = 'jayesh'
+
+logger = logging.getLogger(__name__)
+
+REPORT_FORMATS = ['text', 'csv', 'jsonl']
+UNKNOWN_ERROR_CODE = -1
+
+
+def _encode(value):
+    return value.encode('utf8') if isinstance(value, unicode) else value
+
+
+class ReportOutput(object):
+    """
+    One report file written through a large buffer under a temporary name ,
+    moved in place and echoed to the console ( when asked ) on close.
+    """
+
+    def __init__(self, base_name, report_format='text', echo=False):
+        self.file_name = '{}.{}'.format(base_name, 'txt' if report_format == 'text' else report_format)
+        self.temp_file = self.file_name + '.tmp'
+        self.echo = echo
+        self.output = open(self.temp_file, 'wb', REPORT_BUFFER_SIZE)
+        self.csv_writer = csv.writer(self.output) if report_format == 'csv' else None
+
+    def write(self, text):
+        self.output.write(text)
+
+    def write_row(self, row):
+        self.csv_writer.writerow([_encode(value) for value in row])
+
+    def write_json(self, data):
+        self.output.write(json.dumps(data) + '\n')
+
+    def close(self):
+        self.output.close()
+        os.rename(self.temp_file, self.file_name)
+        if self.echo:
+            with open(self.file_name, 'rb') as report_file:
+                shutil.copyfileobj(report_file, sys.stdout, REPORT_BUFFER_SIZE)
+            sys.stdout.flush()
+
+
+class SortedPageList(object):
+    """
+    Url list written sorted on close , so the lists of two runs can be
+    compared with diff. Urls are sorted in chunks of REPORT_SORT_CHUNK ,
+    full chunks go to temporary run files merged on close.
+    """
+
+    def __init__(self, base_name):
+        self.output = ReportOutput(base_name)
+        self.lines = []
+        self.runs = []
+
+    def write(self, line):
+        self.lines.append(line)
+        if len(self.lines) >= REPORT_SORT_CHUNK:
+            run = tempfile.TemporaryFile()
+            run.writelines(sorted(self.lines))
+            run.seek(0)
+            self.runs.append(run)
+            self.lines = []
+
+    def close(self):
+        self.lines.sort()
+        for line in heapq.merge(self.lines, *self.runs):
+            self.output.write(line)
+        for run in self.runs:
+            run.close()
+        self.output.close()
+
+
+class CrawlReport(object):
+    """
+    Report stage fed one visited page at a time. The hardcoded links are
+    streamed to their file as pages come in , the html page lists are
+    sorted in bounded chunks , broken pages are bucketed by external /
+    internal , response code and parent ( urls only ) and written out by
+    write(). Nothing scans the whole set of visited pages at the end of the
+    crawl.
+    """
+
+    def __init__(self, report_format=REPORT_FORMAT, echo=REPORT_ECHO, link_graph=None):
+        self.report_format = report_format
+        self.echo = echo
+        # with the link graph broken pages are listed under every page linking to them , not only the first one
+        self.link_graph = link_graph
+        self.page_count = 0
+        self.error_codes = frozenset(ERROR_CODES)
+        # external -> response code -> parent url -> [(url, failure message)]
+        self.broken_pages = dict((external, defaultdict(lambda: defaultdict(list))) for external in (True, False))
+        self.hardcoded_output = ReportOutput('hardcoded_url_links', report_format, echo)
+        if report_format == 'csv':
+            self.hardcoded_output.write_row(['page', 'hardcoded_url'])
+        # read by --url-file , link_diff and the browser checks , so always one url per line
+        self.page_lists = {False: SortedPageList('all_internal_pages'), True: SortedPageList('all_external_pages')}
+
+    def add(self, page):
+        self.page_count += 1
+        external = not page.is_page_internal()
+        if page.response_code in self.error_codes:
+            if page.parent:
+                self.broken_pages[external][page.response_code][page.parent.url].append(
+                    (page.url, page.failure_message))
+        elif is_html_page(page, external):
+            self.page_lists[external].write(_encode(page.url) + '\n')
+        if page.hardcoded_urls:
+            self._write_hardcoded(page)
+
+    def _write_hardcoded(self, page):
+        output = self.hardcoded_output
+        if self.report_format == 'csv':
+            for url in page.hardcoded_urls:
+                output.write_row([page.url, url])
+        elif self.report_format == 'jsonl':
+            output.write_json({'page': page.url, 'hardcoded': sorted(page.hardcoded_urls)})
+        else:
+            output.write("\nExamined {} : \nHardcoded links found : {}\n".format(_encode(page.url),
+                                                                              len(page.hardcoded_urls)))
+            for url in page.hardcoded_urls:
+                output.write("{} \n".format(_encode(url)))
+
+    def _write_broken_pages(self, external, base_name):
+        output = ReportOutput(base_name, self.report_format, self.echo)
+        if self.report_format == 'csv':
+            output.write_row(['parent', 'url', 'code', 'failure'])
+        buckets = self.broken_pages[external]
+        for error_code in ERROR_CODES:
+            parents = buckets.get(error_code)
+            if not parents:
+                continue
+            if self.link_graph is not None:
+                parents = self._referrers_of(parents)
+            for parent_url in sorted(parents):
+                pages = sorted(parents[parent_url])
+                if self.report_format == 'csv':
+                    for url, failure_message in pages:
+                        output.write_row([parent_url, url, error_code, failure_message])
+                elif self.report_format == 'jsonl':
+                    for url, failure_message in pages:
+                        output.write_json({'parent': parent_url, 'url': url, 'code': error_code,
+                                           'failure': failure_message})
+                else:
+                    code = '-1 (unknown)' if error_code == UNKNOWN_ERROR_CODE else str(error_code)
+                    output.write("\nExamined {} : \nPages with response Code {} : \n".format(_encode(parent_url),
+                                                                                            code))
+                    for url, failure_message in pages:
+                        failure = '[{}]'.format(_encode(failure_message)) \
+                            if error_code == UNKNOWN_ERROR_CODE else ''
+                        output.write("{} {} \n".format(_encode(url), failure))
+        output.close()
+
+    def _referrers_of(self, parents):
+        referrers = defaultdict(list)
+        for parent_url, pages in parents.items():
+            for page in pages:
+                # pages queued from the sitemap have no referrer in the graph
+                for referrer in self.link_graph.referrers(page[0]) or [parent_url]:
+                    referrers[referrer].append(page)
+        return referrers
+
+    def write(self):
+        self._write_broken_pages(True, "broken_external_links")
+        self._write_broken_pages(False, "broken_internal_links")
+        self.hardcoded_output.close()
+        print("\nTotal pages visited : {}\n".format(self.page_count))
+        for output in self.page_lists.values():
+            output.close()
+        logger.debug("Wrote the reports of {} pages".format(self.page_count))
+
+
+def write_reports(visited_pages, report_format=REPORT_FORMAT, echo=REPORT_ECHO, link_graph=None):
+    """
+    Reports of an already complete set of pages , in a single pass over them.
+    """
+    report = CrawlReport(report_format, echo, link_graph)
+    for page in visited_pages:
+        report.add(page)
+    report.write()
@@ -0,0 +1,154 @@
+import logging
+import os
+import sqlite3
+
+from config import STATE_COMMIT_INTERVAL
+from util import decode_to_unicode
+
+
+__author__ = 'jayesh'
+
+logger = logging.getLogger(__name__)
+
+STATE_DB_NAME = 'crawl_state.sqlite'
+
+QUEUED = 0
+VISITED = 1
+LOADED = 2
+SKIPPED = 3
+
+
+class PageRecord(object):
+    """
+    Read only view of a page stored in the crawl state, exposes the attributes
+    the report functions in util expect from a WebPage.
+    """
+
+    def __init__(self, url, parent=None, response_code=-1, content_type=u'', failure_message=u'',
+                 internal=False, hardcoded_urls=None):
+        self.url = url
+        self.encoded_url = url
+        self.parent = parent
+        self.response_code = response_code
+        self.content_type = content_type or u''
+        self.failure_message = failure_message or u''
+        self.internal = internal
+        self.hardcoded_urls = hardcoded_urls or set()
+
+    def is_page_internal(self):
+        return self.internal
+
+    def __hash__(self):
+        return hash(self.url)
+
+    def __eq__(self, other):
+        return other is not None and self.url == other.url
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __lt__(self, other):
+        return self.url < other.url
+
+
+class _VisitedPages(object):
+    def __init__(self, state):
+        self.state = state
+
+    def __iter__(self):
+        cursor = self.state.connection.execute(
+            "SELECT url, parent_url, response_code, content_type, failure_message, internal, hardcoded_urls "
+            "FROM pages WHERE state = ? ORDER BY rowid", (VISITED,))
+        for url, parent_url, response_code, content_type, failure_message, internal, hardcoded in cursor:
+            parent = PageRecord(parent_url) if parent_url else None
+            hardcoded_urls = set(hardcoded.split(u'\n')) if hardcoded else set()
+            yield PageRecord(url, parent, response_code, content_type, failure_message, bool(internal),
+                             hardcoded_urls)
+
+    def __len__(self):
+        return self.state.count(VISITED)
+
+
+class CrawlState(object):
+    """
+    Frontier and visited set of a crawl kept in a sqlite database inside the
+    state directory, so an interrupted crawl can be resumed without keeping
+    the whole site graph in memory.
+    """
+
+    def __init__(self, state_dir, commit_interval=STATE_COMMIT_INTERVAL):
+        if not os.path.isdir(state_dir):
+            os.makedirs(state_dir)
+        self.db_path = os.path.join(state_dir, STATE_DB_NAME)
+        self.commit_interval = commit_interval
+        self.pending_writes = 0
+        self.connection = sqlite3.connect(self.db_path)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS pages ("
+            "url_key TEXT PRIMARY KEY, url TEXT NOT NULL, parent_url TEXT, state INTEGER NOT NULL, "
+            "response_code INTEGER, content_type TEXT, failure_message TEXT, internal INTEGER, "
+            "hardcoded_urls TEXT)")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS pages_state ON pages (state)")
+        # pages that were handed to the scheduler when the previous run stopped are fetched again
+        resumed = self.connection.execute("UPDATE pages SET state = ? WHERE state = ?", (QUEUED, LOADED)).rowcount
+        self.connection.commit()
+        logger.debug(u"Opened crawl state {} , {} in flight pages re-queued".format(self.db_path, resumed))
+
+    def count(self, state=None):
+        if state is None:
+            return self.connection.execute("SELECT COUNT(*) FROM pages").fetchone()[0]
+        return self.connection.execute("SELECT COUNT(*) FROM pages WHERE state = ?", (state,)).fetchone()[0]
+
+    def add_page(self, page):
+        """
+        Queues the page unless it is already known, returns True for new pages.
+        """
+        parent_url = page.parent.url if page.parent is not None else None
+        cursor = self.connection.execute(
+            "INSERT OR IGNORE INTO pages (url_key, url, parent_url, state) VALUES (?, ?, ?, ?)",
+            (decode_to_unicode(page.key), page.url, parent_url, QUEUED))
+        if cursor.rowcount:
+            self._written()
+            return True
+        return False
+
+    def load_queued(self, limit):
+        rows = self.connection.execute(
+            "SELECT url_key, url, parent_url FROM pages WHERE state = ? ORDER BY rowid LIMIT ?",
+            (QUEUED, limit)).fetchall()
+        self.connection.executemany("UPDATE pages SET state = ? WHERE url_key = ?",
+                                    [(LOADED, row[0]) for row in rows])
+        self._written(len(rows))
+        return [(intern(url_key.encode('utf-8')), url, parent_url) for url_key, url, parent_url in rows]
+
+    def mark_visited(self, page):
+        parent_url = page.parent.url if page.parent is not None else None
+        self.connection.execute(
+            "INSERT OR REPLACE INTO pages (url_key, url, parent_url, state, response_code, content_type, "
+            "failure_message, internal, hardcoded_urls) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (decode_to_unicode(page.key), page.url, parent_url, VISITED, page.response_code, page.content_type,
+             page.failure_message, int(page.is_page_internal()), u'\n'.join(sorted(page.hardcoded_urls))))
+        self._written()
+
+    def mark_skipped(self, page):
+        self.connection.execute("UPDATE pages SET state = ? WHERE url_key = ?",
+                                (SKIPPED, decode_to_unicode(page.key)))
+        self._written()
+
+    def visited_pages(self):
+        return _VisitedPages(self)
+
+    def _written(self, count=1):
+        self.pending_writes += count
+        if self.pending_writes >= self.commit_interval:
+            self.commit()
+
+    def commit(self):
+        self.connection.commit()
+        self.pending_writes = 0
+
+    def close(self):
+        self.commit()
+        self.connection.close()
@@ -0,0 +1,417 @@
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import struct
+import time
+from collections import Counter, defaultdict
+
+from tornado.concurrent import Future
+from tornado.gen import coroutine, Return
+from tornado.ioloop import IOLoop, PeriodicCallback
+from tornado.iostream import IOStream, StreamClosedError
+from tornado.tcpclient import TCPClient
+from tornado.tcpserver import TCPServer
+
+from config import PARTITION_KEY, PARTITION_BATCH_SIZE, PARTITION_FLUSH_INTERVAL, PARTITION_PROBE_INTERVAL, \
+    REPORT_FORMAT, REPORT_ECHO, LINK_GRAPH
+from crawl_graph import CRAWL_GRAPH_FILE, CrawlGraphPages, CrawlGraphWriter
+from crawl_report import write_reports
+from crawl_state import PageRecord
+from frontier import create_seen_set
+from host_info import netloc_of
+from http_client import format_connection_stats
+from link_graph import LinkGraph
+from tornado_client_page import format_fetch_stats
+from url_canonicalizer import canonicalize_url
+from url_rules import hostname_of
+
+
+__author__ = 'jayesh'
+
+logger = logging.getLogger(__name__)
+
+PARTITION_KEYS = ['host', 'url']
+PARTITION_DIR = 'partition-{}'
+
+# messages exchanged as json lines , workers talk to the coordinator only and it routes link batches
+ASSIGN = 'assign'
+LINKS = 'links'
+PROBE = 'probe'
+STATUS = 'status'
+STOP = 'stop'
+GRAPH = 'graph'
+DONE = 'done'
+
+
+def partition_of(url, partition_count, partition_key=PARTITION_KEY):
+    value = hostname_of(netloc_of(url)) if partition_key == 'host' else canonicalize_url(url)
+    if isinstance(value, unicode):
+        value = value.encode('utf-8')
+    return struct.unpack('<I', hashlib.md5(value).digest()[:4])[0] % partition_count
+
+
+def partition_dir(index):
+    return PARTITION_DIR.format(index)
+
+
+class StreamChannel(object):
+    """
+    Json lines over a tornado IOStream : a socketpair to a local worker
+    process or a tcp connection to a remote one. Anything offering send,
+    read , listen and close can stand in for it.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def send(self, message):
+        try:
+            return self.stream.write(json.dumps(message) + '\n')
+        except StreamClosedError:
+            logger.error("Dropped {} message , channel closed".format(message[0]))
+
+    @coroutine
+    def read(self):
+        line = yield self.stream.read_until('\n')
+        raise Return(json.loads(line))
+
+    @coroutine
+    def listen(self, on_message, on_close=None):
+        while True:
+            try:
+                message = yield self.read()
+            except StreamClosedError:
+                if on_close is not None:
+                    on_close()
+                return
+            on_message(message)
+
+    def close(self):
+        self.stream.close()
+
+
+class Partition(object):
+    """
+    Worker side of a distributed crawl. The spider keeps the links this
+    partition owns and hands the rest to forward , they are batched per
+    owning partition and sent through the coordinator. Links forwarded once
+    are not sent again.
+    """
+
+    def __init__(self, index, partition_count, channel, partition_key=PARTITION_KEY):
+        self.index = index
+        self.partition_count = partition_count
+        self.channel = channel
+        self.partition_key = partition_key
+        self.spider = None
+        self.outbound = defaultdict(list)
+        self.forwarded = create_seen_set()
+        self.sent = 0
+        self.received = 0
+        self.waiting = False
+        self.work_arrived = Future()
+        self.flusher = PeriodicCallback(self.flush, PARTITION_FLUSH_INTERVAL)
+
+    @property
+    def is_leader(self):
+        return self.index == 0
+
+    def start(self, spider):
+        self.spider = spider
+        self.channel.listen(self._on_message, self._on_coordinator_lost)
+        self.flusher.start()
+
+    def owns(self, url):
+        return partition_of(url, self.partition_count, self.partition_key) == self.index
+
+    def forward(self, url, parent_page):
+        if not self.forwarded.add(canonicalize_url(url)):
+            return
+        owner = partition_of(url, self.partition_count, self.partition_key)
+        batch = self.outbound[owner]
+        batch.append([url, parent_page.url if parent_page is not None else None])
+        if len(batch) >= PARTITION_BATCH_SIZE:
+            self._send_batch(owner)
+
+    def flush(self):
+        for owner in list(self.outbound):
+            self._send_batch(owner)
+
+    def _send_batch(self, owner):
+        self.channel.send([LINKS, owner, self.outbound.pop(owner)])
+        self.sent += 1
+
+    def wait_for_work(self):
+        """
+        Called once the local frontier is done , resolves when links arrive
+        or the coordinator stops the crawl.
+        """
+        self.waiting = True
+        self.work_arrived = Future()
+        return self.work_arrived
+
+    def _wake(self):
+        self.waiting = False
+        if not self.work_arrived.done():
+            self.work_arrived.set_result(None)
+
+    def _on_message(self, message):
+        kind = message[0]
+        if kind == LINKS:
+            for url, parent_url in message[1]:
+                self.spider._queue_link(url, PageRecord(parent_url) if parent_url else None)
+            self.received += 1
+            self._wake()
+        elif kind == PROBE:
+            self.flush()
+            idle = self.waiting and self.spider.scheduler.is_idle()
+            self.channel.send([STATUS, self.index, message[1], idle, self.sent, self.received])
+        elif kind == STOP:
+            self.spider.stop()
+            self._wake()
+
+    def _on_coordinator_lost(self):
+        logger.error("Lost the coordinator connection , stopping partition {}".format(self.index))
+        self.spider.stop()
+        self._wake()
+
+    @coroutine
+    def finish(self, summary, graph_file_name=CRAWL_GRAPH_FILE):
+        """
+        Sends the crawl graph of the partition to the coordinator , which
+        may run on another machine , followed by the summary of the stats.
+        """
+        self.flusher.stop()
+        lines = []
+        with open(graph_file_name) as graph_file:
+            for line in graph_file:
+                lines.append(line)
+                if len(lines) >= PARTITION_BATCH_SIZE:
+                    yield self.channel.send([GRAPH, lines])
+                    lines = []
+        if lines:
+            yield self.channel.send([GRAPH, lines])
+        yield self.channel.send([DONE, self.index, summary])
+
+
+class Coordinator(object):
+    """
+    Assigns the partitions , routes link batches to their owners and
+    detects termination : it probes the workers and stops the crawl once two
+    consecutive probes find every worker idle with as many batches received
+    as sent and the counts unchanged ( no batch in transit ). The crawl
+    graphs sent by the workers are merged into the report files.
+    """
+
+    def __init__(self, channels, start_url, sitemap_url, fetch_strategy, report_format=REPORT_FORMAT,
+                 report_echo=REPORT_ECHO, link_graph=LINK_GRAPH):
+        self.channels = channels
+        self.start_url = start_url
+        self.sitemap_url = sitemap_url
+        self.fetch_strategy = fetch_strategy
+        self.report_format = report_format
+        self.report_echo = report_echo
+        self.link_graph = link_graph
+        self.started = time.time()
+        self.probe_id = 0
+        self.replies = dict()
+        self.previous_counts = None
+        self.stopping = False
+        self.summaries = dict()
+        self.graph_writer = CrawlGraphWriter()
+        self.prober = PeriodicCallback(self._probe, PARTITION_PROBE_INTERVAL)
+
+    def start(self):
+        for index, channel in enumerate(self.channels):
+            channel.send([ASSIGN, index, len(self.channels), self.start_url, self.sitemap_url])
+            channel.listen(self._on_message, lambda index=index: self._on_close(index))
+        self.prober.start()
+
+    def stop(self):
+        if self.stopping:
+            return
+        self.stopping = True
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+        self.prober.stop()
+        for channel in self.channels:
+            channel.send([STOP])
+
+    def _probe(self):
+        if len(self.replies) < len(self.channels) and self.probe_id:
+            return
+        self.probe_id += 1
+        self.replies = dict()
+        for channel in self.channels:
+            channel.send([PROBE, self.probe_id])
+
+    def _on_message(self, message):
+        kind = message[0]
+        if kind == LINKS:
+            self.channels[message[1]].send([LINKS, message[2]])
+        elif kind == STATUS:
+            _, index, probe_id, idle, sent, received = message
+            if probe_id == self.probe_id:
+                self.replies[index] = (idle, sent, received)
+                if len(self.replies) == len(self.channels):
+                    self._check_termination()
+        elif kind == GRAPH:
+            for line in message[1]:
+                self.graph_writer.write_line(line)
+        elif kind == DONE:
+            self._finished(message[1], message[2])
+
+    def _on_close(self, index):
+        if index not in self.summaries:
+            logger.error("Partition {} disconnected before finishing".format(index))
+            print("Partition {} disconnected before finishing , its pages are missing from the reports".format(index))
+            self.stop()
+            self._finished(index, {'fetch_stats': {}, 'connection_stats': {}, 'visited': 0})
+
+    def _finished(self, index, summary):
+        self.summaries[index] = summary
+        if len(self.summaries) == len(self.channels):
+            self._merge_reports()
+            IOLoop.instance().stop()
+
+    def _check_termination(self):
+        all_idle = all(idle for idle, _, _ in self.replies.values())
+        counts = (sum(sent for _, sent, _ in self.replies.values()),
+                  sum(received for _, _, received in self.replies.values()))
+        if all_idle and counts[0] == counts[1] and counts == self.previous_counts:
+            logger.debug("All partitions idle after {} link batches".format(counts[0]))
+            self.stop()
+        self.previous_counts = counts if all_idle else None
+
+    def merged_stats(self):
+        """
+        (fetch stats , connection stats) summed over the partitions.
+        """
+        fetch_stats = Counter()
+        connection_stats = Counter()
+        for summary in self.summaries.values():
+            fetch_stats.update(summary['fetch_stats'])
+            connection_stats.update(summary['connection_stats'])
+        return fetch_stats, connection_stats
+
+    def _merge_reports(self):
+        self.graph_writer.close()
+        link_graph = None
+        if self.link_graph:
+            # the partitions only see their own pages , the graph is built from the merged crawl graph
+            link_graph = LinkGraph()
+            link_graph.add_crawl_graph(CRAWL_GRAPH_FILE)
+            link_graph.save()
+        write_reports(CrawlGraphPages([CRAWL_GRAPH_FILE]), self.report_format, self.report_echo, link_graph)
+
+        fetch_stats, connection_stats = self.merged_stats()
+        print(format_fetch_stats(self.fetch_strategy, fetch_stats))
+        print(format_connection_stats(connection_stats))
+        if link_graph is not None:
+            print(link_graph.summary())
+        print("Partitions : {}".format(" , ".join(
+            "{} visited {}".format(index, self.summaries[index]['visited']) for index in sorted(self.summaries))))
+        print('Done crawling in %d seconds with %d partitions.' % (time.time() - self.started, len(self.channels)))
+
+
+@coroutine
+def start_worker(channel, spider_factory):
+    """
+    Waits for the partition assignment and starts crawling it from
+    partition-<index> , where its reports and crawl graph are written.
+    """
+    _, index, partition_count, start_url, sitemap_url = yield channel.read()
+    if not os.path.isdir(partition_dir(index)):
+        os.makedirs(partition_dir(index))
+    os.chdir(partition_dir(index))
+    partition = Partition(index, partition_count, channel)
+    spider = spider_factory(start_url, sitemap_url, partition)
+    try:
+        yield spider.initiate_crawl()
+    finally:
+        spider.close()
+
+
+def _run_local_worker(connection, spider_factory):
+    # the coordinator drains the workers on interrupt
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    start_worker(StreamChannel(IOStream(connection)), spider_factory)
+    IOLoop.instance().start()
+
+
+def run_local(partition_count, start_url, sitemap_url, fetch_strategy, spider_factory, report_format=REPORT_FORMAT,
+              report_echo=REPORT_ECHO, link_graph=LINK_GRAPH):
+    """
+    Crawls with partition_count local worker processes , each with its own
+    IOLoop , connected to the coordinator running in this process.
+    """
+    channels = []
+    workers = []
+    # workers are forked before this process creates its IOLoop
+    for _ in range(partition_count):
+        coordinator_end, worker_end = socket.socketpair()
+        worker = multiprocessing.Process(target=_run_local_worker, args=(worker_end, spider_factory))
+        worker.start()
+        worker_end.close()
+        workers.append(worker)
+        channels.append(coordinator_end)
+
+    coordinator = Coordinator([StreamChannel(IOStream(channel)) for channel in channels], start_url, sitemap_url,
+                              fetch_strategy, report_format, report_echo, link_graph)
+    _install_interrupt_handler(coordinator)
+    coordinator.start()
+    IOLoop.instance().start()
+    for worker in workers:
+        worker.join()
+
+
+class _CoordinatorServer(TCPServer):
+    def __init__(self, partition_count, on_ready):
+        super(_CoordinatorServer, self).__init__()
+        self.partition_count = partition_count
+        self.on_ready = on_ready
+        self.channels = []
+
+    def handle_stream(self, stream, address):
+        logger.debug("Worker connected from {}".format(address))
+        self.channels.append(StreamChannel(stream))
+        print("Worker {} of {} connected from {}".format(len(self.channels), self.partition_count, address[0]))
+        if len(self.channels) == self.partition_count:
+            self.stop()
+            self.on_ready(self.channels)
+
+
+def run_coordinator(port, partition_count, start_url, sitemap_url, fetch_strategy, report_format=REPORT_FORMAT,
+                    report_echo=REPORT_ECHO, link_graph=LINK_GRAPH):
+    """
+    Waits for partition_count workers started with --join on other machines
+    and coordinates their crawl.
+    """
+    def start(channels):
+        coordinator = Coordinator(channels, start_url, sitemap_url, fetch_strategy, report_format, report_echo,
+                                  link_graph)
+        _install_interrupt_handler(coordinator)
+        coordinator.start()
+
+    server = _CoordinatorServer(partition_count, start)
+    server.listen(port)
+    IOLoop.instance().start()
+
+
+@coroutine
+def _join_coordinator(host, port, spider_factory):
+    stream = yield TCPClient().connect(host, port)
+    yield start_worker(StreamChannel(stream), spider_factory)
+
+
+def run_remote_worker(address, spider_factory):
+    host, _, port = address.rpartition(':')
+    _join_coordinator(host, int(port), spider_factory)
+    IOLoop.instance().start()
+
+
+def _install_interrupt_handler(coordinator):
+    signal.signal(signal.SIGINT, lambda signum, frame: IOLoop.instance().add_callback_from_signal(coordinator.stop))
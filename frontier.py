@@ -0,0 +1,160 @@
+import hashlib
+import heapq
+import math
+import struct
+from array import array
+from bisect import bisect_left
+
+from config import SEEN_SET_MODE, BLOOM_FILTER_CAPACITY, BLOOM_FILTER_FALSE_POSITIVE_RATE
+
+
+__author__ = 'jayesh'
+
+FINGERPRINT_MERGE_THRESHOLD = 65536
+
+
+def _fingerprint_typecode():
+    # 'q' only exists on python 3 , 'l' is 8 bytes on 64 bit linux and macOS but 4 on windows
+    for typecode in ('q', 'l'):
+        try:
+            if array(typecode).itemsize == 8:
+                return typecode
+        except ValueError:
+            pass
+    return None
+
+
+FINGERPRINT_TYPECODE = _fingerprint_typecode()
+
+
+def url_fingerprint(key):
+    return struct.unpack('<q', hashlib.md5(key).digest()[:8])[0]
+
+
+class FrontierEntry(object):
+    """
+    Discovered link waiting to be fetched, the full page object is only
+    created once the entry is handed out by the scheduler.
+    """
+    __slots__ = ('url', 'key', 'parent')
+
+    def __init__(self, url, key, parent):
+        self.url = url
+        self.key = key
+        self.parent = parent
+
+
+class ExactSeenSet(object):
+    def __init__(self):
+        self.keys = set()
+
+    def add(self, key):
+        """
+        Adds the key, returns False when it had already been seen.
+        """
+        if key in self.keys:
+            return False
+        self.keys.add(key)
+        return True
+
+    def __contains__(self, key):
+        return key in self.keys
+
+    def __len__(self):
+        return len(self.keys)
+
+
+class FingerprintSeenSet(object):
+    """
+    Keeps 64 bit fingerprints of the canonical keys in sorted arrays, 8
+    bytes per url. Recent fingerprints are buffered in a set and written out
+    as a sorted run in batches, a run is merged with the previous one while
+    that one isn't bigger , so there are at most log2(urls / batch) runs and
+    every fingerprint is merged about as many times.
+    """
+
+    def __init__(self, merge_threshold=FINGERPRINT_MERGE_THRESHOLD):
+        if FINGERPRINT_TYPECODE is None:
+            raise ValueError("No 8 byte array type on this platform , use the 'exact' or 'bloom' seen set")
+        # biggest run first
+        self.runs = []
+        self.recent = set()
+        self.merge_threshold = merge_threshold
+
+    def _in_runs(self, fingerprint):
+        for run in self.runs:
+            index = bisect_left(run, fingerprint)
+            if index < len(run) and run[index] == fingerprint:
+                return True
+        return False
+
+    def add(self, key):
+        fingerprint = url_fingerprint(key)
+        if fingerprint in self.recent or self._in_runs(fingerprint):
+            return False
+        self.recent.add(fingerprint)
+        if len(self.recent) >= self.merge_threshold:
+            self._merge()
+        return True
+
+    def _merge(self):
+        run = array(FINGERPRINT_TYPECODE, sorted(self.recent))
+        self.recent = set()
+        while self.runs and len(self.runs[-1]) <= len(run):
+            run = array(FINGERPRINT_TYPECODE, heapq.merge(self.runs.pop(), run))
+        self.runs.append(run)
+
+    def __contains__(self, key):
+        fingerprint = url_fingerprint(key)
+        return fingerprint in self.recent or self._in_runs(fingerprint)
+
+    def __len__(self):
+        return sum(len(run) for run in self.runs) + len(self.recent)
+
+
+class BloomSeenSet(object):
+    """
+    Bloom filter sized for capacity keys at the given false positive rate, a
+    false positive means a page is wrongly treated as already seen.
+    """
+
+    def __init__(self, capacity=BLOOM_FILTER_CAPACITY, false_positive_rate=BLOOM_FILTER_FALSE_POSITIVE_RATE):
+        self.bit_count = int(math.ceil(-capacity * math.log(false_positive_rate) / (math.log(2) ** 2)))
+        self.hash_count = max(1, int(round(self.bit_count / float(capacity) * math.log(2))))
+        self.bits = bytearray((self.bit_count + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key):
+        first, second = struct.unpack('<QQ', hashlib.md5(key).digest())
+        for index in xrange(self.hash_count):
+            yield (first + index * second) % self.bit_count
+
+    def add(self, key):
+        added = False
+        for position in self._positions(key):
+            mask = 1 << (position & 7)
+            if not self.bits[position >> 3] & mask:
+                self.bits[position >> 3] |= mask
+                added = True
+        if added:
+            self.count += 1
+        return added
+
+    def __contains__(self, key):
+        for position in self._positions(key):
+            if not self.bits[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+    def __len__(self):
+        return self.count
+
+
+def create_seen_set(mode=SEEN_SET_MODE):
+    if mode == 'exact':
+        return ExactSeenSet()
+    if mode == 'fingerprint':
+        return FingerprintSeenSet()
+    if mode == 'bloom':
+        return BloomSeenSet()
+    raise ValueError("Unknown seen set mode {}".format(mode))
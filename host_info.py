@@ -0,0 +1,139 @@
+import logging
+from collections import OrderedDict, namedtuple
+
+from tldextract import extract
+
+from config import HOST_CACHE_SIZE, HARD_CODED_LINKS, HARD_CODED_LINK_EXCLUSIONS
+from url_rules import HostRules, SegmentRules, SkipRules, hostname_of
+
+
+__author__ = 'jayesh'
+
+logger = logging.getLogger(__name__)
+
+HostRecord = namedtuple('HostRecord', ['netloc', 'host', 'subdomain', 'domain', 'suffix', 'registered_domain',
+                                       'domain_with_subdomain', 'internal', 'skip_denied', 'skip_allowed',
+                                       'hardcoded'])
+
+
+class LRUCache(object):
+    def __init__(self, max_size=HOST_CACHE_SIZE):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        try:
+            value = self.entries.pop(key)
+        except KeyError:
+            self.misses += 1
+            return None
+        self.entries[key] = value
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        self.entries[key] = value
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {'size': len(self.entries), 'hits': self.hits, 'misses': self.misses,
+                'hit_rate': float(self.hits) / lookups if lookups else 0.0}
+
+
+_tld_cache = LRUCache()
+_classifiers = dict()
+
+
+def netloc_of(url):
+    """
+    Lower cased network location of url, cheaper than a full urlsplit.
+    """
+    _, separator, rest = url.partition('://')
+    if not separator:
+        rest = url[2:] if url.startswith('//') else url
+    end = len(rest)
+    for delimiter in '/?#':
+        index = rest.find(delimiter)
+        if index != -1 and index < end:
+            end = index
+    return rest[:end].lower()
+
+
+def tld_extract(url):
+    netloc = netloc_of(url)
+    extracted = _tld_cache.get(netloc)
+    if extracted is None:
+        extracted = extract(netloc)
+        _tld_cache.put(netloc, extracted)
+    return extracted
+
+
+def registered_domain_of(extracted):
+    domain = u'{}.{}'.format(extracted.domain, extracted.suffix)
+    return domain[:-1] if domain.endswith('.') else domain
+
+
+def domain_with_subdomain_of(extracted):
+    if not extracted.subdomain:
+        return u"{}.{}".format(extracted.domain, extracted.suffix)
+    return u"{}.{}.{}".format(extracted.subdomain, extracted.domain, extracted.suffix)
+
+
+class HostClassifier(object):
+    """
+    Per crawl classification of hosts ( internal , skipped , hardcoded ) kept
+    in a bounded LRU keyed by network location, so the public suffix lookup
+    and the host rule checks run once per host instead of once per link.
+    """
+
+    def __init__(self, base_domain, domains_to_skip, max_size=HOST_CACHE_SIZE):
+        self.base_domain = base_domain
+        self.skip_rules = SkipRules(domains_to_skip)
+        self.hardcoded_hosts = HostRules(HARD_CODED_LINKS)
+        self.hardcoded_exclusions = SegmentRules(HARD_CODED_LINK_EXCLUSIONS)
+        self.cache = LRUCache(max_size)
+
+    def classify(self, url):
+        netloc = netloc_of(url)
+        record = self.cache.get(netloc)
+        if record is None:
+            record = self._build_record(netloc)
+            self.cache.put(netloc, record)
+        return record
+
+    def is_skipped(self, url, check_segments=True):
+        record = self.classify(url)
+        return self.skip_rules.is_skipped(url, record.skip_denied, record.skip_allowed, check_segments)
+
+    def is_hardcoded(self, url):
+        return self.classify(url).hardcoded and not self.hardcoded_exclusions.matches(url)
+
+    def _build_record(self, netloc):
+        host = hostname_of(netloc)
+        extracted = tld_extract(netloc)
+        registered_domain = registered_domain_of(extracted)
+        return HostRecord(netloc, host, extracted.subdomain, extracted.domain, extracted.suffix, registered_domain,
+                          domain_with_subdomain_of(extracted),
+                          internal=self.base_domain in registered_domain,
+                          skip_denied=self.skip_rules.skipped_hosts.matches(host),
+                          skip_allowed=self.skip_rules.allowed_hosts.matches(host),
+                          hardcoded=self.hardcoded_hosts.matches(host))
+
+
+def get_host_classifier(base_domain, domains_to_skip):
+    key = (base_domain, tuple(domains_to_skip))
+    classifier = _classifiers.get(key)
+    if classifier is None:
+        classifier = _classifiers[key] = HostClassifier(base_domain, domains_to_skip)
+    return classifier
+
+
+def host_cache_stats():
+    stats = {'tld': _tld_cache.stats()}
+    for (base_domain, _), classifier in _classifiers.items():
+        stats[base_domain] = classifier.cache.stats()
+    return stats
@@ -0,0 +1,183 @@
+import logging
+import urlparse
+from collections import deque
+
+from tornado.concurrent import Future
+from tornado.ioloop import IOLoop
+
+from config import MAX_CONCURRENT_REQUESTS_PER_SERVER, MAX_CONCURRENT_REQUESTS_PER_HOST, \
+    MIN_REQUEST_INTERVAL_PER_HOST, BACKOFF_STATUS_CODES, INITIAL_BACKOFF_SECONDS, MAX_BACKOFF_SECONDS
+
+
+__author__ = 'jayesh'
+
+logger = logging.getLogger(__name__)
+
+
+def _host_of(page):
+    return urlparse.urlsplit(page.url).netloc.lower()
+
+
+class _HostState(object):
+    def __init__(self, name):
+        self.name = name
+        self.pending = deque()
+        self.active = 0
+        self.next_allowed = 0.0
+        self.backoff = 0.0
+        self.dispatched = 0
+
+
+class HostScheduler(object):
+    """
+    Frontier with one FIFO queue per host. Pages are handed out round-robin
+    across the hosts that are ready, i.e. below their concurrency limit and
+    outside of any rate-limit interval or 429/503 backoff window.
+
+    Every queued page counts as unfinished until task_done, join resolves
+    once nothing is queued or in flight. After close no more pages are
+    handed out ( get returns None ) and join only waits for the pages in
+    flight.
+    """
+
+    def __init__(self, max_concurrent=MAX_CONCURRENT_REQUESTS_PER_SERVER,
+                 max_per_host=MAX_CONCURRENT_REQUESTS_PER_HOST, min_interval=MIN_REQUEST_INTERVAL_PER_HOST,
+                 io_loop=None):
+        self.max_concurrent = max_concurrent
+        self.max_per_host = max_per_host
+        self.min_interval = min_interval
+        self.io_loop = io_loop or IOLoop.current()
+        self.hosts = dict()
+        self.ready_ring = deque()
+        self.getters = deque()
+        self.join_futures = []
+        self.in_flight = 0
+        self.unfinished = 0
+        self.closed = False
+        self._wakeup_handle = None
+        self._wakeup_deadline = None
+
+    def qsize(self):
+        return self.unfinished - self.in_flight
+
+    def put(self, page):
+        host = self._host_state(_host_of(page))
+        if not host.pending:
+            self.ready_ring.append(host)
+        host.pending.append(page)
+        self.unfinished += 1
+        self._dispatch()
+
+    def get(self):
+        future = Future()
+        if self.closed:
+            future.set_result(None)
+            return future
+        self.getters.append(future)
+        self._dispatch()
+        return future
+
+    def close(self):
+        self.closed = True
+        getters, self.getters = self.getters, deque()
+        for future in getters:
+            future.set_result(None)
+        self._notify_join()
+
+    def is_idle(self):
+        return self.in_flight == 0 if self.closed else self.unfinished == 0
+
+    def task_done(self, page, retry_after=None, requeue=False):
+        host = self._host_state(_host_of(page))
+        host.active -= 1
+        self.in_flight -= 1
+        self._apply_backoff(host, page.response_code, retry_after)
+        if requeue:
+            if not host.pending:
+                self.ready_ring.append(host)
+            host.pending.append(page)
+        else:
+            self.unfinished -= 1
+
+        self._notify_join()
+        self._dispatch()
+
+    def join(self):
+        future = Future()
+        if self.is_idle():
+            future.set_result(None)
+        else:
+            self.join_futures.append(future)
+        return future
+
+    def _notify_join(self):
+        if self.is_idle():
+            join_futures, self.join_futures = self.join_futures, []
+            for future in join_futures:
+                future.set_result(None)
+
+    def _host_state(self, name):
+        host = self.hosts.get(name)
+        if host is None:
+            host = self.hosts[name] = _HostState(name)
+        return host
+
+    def _apply_backoff(self, host, response_code, retry_after):
+        now = self.io_loop.time()
+        if response_code in BACKOFF_STATUS_CODES:
+            if retry_after is not None:
+                delay = min(retry_after, MAX_BACKOFF_SECONDS)
+            else:
+                delay = min(max(host.backoff * 2, INITIAL_BACKOFF_SECONDS), MAX_BACKOFF_SECONDS)
+            host.backoff = delay
+            host.next_allowed = max(host.next_allowed, now + delay)
+            logger.debug(u"Backing off {} for {} seconds after response code {}"
+                         .format(host.name, delay, response_code))
+        elif response_code > 0:
+            host.backoff = 0.0
+
+    def _dispatch(self):
+        while self.getters and self.in_flight < self.max_concurrent:
+            host = self._next_ready_host()
+            if host is None:
+                break
+            page = host.pending.popleft()
+            host.active += 1
+            host.dispatched += 1
+            host.next_allowed = max(host.next_allowed, self.io_loop.time() + self.min_interval)
+            self.in_flight += 1
+            self.getters.popleft().set_result(page)
+
+        if self.getters and self.in_flight < self.max_concurrent:
+            self._schedule_wakeup()
+
+    def _next_ready_host(self):
+        now = self.io_loop.time()
+        for _ in range(len(self.ready_ring)):
+            host = self.ready_ring.popleft()
+            if not host.pending:
+                continue
+            if host.active < self.max_per_host and host.next_allowed <= now:
+                if len(host.pending) > 1:
+                    self.ready_ring.append(host)
+                return host
+            self.ready_ring.append(host)
+        return None
+
+    def _schedule_wakeup(self):
+        waiting = [host.next_allowed for host in self.ready_ring
+                   if host.pending and host.active < self.max_per_host]
+        if not waiting:
+            return
+        deadline = min(waiting)
+        if self._wakeup_handle is not None:
+            if self._wakeup_deadline <= deadline:
+                return
+            self.io_loop.remove_timeout(self._wakeup_handle)
+        self._wakeup_deadline = deadline
+        self._wakeup_handle = self.io_loop.call_at(deadline, self._on_wakeup)
+
+    def _on_wakeup(self):
+        self._wakeup_handle = None
+        self._wakeup_deadline = None
+        self._dispatch()
@@ -0,0 +1,122 @@
+import logging
+from collections import Counter
+
+import pycurl
+from tornado.curl_httpclient import CurlAsyncHTTPClient
+
+from config import MAX_CONCURRENT_REQUESTS_PER_SERVER, MAX_CONCURRENT_REQUESTS_PER_HOST, DNS_CACHE_TIMEOUT, \
+    USE_HTTP2
+
+
+__author__ = 'jayesh'
+
+logger = logging.getLogger(__name__)
+
+# empty value makes curl advertise every encoding it was built with ( gzip, deflate, br, zstd )
+ACCEPT_ALL_ENCODINGS = ''
+# HTTP/2 support needs a newer pycurl than the pinned one , missing constants fall back to HTTP/1.1
+VERSION_HTTP2 = getattr(pycurl, 'VERSION_HTTP2', None)
+PIPE_MULTIPLEX = getattr(pycurl, 'PIPE_MULTIPLEX', None)
+CURL_HTTP_VERSION_2TLS = getattr(pycurl, 'CURL_HTTP_VERSION_2TLS', None)
+CURL_HTTP_VERSION_2_0 = getattr(pycurl, 'CURL_HTTP_VERSION_2_0', None)
+PIPEWAIT = getattr(pycurl, 'PIPEWAIT', None)
+INFO_HTTP_VERSION = getattr(pycurl, 'INFO_HTTP_VERSION', None)
+
+
+def http2_supported():
+    if None in (VERSION_HTTP2, PIPE_MULTIPLEX, CURL_HTTP_VERSION_2TLS, PIPEWAIT):
+        return False
+    return bool(pycurl.version_info()[4] & VERSION_HTTP2)
+
+
+class CrawlerHTTPClient(CurlAsyncHTTPClient):
+    """
+    Curl client shared by all the pages of a spider. The handles share the
+    DNS and TLS session caches, connections are kept alive and reused per
+    host, and connection reuse / handshake times are counted in stats.
+    The timings of every request go to metrics ( a CrawlMetrics ) when set.
+    """
+
+    def initialize(self, io_loop, max_clients=MAX_CONCURRENT_REQUESTS_PER_SERVER, defaults=None,
+                   max_host_connections=MAX_CONCURRENT_REQUESTS_PER_HOST, use_http2=USE_HTTP2):
+        super(CrawlerHTTPClient, self).initialize(io_loop, max_clients=max_clients, defaults=defaults)
+        self.stats = Counter()
+        self.metrics = None
+        self.use_http2 = use_http2 and http2_supported()
+        if use_http2 and not self.use_http2:
+            logger.debug("HTTP/2 requested but curl / pycurl were built without it , using HTTP/1.1")
+
+        self._multi.setopt(pycurl.M_MAX_HOST_CONNECTIONS, max_host_connections)
+        if self.use_http2:
+            self._multi.setopt(pycurl.M_PIPELINING, PIPE_MULTIPLEX)
+
+        self._share = pycurl.CurlShare()
+        self._share.setopt(pycurl.SH_SHARE, pycurl.LOCK_DATA_DNS)
+        self._share.setopt(pycurl.SH_SHARE, pycurl.LOCK_DATA_SSL_SESSION)
+        for curl in self._curls:
+            # options left alone by tornado's per request setup , so they are set once per handle
+            curl.setopt(pycurl.SHARE, self._share)
+            curl.setopt(pycurl.DNS_CACHE_TIMEOUT, DNS_CACHE_TIMEOUT)
+            curl.setopt(pycurl.TCP_KEEPALIVE, 1)
+            if self.use_http2:
+                curl.setopt(pycurl.HTTP_VERSION, CURL_HTTP_VERSION_2TLS)
+                curl.setopt(PIPEWAIT, 1)
+
+    def fetch_impl(self, request, callback):
+        page_callback = request.prepare_curl_callback
+
+        def prepare_curl(curl):
+            # tornado sets the encoding for every request , this runs after it
+            curl.setopt(pycurl.ENCODING, ACCEPT_ALL_ENCODINGS)
+            if page_callback is not None:
+                page_callback(curl)
+
+        request.prepare_curl_callback = prepare_curl
+        super(CrawlerHTTPClient, self).fetch_impl(request, callback)
+
+    def _finish(self, curl, curl_error=None, curl_message=None):
+        try:
+            self._record_connection_stats(curl)
+        except pycurl.error as ex:
+            logger.debug("Could not read connection info : {}".format(ex))
+        super(CrawlerHTTPClient, self)._finish(curl, curl_error, curl_message)
+
+    def _record_connection_stats(self, curl):
+        self.stats['requests'] += 1
+        new_connections = curl.getinfo(pycurl.NUM_CONNECTS)
+        connect_time = curl.getinfo(pycurl.CONNECT_TIME)
+        handshake_done = curl.getinfo(pycurl.APPCONNECT_TIME)
+        if self.metrics is not None:
+            self.metrics.record_transfer(curl.info['request'].method, new_connections,
+                                         curl.getinfo(pycurl.NAMELOOKUP_TIME), connect_time, handshake_done,
+                                         curl.getinfo(pycurl.STARTTRANSFER_TIME), curl.getinfo(pycurl.TOTAL_TIME),
+                                         int(curl.getinfo(pycurl.SIZE_DOWNLOAD)))
+        if new_connections:
+            self.stats['new_connections'] += new_connections
+            self.stats['connect_time'] += connect_time
+            if handshake_done > 0:
+                self.stats['tls_handshakes'] += 1
+                self.stats['tls_handshake_time'] += handshake_done - connect_time
+        else:
+            self.stats['reused_connections'] += 1
+        if INFO_HTTP_VERSION is not None and curl.getinfo(INFO_HTTP_VERSION) == CURL_HTTP_VERSION_2_0:
+            self.stats['http2_responses'] += 1
+
+    def close(self):
+        super(CrawlerHTTPClient, self).close()
+        self._share.close()
+
+
+def create_http_client(max_clients=MAX_CONCURRENT_REQUESTS_PER_SERVER):
+    return CrawlerHTTPClient(force_instance=True, max_clients=max_clients)
+
+
+def format_connection_stats(stats):
+    new_connections = stats['new_connections']
+    handshakes = stats['tls_handshakes']
+    return ("Connections : {} requests , {} new connections , {} reused , avg connect {:.1f} ms , "
+            "TLS handshakes {} avg {:.1f} ms , HTTP/2 responses {}\n".format(
+                stats['requests'], new_connections, stats['reused_connections'],
+                1000.0 * stats['connect_time'] / new_connections if new_connections else 0.0,
+                handshakes, 1000.0 * stats['tls_handshake_time'] / handshakes if handshakes else 0.0,
+                stats['http2_responses']))
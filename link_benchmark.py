@@ -0,0 +1,231 @@
+import argparse
+import gc
+import json
+import logging
+import os
+import platform
+import sys
+import timeit
+import urlparse
+
+from config import DOMAINS_TO_BE_SKIPPED, LINK_BENCHMARK_MAX_SLOWDOWN, LINK_BENCHMARK_REPEAT, LINK_BENCHMARK_OPS
+from tornado_client_page import TornadoClientPage
+from util import extract_base_site, extract_domain, obtain_domain_with_subdomain_for_page
+
+__author__ = 'jayesh'
+
+logger = logging.getLogger(__name__)
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'link_benchmark_baseline.json')
+PAGE_URL = u'http://www.appdynamics.com/products/application-monitoring/index.html'
+
+# hrefs as found on real pages , the corpus must stay fixed for the results to be comparable across runs
+HREF_CORPUS = [
+    # relative
+    u'pricing', u'./pricing/', u'../about/team.html', u'../../careers/', u'/', u'/solutions/java/',
+    u'/blog/2014/06/apm-for-the-rest-of-us/', u'/resources/whitepapers?type=pdf&page=2',
+    u'/search?q=application+performance&utm_source=newsletter&utm_medium=email', u'/Products/Java/%7Eagent',
+    u'  /support/docs/ \n', u'?page=3', u'index.html?lang=en#pricing',
+    # absolute
+    u'http://www.appdynamics.com/', u'https://www.appdynamics.com/free-trial/', u'HTTP://WWW.AppDynamics.COM/About',
+    u'http://www.appdynamics.com:80/partners/', u'https://docs.appdynamics.com/display/PRO39/Getting+Started',
+    u'http://community.appdynamics.com/t5/forums/ct-p/forums', u'http://info.appdynamics.com/webinar.html',
+    u'https://www.linkedin.com/company/appdynamics', u'http://twitter.com/AppDynamics',
+    u'http://www.youtube.com/watch?v=dQw4w9WgXcQ&feature=youtu.be', u'ftp://ftp.example.com/pub/file.tar.gz',
+    u'http://www.example.co.uk/path/to/page.php?id=42&session=abc123',
+    # protocol relative
+    u'//www.appdynamics.com/lp/demo/', u'//cdn.appdynamics.com/assets/js/main.min.js',
+    u'//fonts.googleapis.com/css?family=Open+Sans:400,700',
+    # fragments
+    u'#', u'#top', u'#!/dashboard', u'/#/route/overview', u'/features/#analytics',
+    # mailto / javascript / other schemes
+    u'mailto:sales@appdynamics.com', u'mailto:info@appdynamics.com?subject=Hello%20there',
+    u'javascript:void(0)', u'javascript:void(0);', u'JavaScript:window.print()', u'javascript:alert("hi")',
+    u'tel:+1-415-442-8400', u'data:image/gif;base64,R0lGODlhAQABAAAAACw=',
+    # IDN and non ascii
+    u'http://b\xfccher.example.de/katalog/', u'http://xn--bcher-kva.example.de/katalog/',
+    u'//m\xfcnchen.example.de/stadtplan', u'/produkte/\xfcbersicht.html', u'/\u65e5\u672c\u8a9e/\u30da\u30fc\u30b8',
+    u'http://\u4f8b\u3048.\u30c6\u30b9\u30c8/', u'/caf%C3%A9/men%c3%bc',
+]
+
+
+def _create_page(url, parent=None):
+    return TornadoClientPage(url, parent, extract_base_site(PAGE_URL), extract_domain(PAGE_URL),
+                             DOMAINS_TO_BE_SKIPPED)
+
+
+def create_benchmarks():
+    """
+    (name , function , arguments) of the per link code paths , the function
+    is called once per argument. Links are resolved up front so only the
+    benchmarked call is timed.
+    """
+    page = _create_page(PAGE_URL)
+    links = [link for link in (page._format_link(href) for href in HREF_CORPUS) if link]
+    link_pages = [_create_page(link, page) for link in links]
+    # equal pages built separately , as a link found again on another page
+    same_pages = [(link_page, _create_page(link_page.url, page)) for link_page in link_pages]
+    seen = set(link_pages)
+
+    def process_hardcoded_url(link):
+        page._process_hardcoded_url(link)
+        page.hardcoded_urls.clear()
+
+    return [
+        ('TornadoClientPage._format_link', page._format_link, HREF_CORPUS),
+        ('WebPage.__hash__', hash, link_pages),
+        ('WebPage.__eq__', lambda pair: pair[0] == pair[1], same_pages),
+        ('WebPage in set', seen.__contains__, [other for _, other in same_pages]),
+        ('WebPage.skip_page', TornadoClientPage.skip_page, link_pages),
+        ('WebPage._process_hardcoded_url', process_hardcoded_url, links),
+        ('WebPage.is_page_internal', page.is_page_internal, links),
+        ('util.extract_base_site', extract_base_site, links),
+        ('util.extract_domain', extract_domain, links),
+        ('util.obtain_domain_with_subdomain_for_page', obtain_domain_with_subdomain_for_page, links),
+    ]
+
+
+def _time_pass(function, arguments, loops):
+    started = timeit.default_timer()
+    for _ in xrange(loops):
+        for argument in arguments:
+            function(argument)
+    return timeit.default_timer() - started
+
+
+def _count_tracked_objects(function, arguments):
+    """
+    Objects tracked by the garbage collector ( lists , dicts , sets , class
+    instances .. but not strings or numbers ) still allocated after one call
+    per argument , the results are kept alive so what they hold counts along
+    with whatever the call caches. The collector's allocation count goes
+    down as tracked objects are freed , so temporaries don't count , python
+    2.7 has no counter of every allocation.
+    """
+    results = []
+    # urlsplit caches its results and drops the cache once full , start from the same state every time
+    urlparse.clear_cache()
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        before = gc.get_count()[0]
+        for argument in arguments:
+            results.append(function(argument))
+        return (gc.get_count()[0] - before) / float(len(arguments))
+    finally:
+        if gc_enabled:
+            gc.enable()
+
+
+def run_benchmark(name, function, arguments, operations=LINK_BENCHMARK_OPS, repeat=LINK_BENCHMARK_REPEAT):
+    """
+    Best of repeat timings of about operations calls , as timeit does the
+    garbage collector is off while timing. The first pass warms the caches
+    the crawl keeps warm too ( hosts , public suffixes ).
+    """
+    loops = max(operations // len(arguments), 1)
+    _time_pass(function, arguments, 1)
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        best = min(_time_pass(function, arguments, loops) for _ in xrange(repeat))
+    finally:
+        if gc_enabled:
+            gc.enable()
+    return dict(name=name, ns_per_op=round(best * 1e9 / (loops * len(arguments)), 1),
+                tracked_objects_per_op=round(_count_tracked_objects(function, arguments), 2))
+
+
+def run_benchmarks(selected=None, operations=LINK_BENCHMARK_OPS, repeat=LINK_BENCHMARK_REPEAT):
+    results = []
+    for name, function, arguments in create_benchmarks():
+        if selected and not any(part in name for part in selected):
+            continue
+        results.append(run_benchmark(name, function, arguments, operations, repeat))
+        logger.debug("{name} : {ns_per_op} ns/op".format(**results[-1]))
+    return dict(python=platform.python_version(), machine=platform.machine(), processor=platform.processor(),
+                corpus_size=len(HREF_CORPUS), results=results)
+
+
+def compare_with_baseline(baseline, current, max_slowdown=LINK_BENCHMARK_MAX_SLOWDOWN):
+    """
+    Yields (name , baseline ns/op , ns/op , baseline tracked objects , tracked
+    objects , regressed) for the benchmarks of current found in the baseline.
+    More tracked objects kept than the baseline are a regression whatever
+    max_slowdown is.
+    """
+    baseline_results = dict((result['name'], result) for result in baseline['results'])
+    for result in current['results']:
+        old = baseline_results.get(result['name'])
+        if old is None:
+            continue
+        regressed = result['ns_per_op'] > old['ns_per_op'] * (1 + max_slowdown)
+        # baselines stored before the tracked objects were counted have none
+        old_objects = old.get('tracked_objects_per_op')
+        if old_objects is not None:
+            regressed = regressed or result['tracked_objects_per_op'] > old_objects
+        yield result['name'], old['ns_per_op'], result['ns_per_op'], old_objects, \
+            result['tracked_objects_per_op'], regressed
+
+
+def _format_objects(objects):
+    return '-' if objects is None else '{:.2f}'.format(objects)
+
+
+def process_parameters():
+    parser = argparse.ArgumentParser(description='Microbenchmarks of the per link code paths')
+    parser.add_argument("benchmarks", nargs='*', help="only the benchmarks whose name contains one of these")
+    parser.add_argument("--baseline", default=BASELINE_FILE, help="stored results to compare with")
+    parser.add_argument("--save-baseline", dest="save_baseline", action="store_true",
+                        help="store the results as the new baseline instead of comparing")
+    parser.add_argument("--max-slowdown", dest="max_slowdown", type=float, default=LINK_BENCHMARK_MAX_SLOWDOWN,
+                        help="relative slowdown against the baseline that fails the run")
+    parser.add_argument("--ops", type=int, default=LINK_BENCHMARK_OPS, help="calls per timing")
+    parser.add_argument("--repeat", type=int, default=LINK_BENCHMARK_REPEAT, help="timings to take the best of")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = process_parameters()
+    current = run_benchmarks(args.benchmarks, args.ops, args.repeat)
+    if args.json:
+        print(json.dumps(current, indent=2, sort_keys=True))
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as baseline_file:
+            json.dump(current, baseline_file, indent=2, sort_keys=True, separators=(',', ': '))
+            baseline_file.write('\n')
+        print("Baseline of {} benchmarks stored in {}".format(len(current['results']), args.baseline))
+        sys.exit(0)
+
+    baseline = None
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+        if (baseline['python'], baseline['machine']) != (current['python'], current['machine']):
+            print("Baseline taken with python {} on {} , timings may not be comparable".format(
+                baseline['python'], baseline['machine']))
+
+    if not args.json:
+        print("{:<45}{:>12}{:>12}".format('benchmark', 'ns/op', 'objects/op'))
+        for result in current['results']:
+            print("{:<45}{:>12.1f}{:>12}".format(result['name'], result['ns_per_op'],
+                                                 _format_objects(result['tracked_objects_per_op'])))
+    if baseline is None:
+        print("No baseline in {} , store one with --save-baseline".format(args.baseline))
+        sys.exit(0)
+
+    regressions = []
+    print("\nAgainst the baseline ( at most {:.0%} slower ) :".format(args.max_slowdown))
+    for name, old_ns, new_ns, old_objects, new_objects, regressed in \
+            compare_with_baseline(baseline, current, args.max_slowdown):
+        print("{:<45}{:>10.1f} -> {:<10.1f}{:>+7.1%}  objects {} -> {}{}".format(
+            name, old_ns, new_ns, new_ns / old_ns - 1, _format_objects(old_objects),
+            _format_objects(new_objects), '  REGRESSION' if regressed else ''))
+        if regressed:
+            regressions.append(name)
+    if regressions:
+        print("\nREGRESSION in {} of {} benchmarks : {}".format(len(regressions), len(current['results']),
+                                                              ' , '.join(regressions)))
+        sys.exit(1)
@@ -1,37 +1,227 @@
+import argparse
+import heapq
+import json
+import logging
+import os
+import shutil
 import sys
+import tempfile
+from collections import namedtuple
+from itertools import groupby
+
+from config import LINK_DIFF_MEMORY_LIMIT, LINK_DIFF_SORT_CHUNK
+from url_canonicalizer import canonicalize_url
+
+
+__author__ = 'jayesh'
+
+logger = logging.getLogger(__name__)
+
+ADDED = 'added'
+REMOVED = 'removed'
+STATUS_CHANGED = 'changed'
+
+# never part of a url line , separates the fields of the sorted run files
+FIELD_SEPARATOR = '\0'
+
+_SEEN = object()
+
+DiffEntry = namedtuple('DiffEntry', 'change key old_url new_url old_status new_status')
+
+
+def read_url_records(file_name, canonical=False):
+    """
+    Yields (key, url, status) for every url of a url list ( one url per line,
+    status None ) or of a crawl_graph.jsonl ( status is the response code ).
+    The key is the canonical url when asked for , the url itself otherwise.
+    """
+    with open(file_name) as input_file:
+        is_graph = None
+        for line in input_file:
+            line = line.strip()
+            if not line:
+                continue
+            if is_graph is None:
+                is_graph = line.startswith('{')
+            if is_graph:
+                data = json.loads(line)
+                url, status = data['url'].encode('utf8'), data.get('code')
+            else:
+                url, status = line, None
+            yield canonicalize_url(url) if canonical else url, url, status
+
+
+def _compare(key, old, new):
+    """
+    old / new are the (url, status) of the key in each file , None when missing.
+    """
+    if new is None:
+        return DiffEntry(REMOVED, key, old[0], None, old[1], None)
+    if old is None:
+        return DiffEntry(ADDED, key, None, new[0], None, new[1])
+    if old[1] is not None and new[1] is not None and old[1] != new[1]:
+        return DiffEntry(STATUS_CHANGED, key, old[0], new[0], old[1], new[1])
+    return None
+
+
+def diff_in_memory(old_records, new_records, hash_old=True):
+    """
+    Keeps the urls of one file in a dict and streams the other one through it,
+    both directions come out of a single pass over each file. Entries found
+    while streaming come out first , the keys left in the dict at the end.
+    """
+    hashed_records, streamed_records = (old_records, new_records) if hash_old else (new_records, old_records)
+    hashed = dict()
+    for key, url, status in hashed_records:
+        hashed.setdefault(key, (url, status))
+
+    for key, url, status in streamed_records:
+        other = hashed.get(key)
+        if other is _SEEN:
+            continue
+        # streamed keys are marked so their duplicates are skipped , only the unmatched ones add to the dict
+        hashed[key] = _SEEN
+        entry = _compare(key, other, (url, status)) if hash_old else _compare(key, (url, status), other)
+        if entry is not None:
+            yield entry
+
+    for key in sorted(key for key, value in hashed.iteritems() if value is not _SEEN):
+        yield _compare(key, hashed[key], None) if hash_old else _compare(key, None, hashed[key])
+
+
+def _sorted_runs(records, work_dir, chunk_size):
+    runs = []
+    chunk = []
+
+    def write_run():
+        chunk.sort()
+        run_file = os.path.join(work_dir, 'run-{}'.format(len(runs)))
+        with open(run_file, 'w') as output_file:
+            for key, url, status in chunk:
+                output_file.write(FIELD_SEPARATOR.join((key, url, '' if status is None else str(status))) + '\n')
+        runs.append(run_file)
+        del chunk[:]
+
+    for record in records:
+        chunk.append(record)
+        if len(chunk) >= chunk_size:
+            write_run()
+    if chunk or not runs:
+        write_run()
+    return runs
+
+
+def _read_run(run_file):
+    with open(run_file) as input_file:
+        for line in input_file:
+            key, url, status = line.rstrip('\n').split(FIELD_SEPARATOR)
+            yield key, url, int(status) if status else None
+
+
+def external_sort(records, work_dir, chunk_size=LINK_DIFF_SORT_CHUNK):
+    """
+    Sorts records by key with bounded memory : chunks of chunk_size records
+    are sorted into run files which are then merged. Only the first record
+    of a key is kept.
+    """
+    merged = heapq.merge(*[_read_run(run_file) for run_file in _sorted_runs(records, work_dir, chunk_size)])
+    for key, group in groupby(merged, key=lambda record: record[0]):
+        yield next(group)
+
+
+def diff_sorted(old_records, new_records, chunk_size=LINK_DIFF_SORT_CHUNK):
+    """
+    Sort-merge diff for inputs that don't fit in memory , both files are
+    externally sorted by key and walked side by side.
+    """
+    work_dir = tempfile.mkdtemp(prefix='link_diff')
+    try:
+        for name in ('old', 'new'):
+            os.mkdir(os.path.join(work_dir, name))
+        old_sorted = external_sort(old_records, os.path.join(work_dir, 'old'), chunk_size)
+        new_sorted = external_sort(new_records, os.path.join(work_dir, 'new'), chunk_size)
+        old, new = next(old_sorted, None), next(new_sorted, None)
+        while old is not None or new is not None:
+            if new is None or (old is not None and old[0] < new[0]):
+                entry = _compare(old[0], old[1:], None)
+                old = next(old_sorted, None)
+            elif old is None or new[0] < old[0]:
+                entry = _compare(new[0], None, new[1:])
+                new = next(new_sorted, None)
+            else:
+                entry = _compare(old[0], old[1:], new[1:])
+                old, new = next(old_sorted, None), next(new_sorted, None)
+            if entry is not None:
+                yield entry
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def diff_files(old_file, new_file, canonical=False, sort_merge=None, memory_limit=LINK_DIFF_MEMORY_LIMIT):
+    """
+    Yields a DiffEntry for every url added , removed or whose status changed
+    between two crawl outputs. The smaller file is hashed in memory unless it
+    is bigger than memory_limit bytes ( or sort_merge is asked for ) , then
+    both are sort-merged on disk.
+    """
+    old_records = read_url_records(old_file, canonical)
+    new_records = read_url_records(new_file, canonical)
+    old_size, new_size = os.path.getsize(old_file), os.path.getsize(new_file)
+    if sort_merge is None:
+        sort_merge = min(old_size, new_size) > memory_limit
+    if sort_merge:
+        logger.debug("Sort-merge diff of {} and {}".format(old_file, new_file))
+        return diff_sorted(old_records, new_records)
+    return diff_in_memory(old_records, new_records, hash_old=old_size <= new_size)
 
 
 def find_dff_between_files(file_name1, file_name2):
+    """
+    Urls of file_name1 found / not found in file_name2.
+    """
+    urls = set(url for _, url, _ in read_url_records(file_name2))
     matching_url = set()
     unmatched_url = set()
+    for _, url, _ in read_url_records(file_name1):
+        (matching_url if url in urls else unmatched_url).add(url)
+    return matching_url, unmatched_url
 
-    with open(file_name1, "r") as file1:
-        for line1 in file1:
-            match_found = False
-            with open(file_name2, "r") as file2:
-                for line2 in file2:
-                    if line1 == line2:
-                        matching_url.add(line1)
-                        match_found = True
-                        break
-                if match_found:
-                    continue
-                else:
-                    unmatched_url.add(line1)
 
-    return matching_url, unmatched_url
+def _format_entry(entry):
+    if entry.change == REMOVED:
+        return entry.old_url
+    if entry.change == ADDED:
+        return entry.new_url
+    url = entry.new_url if entry.old_url == entry.new_url else '{} -> {}'.format(entry.old_url, entry.new_url)
+    return '{}\t{} -> {}'.format(url, entry.old_status, entry.new_status)
+
+
+def process_parameters():
+    parser = argparse.ArgumentParser(description='Urls added , removed or changed between two crawl outputs')
+    parser.add_argument("old_file", help="url list ( all_internal_pages.txt .. ) or crawl_graph.jsonl of a run")
+    parser.add_argument("new_file", help="the same file of the run to compare with")
+    parser.add_argument("--canonical", action="store_true",
+                        help="compare canonical urls , as the crawler dedups them")
+    parser.add_argument("--json", action="store_true", help="one JSON object per difference")
+    parser.add_argument("--sort-merge", dest="sort_merge", action="store_true", default=None,
+                        help="sort-merge on disk whatever the file sizes")
+    return parser.parse_args()
 
 
 if __name__ == "__main__":
-    file_name1 = sys.argv[1]
-    file_name2 = sys.argv[2]
-
-    matching_url, unmatched_url = find_dff_between_files(file_name1, file_name2)
-    print("unmatched urls between {} and {} ".format(file_name1, file_name2))
-    for url in unmatched_url:
-        print(url)
-
-    matching_url, unmatched_url = find_dff_between_files(file_name2, file_name1)
-    print("unmatched urls between {} and {} ".format(file_name2, file_name1))
-    for url in unmatched_url:
-        print(url)
+    args = process_parameters()
+    entries = diff_files(args.old_file, args.new_file, canonical=args.canonical, sort_merge=args.sort_merge)
+    if args.json:
+        for entry in entries:
+            sys.stdout.write(json.dumps(dict((field, value) for field, value in entry._asdict().items()
+                                             if value is not None)) + '\n')
+    else:
+        changes = dict((change, []) for change in (REMOVED, ADDED, STATUS_CHANGED))
+        for entry in entries:
+            changes[entry.change].append(_format_entry(entry))
+        for change, title in ((REMOVED, "urls only in {}".format(args.old_file)),
+                              (ADDED, "urls only in {}".format(args.new_file)),
+                              (STATUS_CHANGED, "urls whose status changed")):
+            print("{} : {}".format(title, len(changes[change])))
+            for line in sorted(changes[change]):
+                print(line)
@@ -0,0 +1,347 @@
+import argparse
+import heapq
+import logging
+import os
+import struct
+import sys
+from array import array
+from bisect import bisect_left
+from collections import deque
+from itertools import izip
+
+from crawl_graph import read_crawl_graph
+from frontier import FINGERPRINT_MERGE_THRESHOLD, FINGERPRINT_TYPECODE, url_fingerprint
+from url_canonicalizer import canonicalize_url
+
+
+__author__ = 'jayesh'
+
+logger = logging.getLogger(__name__)
+
+LINK_GRAPH_FILE = 'link_graph.bin'
+LINK_GRAPH_URLS_FILE = 'link_graph_urls.txt'
+# magic , url count , page count , link count , start url id ( -1 when unknown ) , followed by the pages ,
+# offsets and targets arrays in native byte order
+HEADER = struct.Struct('=4sQQQq')
+MAGIC = 'LGR1'
+NO_DEPTH = -1
+
+
+class FingerprintIds(object):
+    """
+    Url fingerprint -> id map kept in sorted runs of (fingerprint , id)
+    arrays , 12 bytes per url. Recent urls are buffered in a dict and the
+    runs merged the way FingerprintSeenSet merges its own.
+    """
+
+    def __init__(self, merge_threshold=FINGERPRINT_MERGE_THRESHOLD):
+        if FINGERPRINT_TYPECODE is None:
+            raise ValueError("No 8 byte array type on this platform , crawl with --no-link-graph")
+        # biggest run first
+        self.runs = []
+        self.recent = dict()
+        self.merge_threshold = merge_threshold
+
+    def get(self, fingerprint):
+        url_id = self.recent.get(fingerprint)
+        if url_id is not None:
+            return url_id
+        for fingerprints, ids in self.runs:
+            index = bisect_left(fingerprints, fingerprint)
+            if index < len(fingerprints) and fingerprints[index] == fingerprint:
+                return ids[index]
+        return None
+
+    def __setitem__(self, fingerprint, url_id):
+        self.recent[fingerprint] = url_id
+        if len(self.recent) >= self.merge_threshold:
+            self._merge()
+
+    def _merge(self):
+        items = sorted(self.recent.iteritems())
+        size = len(items)
+        self.recent = dict()
+        while self.runs and len(self.runs[-1][0]) <= size:
+            fingerprints, ids = self.runs.pop()
+            size += len(fingerprints)
+            items = heapq.merge(izip(fingerprints, ids), items)
+        fingerprints, ids = array(FINGERPRINT_TYPECODE), array('I')
+        for fingerprint, url_id in items:
+            fingerprints.append(fingerprint)
+            ids.append(url_id)
+        self.runs.append((fingerprints, ids))
+
+    def memory_size(self):
+        size = sys.getsizeof(self.recent) + sum(sys.getsizeof(fingerprint) + sys.getsizeof(url_id)
+                                                for fingerprint, url_id in self.recent.iteritems())
+        return size + sum(len(values) * values.itemsize for run in self.runs for values in run)
+
+
+class LinkGraph(object):
+    """
+    Every link of the crawl as integer ids in compressed sparse row arrays.
+    Urls get an id the first time they are seen ( as a page or a link ) ,
+    only the 64 bit fingerprint of their canonical key is kept in memory ,
+    the urls themselves are appended to link_graph_urls.txt and read back
+    by offset. Visited pages append their deduplicated link targets to one
+    array so a link costs 4 bytes , plus about 20 bytes per url. The
+    inlinks ( the same arrays by target ) are built by a counting sort on
+    the first query that needs them , another 4 bytes per link. Depths are
+    counted from the start url.
+    """
+
+    def __init__(self, start_url=None, output_dir='.'):
+        self.output_dir = output_dir
+        self.ids = FingerprintIds()
+        # offset of every url in link_graph_urls.txt , in id order
+        self.url_offsets = array('L')
+        self._urls_size = 0
+        self._urls_output = None
+        self._urls_input = None
+        # links of the page pages[i] are targets[offsets[i]:offsets[i + 1]]
+        self.pages = array('I')
+        self.offsets = array('L', [0])
+        self.targets = array('I')
+        self._inlinks = None
+        self._page_index = None
+        self._depths = None
+        self.start = self.url_id(start_url) if start_url else None
+
+    @property
+    def urls_file(self):
+        return os.path.join(self.output_dir, LINK_GRAPH_URLS_FILE)
+
+    @property
+    def url_count(self):
+        return len(self.url_offsets)
+
+    def url_id(self, url, key=None):
+        fingerprint = url_fingerprint(key or canonicalize_url(url))
+        url_id = self.ids.get(fingerprint)
+        if url_id is None:
+            url_id = self.ids[fingerprint] = self.url_count
+            self._write_url(url.encode('utf8') if isinstance(url, unicode) else url)
+        return url_id
+
+    def _write_url(self, url):
+        if self._urls_output is None:
+            # a loaded graph appends to its urls , a new one starts the file over
+            self._urls_output = open(self.urls_file, 'ab' if self.url_offsets else 'wb')
+        self.url_offsets.append(self._urls_size)
+        self._urls_output.write(url + '\n')
+        self._urls_size += len(url) + 1
+
+    def find(self, url):
+        return self.ids.get(url_fingerprint(canonicalize_url(url)))
+
+    def url_of(self, url_id):
+        if self._urls_output is not None:
+            self._urls_output.flush()
+        if self._urls_input is None:
+            self._urls_input = open(self.urls_file, 'rb')
+        self._urls_input.seek(self.url_offsets[url_id])
+        return self._urls_input.readline().rstrip('\n').decode('utf8')
+
+    def add_page(self, url, links, key=None):
+        """
+        links are (url , canonical key) pairs , the keys the spider dedups the links with.
+        """
+        self.pages.append(self.url_id(url, key))
+        self.targets.extend(sorted(set(self.url_id(link, link_key) for link, link_key in links)))
+        self.offsets.append(len(self.targets))
+        self._inlinks = self._page_index = self._depths = None
+
+    def add_page_urls(self, url, links):
+        self.add_page(url, [(link, canonicalize_url(link)) for link in links])
+
+    def add_crawl_graph(self, graph_file):
+        for record, data in read_crawl_graph(graph_file):
+            self.add_page_urls(record.url, data.get('links', []))
+            if self.start is None and record.parent is None:
+                self.start = self.pages[-1]
+
+    @property
+    def link_count(self):
+        return len(self.targets)
+
+    def _build_inlinks(self):
+        url_count = self.url_count
+        starts = array('L', [0]) * (url_count + 1)
+        for target in self.targets:
+            starts[target + 1] += 1
+        for url_id in xrange(url_count):
+            starts[url_id + 1] += starts[url_id]
+        sources = array('I', [0]) * len(self.targets)
+        fill = array('L', starts)
+        for index, page in enumerate(self.pages):
+            for target in self.targets[self.offsets[index]:self.offsets[index + 1]]:
+                sources[fill[target]] = page
+                fill[target] += 1
+        self._inlinks = (starts, sources)
+        logger.debug("Built the inlinks of {} urls".format(url_count))
+
+    def _page_position(self, url_id):
+        if self._page_index is None:
+            self._page_index = array('l', [-1]) * self.url_count
+            for index, page in enumerate(self.pages):
+                self._page_index[page] = index
+        return self._page_index[url_id] if url_id < len(self._page_index) else -1
+
+    def referrer_ids(self, url_id):
+        if self._inlinks is None:
+            self._build_inlinks()
+        starts, sources = self._inlinks
+        return sources[starts[url_id]:starts[url_id + 1]]
+
+    def referrers(self, url):
+        """
+        Urls of every visited page linking to url.
+        """
+        url_id = self.find(url)
+        return [] if url_id is None else [self.url_of(referrer) for referrer in self.referrer_ids(url_id)]
+
+    def links(self, url):
+        """
+        Urls linked from url , empty when url wasn't visited.
+        """
+        url_id = self.find(url)
+        index = -1 if url_id is None else self._page_position(url_id)
+        if index < 0:
+            return []
+        return [self.url_of(target) for target in self.targets[self.offsets[index]:self.offsets[index + 1]]]
+
+    def depths(self):
+        """
+        Links followed from the start url to reach every url , NO_DEPTH for
+        urls not reachable through links ( sitemap only pages ).
+        """
+        if self._depths is None:
+            depths = array('i', [NO_DEPTH]) * self.url_count
+            if self.start is not None:
+                depths[self.start] = 0
+                queue = deque([self.start])
+                while queue:
+                    url_id = queue.popleft()
+                    index = self._page_position(url_id)
+                    if index < 0:
+                        continue
+                    for target in self.targets[self.offsets[index]:self.offsets[index + 1]]:
+                        if depths[target] == NO_DEPTH:
+                            depths[target] = depths[url_id] + 1
+                            queue.append(target)
+            self._depths = depths
+        return self._depths
+
+    def depth(self, url):
+        url_id = self.find(url)
+        return NO_DEPTH if url_id is None else self.depths()[url_id]
+
+    def orphans(self):
+        """
+        Yields the urls of the visited pages no other page links to , the
+        start url aside.
+        """
+        for page in self.pages:
+            if page != self.start and not any(referrer != page for referrer in self.referrer_ids(page)):
+                yield self.url_of(page)
+
+    def memory_size(self):
+        """
+        Bytes taken by the url ids and offsets and the link arrays.
+        """
+        arrays = [self.url_offsets, self.pages, self.offsets, self.targets]
+        if self._inlinks:
+            arrays.extend(self._inlinks)
+        if self._page_index is not None:
+            arrays.append(self._page_index)
+        if self._depths is not None:
+            arrays.append(self._depths)
+        return self.ids.memory_size() + sum(len(values) * values.itemsize for values in arrays)
+
+    def summary(self):
+        memory_size = self.memory_size()
+        return "Link graph : {} urls , {} pages , {} links , {:.1f} MB , {:.1f} bytes per link".format(
+            self.url_count, len(self.pages), self.link_count, memory_size / (1024.0 * 1024),
+            float(memory_size) / self.link_count if self.link_count else 0.0)
+
+    def save(self):
+        """
+        Writes the arrays to link_graph.bin , moved in place once written ,
+        the urls are in link_graph_urls.txt already.
+        """
+        if self._urls_output is not None:
+            self._urls_output.close()
+            self._urls_output = None
+        elif not self.url_offsets:
+            # no url was ever seen
+            open(self.urls_file, 'wb').close()
+        graph_file = os.path.join(self.output_dir, LINK_GRAPH_FILE)
+        with open(graph_file + '.tmp', 'wb') as output_file:
+            output_file.write(HEADER.pack(MAGIC, self.url_count, len(self.pages), len(self.targets),
+                                          -1 if self.start is None else self.start))
+            for values in (self.pages, self.offsets, self.targets):
+                values.tofile(output_file)
+        os.rename(graph_file + '.tmp', graph_file)
+        logger.debug("Saved the link graph of {} pages to {}".format(len(self.pages), graph_file))
+
+    @classmethod
+    def load(cls, input_dir='.'):
+        graph = cls(output_dir=input_dir)
+        with open(os.path.join(input_dir, LINK_GRAPH_FILE), 'rb') as input_file:
+            magic, url_count, page_count, link_count, start = HEADER.unpack(input_file.read(HEADER.size))
+            if magic != MAGIC:
+                raise ValueError("{} is not a link graph".format(input_file.name))
+            graph.start = start if start >= 0 else None
+            graph.pages.fromfile(input_file, page_count)
+            graph.offsets = array('L')
+            graph.offsets.fromfile(input_file, page_count + 1)
+            graph.targets.fromfile(input_file, link_count)
+        with open(graph.urls_file, 'rb') as input_file:
+            for line in input_file:
+                graph.ids[url_fingerprint(canonicalize_url(line.rstrip('\n')))] = graph.url_count
+                graph.url_offsets.append(graph._urls_size)
+                graph._urls_size += len(line)
+        if graph.url_count != url_count:
+            raise ValueError("{} urls in {} , expected {}".format(graph.url_count, LINK_GRAPH_URLS_FILE, url_count))
+        return graph
+
+
+def process_parameters():
+    parser = argparse.ArgumentParser(description='Queries the link graph of a crawl')
+    parser.add_argument("--dir", default='.', help="directory of link_graph.bin / link_graph_urls.txt")
+    parser.add_argument("--crawl-graph", dest="crawl_graph",
+                        help="build the graph from a crawl_graph.jsonl instead ( and save it to --dir )")
+    parser.add_argument("--referrers", help="pages linking to this url")
+    parser.add_argument("--links", help="urls linked from this page")
+    parser.add_argument("--depth", help="links followed from the start page to reach this url")
+    parser.add_argument("--orphans", action="store_true", help="pages no other page links to")
+    parser.add_argument("--unreachable", action="store_true",
+                        help="pages not reachable by following links from the start page")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = process_parameters()
+    if args.crawl_graph:
+        link_graph = LinkGraph(output_dir=args.dir)
+        link_graph.add_crawl_graph(args.crawl_graph)
+        link_graph.save()
+    else:
+        link_graph = LinkGraph.load(args.dir)
+    print(link_graph.summary())
+    if args.referrers:
+        for url in sorted(link_graph.referrers(args.referrers)):
+            print(url.encode('utf8'))
+    if args.links:
+        for url in sorted(link_graph.links(args.links)):
+            print(url.encode('utf8'))
+    if args.depth:
+        print(link_graph.depth(args.depth))
+    if args.orphans:
+        for url in link_graph.orphans():
+            print(url.encode('utf8'))
+    if args.unreachable:
+        depths = link_graph.depths()
+        for page in link_graph.pages:
+            if depths[page] == NO_DEPTH:
+                print(link_graph.url_of(page).encode('utf8'))
@@ -0,0 +1,156 @@
+import logging
+import time
+import urlparse
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+from lxml import etree, html
+from tornado.gen import coroutine, Return
+from toro import BoundedSemaphore
+
+from config import PARSER_POOL_TYPE, PARSER_POOL_SIZE, PARSER_MAX_PENDING
+from util import decode_to_unicode
+
+
+__author__ = 'jayesh'
+
+logger = logging.getLogger(__name__)
+
+PARSER_POOL_TYPES = ['none', 'thread', 'process']
+LINK_EXTRACTORS = ['dom', 'streaming']
+RESOURCE_ATTRIBUTES = {'link': 'href', 'script': 'src', 'img': 'src'}
+
+
+def format_link(page_url, href_value):
+    href_value = decode_to_unicode(href_value.strip())
+    if href_value.startswith('#'):
+        link = page_url
+    else:
+        href_value = href_value.replace("..", "") if href_value.startswith("..") else href_value
+        link = urlparse.urljoin(page_url, href_value, allow_fragments=False)
+        link = link if 'javascript:void' not in href_value and not href_value.startswith('mailto') else None
+    return decode_to_unicode(link)
+
+
+def _resolve_links(page_url, base_href, hrefs, resource_urls):
+    base_url = urlparse.urljoin(page_url, base_href.strip()) if base_href else page_url
+    links = [(decode_to_unicode(href_value),
+              format_link(page_url if href_value.strip().startswith('#') else base_url, href_value))
+             for href_value in hrefs]
+    resources = [format_link(base_url, resource_url) for resource_url in resource_urls]
+    return links, [resource for resource in resources if resource]
+
+
+def extract_links(page_url, body):
+    """
+    Parses the html body and returns (href, absolute link) pairs for every
+    anchor, the link is None for hrefs that can't be crawled, and the urls of
+    the stylesheets, scripts and images. Runs inside the parser pool so it
+    must stay a module level function.
+    """
+    dom = html.fromstring(decode_to_unicode(body))
+    base_href = dom.xpath('//base/@href')
+    return _resolve_links(page_url, base_href[0] if base_href else None, dom.xpath('//a/@href'),
+                          dom.xpath('//link/@href | //script/@src | //img/@src'))
+
+
+class _LinkCollector(object):
+    """
+    lxml parser target recording the link attributes as the start tags are seen.
+    """
+
+    def __init__(self):
+        self.base_href = None
+        self.hrefs = []
+        self.resource_urls = []
+
+    def start(self, tag, attributes):
+        if tag == 'a':
+            href_value = attributes.get('href')
+            if href_value is not None:
+                self.hrefs.append(href_value)
+        elif tag in RESOURCE_ATTRIBUTES:
+            resource_url = attributes.get(RESOURCE_ATTRIBUTES[tag])
+            if resource_url is not None:
+                self.resource_urls.append(resource_url)
+        elif tag == 'base' and self.base_href is None:
+            self.base_href = attributes.get('href')
+
+    def close(self):
+        return self
+
+
+class StreamingLinkExtractor(object):
+    """
+    Extracts the same links as extract_links without building a tree, the
+    body chunks are fed to the parser as they are downloaded.
+    """
+
+    def __init__(self, page_url):
+        self.page_url = page_url
+        self.collector = _LinkCollector()
+        # bodies are treated as utf-8 , same as decode_to_unicode does for extract_links
+        self.parser = etree.HTMLParser(target=self.collector, encoding='utf-8')
+        self.failed = False
+        # seconds spent parsing , spread over the chunks
+        self.parse_time = 0.0
+
+    def feed(self, chunk):
+        if self.failed:
+            return
+        started = time.time()
+        try:
+            self.parser.feed(chunk)
+        except etree.LxmlError as ex:
+            logger.debug(u"Streaming parse failed for {} with {}".format(self.page_url, ex))
+            self.failed = True
+        self.parse_time += time.time() - started
+
+    def close(self):
+        started = time.time()
+        if not self.failed:
+            try:
+                self.parser.close()
+            except etree.LxmlError as ex:
+                logger.debug(u"Streaming parse failed for {} with {}".format(self.page_url, ex))
+        links = _resolve_links(self.page_url, self.collector.base_href, self.collector.hrefs,
+                               self.collector.resource_urls)
+        self.parse_time += time.time() - started
+        return links
+
+
+class LinkParserPool(object):
+    """
+    Runs extract_links off the IOLoop in a thread ( lxml releases the GIL
+    while parsing ) or process pool. At most max_pending bodies are queued,
+    further pages wait for a free slot which in turn slows down fetching.
+    """
+
+    def __init__(self, pool_type=PARSER_POOL_TYPE, pool_size=PARSER_POOL_SIZE, max_pending=PARSER_MAX_PENDING):
+        if pool_type not in PARSER_POOL_TYPES:
+            raise ValueError("Unknown parser pool type {}".format(pool_type))
+        self.pool_type = pool_type
+        self.executor = None
+        if pool_type == 'thread':
+            self.executor = ThreadPoolExecutor(pool_size)
+        elif pool_type == 'process':
+            self.executor = ProcessPoolExecutor(pool_size)
+        self.slots = BoundedSemaphore(max_pending)
+        self.pending = 0
+
+    @coroutine
+    def parse(self, page_url, body):
+        if self.executor is None:
+            raise Return(extract_links(page_url, body))
+
+        yield self.slots.acquire()
+        self.pending += 1
+        try:
+            links = yield self.executor.submit(extract_links, page_url, body)
+        finally:
+            self.pending -= 1
+            self.slots.release()
+        raise Return(links)
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
@@ -1,21 +1,50 @@
 import json
 import logging
-import multiprocessing
+import os
 import subprocess
-import tempfile
-from threading import Timer
+import time
+from collections import deque
+from Queue import Queue, Empty
+from threading import Thread, Lock
 
-from config import PHANTOM_JS_LOCATION
+from tornado.concurrent import Future
+
+from browser_profile import BrowserProfile, ResourceTiming
+from config import PHANTOM_JS_LOCATION, BROWSER_PROCESS_COUNT, BROWSER_PAGE_TIMEOUT, BROWSER_PAGES_PER_WORKER, \
+    BROWSER_KILL_GRACE_PERIOD, BROWSER_QUEUE_SIZE
 
 
 logger = logging.getLogger(__name__)
 
+BROWSER_WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'browser_worker.js')
+PAGE_LOADED = 'success'
+READ_SIZE = 64 * 1024
+
+# browser_worker.js writes one JSON object per line , every message has the protocol version 'v' , its 'type' and
+# the 'url' of the page being checked :
+#   error           : message , trace ( list of 'file:line in function' )
+#   resource        : resource , status , start , ttfb , end ( ms since the page was opened ) , size , content_type
+#   broken-resource : resource , status , size , content_type
+#   page            : status , load_time , dom_content_loaded ( ms ) , resources , size ( bytes ) , always the last
+#                     message of a page
+PROTOCOL_VERSION = 1
+MESSAGE_ERROR = 'error'
+MESSAGE_RESOURCE = 'resource'
+MESSAGE_BROKEN_RESOURCE = 'broken-resource'
+MESSAGE_PAGE = 'page'
+
 
 class Resource:
     def __init__(self, parent=''):
         self.parent = parent
         self.error = set()
         self.resource_issues = set()
+        self.status = PAGE_LOADED
+        self.load_time = None
+        self.dom_content_loaded = None
+        self.resource_count = 0
+        self.size = 0
+        self.timings = []
 
     def add_error(self, error):
         self.error.add(error)
@@ -31,92 +60,367 @@ class Resource:
         resources = ("\nBroken Resources : \n" + "\n".join(self.resource_issues)) if self.resource_issues else ""
         str += errors.encode('utf8')
         str += resources.encode('utf8')
+        if self.status != PAGE_LOADED:
+            str += "\nPage load status : {}".format(self.status.encode('utf8'))
         return str
 
+    def has_issues(self):
+        return bool(self.error or self.resource_issues or self.status != PAGE_LOADED)
+
+
+class BrowserWorker(object):
+    """
+    One long lived phantomjs process , restarted after pages_per_worker
+    pages or when a page hangs it past the page timeout.
+    """
+
+    def __init__(self, name, page_timeout=BROWSER_PAGE_TIMEOUT, pages_per_worker=BROWSER_PAGES_PER_WORKER):
+        self.name = name
+        self.page_timeout = page_timeout
+        self.pages_per_worker = pages_per_worker
+        self.process = None
+        self.messages = None
+        self.decoder = None
+        self.malformed_count = 0
+        self.pages = 0
+
+    def _start(self):
+        if self.decoder is not None:
+            self.malformed_count += self.decoder.malformed_count
+        self.process = subprocess.Popen([PHANTOM_JS_LOCATION, BROWSER_WORKER_SCRIPT, str(self.page_timeout * 1000)],
+                                        stdin=subprocess.PIPE, stdout=subprocess.PIPE, bufsize=1)
+        self.messages = Queue()
+        self.decoder = ProtocolDecoder(self.name)
+        self.pages = 0
+        reader = Thread(target=_read_messages, args=(self.process.stdout, self.decoder, self.messages),
+                        name=self.name + '-reader')
+        reader.daemon = True
+        reader.start()
+        logger.debug("Started browser worker {} ( pid {} )".format(self.name, self.process.pid))
+
+    def stop(self, kill=False):
+        if self.process is None:
+            return
+        try:
+            if kill:
+                self.process.kill()
+            else:
+                self.process.stdin.close()
+            self.process.wait()
+        except (OSError, IOError) as ex:
+            logger.debug("Error stopping browser worker {} : {}".format(self.name, ex))
+        self.process = None
+
+    def visit(self, url):
+        if self.process is not None and self.pages >= self.pages_per_worker:
+            self.stop()
+        if self.process is None:
+            self._start()
+        self.pages += 1
+
+        resource = Resource(url)
+        try:
+            self.process.stdin.write(url.encode('utf8') + '\n')
+            self.process.stdin.flush()
+        except IOError as ex:
+            resource.status = 'crashed'
+            logger.debug("Browser worker {} died : {}".format(self.name, ex))
+            self.stop(kill=True)
+            return resource
+
+        deadline = time.time() + self.page_timeout + BROWSER_KILL_GRACE_PERIOD
+        while True:
+            try:
+                message = self.messages.get(timeout=max(deadline - time.time(), 0))
+            except Empty:
+                resource.status = 'killed after timeout'
+                self.stop(kill=True)
+                return resource
+            if message is None:
+                resource.status = 'crashed'
+                self.stop(kill=True)
+                return resource
+            if message.get('url') != url.strip():
+                # late reply about a page the worker was given before
+                logger.debug(u"Dropped browser message for {} while checking {}".format(message.get('url'), url))
+                continue
+            kind = message['type']
+            if kind == MESSAGE_PAGE:
+                resource.status = message.get('status') or PAGE_LOADED
+                resource.load_time = message.get('load_time')
+                resource.dom_content_loaded = message.get('dom_content_loaded')
+                resource.resource_count = message.get('resources', 0)
+                resource.size = message.get('size', 0)
+                return resource
+            if kind == MESSAGE_RESOURCE:
+                resource.timings.append(ResourceTiming(message.get('resource') or u'', message.get('status'),
+                                                       message.get('start'), message.get('ttfb'),
+                                                       message.get('end'), message.get('size') or 0,
+                                                       message.get('content_type')))
+            elif kind == MESSAGE_ERROR:
+                resource.add_error(message.get('message') or u'')
+            elif kind == MESSAGE_BROKEN_RESOURCE:
+                resource.add_resource(message.get('resource') or u'')
+            else:
+                logger.debug(u"Ignored browser message of type {} for {}".format(kind, url))
+
+    def total_malformed_count(self):
+        return self.malformed_count + (self.decoder.malformed_count if self.decoder is not None else 0)
+
+
+class ProtocolDecoder(object):
+    """
+    Incremental decoder of the browser worker output : bytes are fed as they
+    are read from the pipe and the messages of the completed lines returned.
+    Lines that aren't protocol messages are logged and counted rather than
+    dropped silently.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.buffer = b''
+        self.malformed_count = 0
+
+    def feed(self, data):
+        lines = (self.buffer + data).split(b'\n')
+        self.buffer = lines.pop()
+        return self._decode_lines(lines)
+
+    def close(self):
+        lines, self.buffer = [self.buffer], b''
+        return self._decode_lines(lines)
+
+    def _decode_lines(self, lines):
+        messages = []
+        for line in lines:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                message = json.loads(line)
+            except ValueError as ex:
+                self._malformed(line, ex)
+                continue
+            if not isinstance(message, dict) or 'type' not in message:
+                self._malformed(line, 'not a message')
+            elif message.get('v') != PROTOCOL_VERSION:
+                self._malformed(line, 'unsupported protocol version {}'.format(message.get('v')))
+            else:
+                messages.append(message)
+        return messages
+
+    def _malformed(self, line, reason):
+        self.malformed_count += 1
+        logger.warning("Unreadable output from browser worker {} ( {} ) : {!r}".format(self.name, reason, line[:200]))
+
+
+def _read_messages(stream, decoder, messages):
+    while True:
+        data = os.read(stream.fileno(), READ_SIZE)
+        if not data:
+            break
+        for message in decoder.feed(data):
+            messages.put(message)
+    for message in decoder.close():
+        messages.put(message)
+    messages.put(None)
+
+
+class BrowserPool(object):
+    """
+    BROWSER_PROCESS_COUNT browser workers taking urls from a shared queue ,
+    on_result is called with the Resource of every page as soon as it is
+    done , from the worker threads.
+    """
+
+    def __init__(self, on_result, size=BROWSER_PROCESS_COUNT, queue_size=BROWSER_QUEUE_SIZE):
+        self.on_result = on_result
+        self.urls = Queue(maxsize=queue_size)
+        self.workers = [BrowserWorker('browser-{}'.format(index)) for index in range(size)]
+        self.threads = [Thread(target=self._work, args=(worker,), name=worker.name) for worker in self.workers]
+        self.aborted = False
+
+    def start(self):
+        for thread in self.threads:
+            thread.daemon = True
+            thread.start()
 
-def invoke_url_in_browser(file_name):
-    resources_state = dict()
-    print("\n\nIdentifying the javascript and page loading errors for {}\n\n".format(file_name))
-    SCRIPT = 'single_url_invoker.js'
-    params = [PHANTOM_JS_LOCATION, SCRIPT, file_name]
-
-    p = subprocess.Popen(params, stdout=subprocess.PIPE, bufsize=1)
-    timeout = {"value": False}
-    timer = Timer(900, kill_phantom, [p, timeout])
-    timer.start()
-
-    for line in iter(p.stdout.readline, b''):
-        print("%s" % line)
-        if "parent" in line and ("error" in line or "broken-resource" in line):
-            data = get_proper_data_from_stream(line)
-            if data:
-                parent = data.get('parent')
-                error = data.get('error', '')
-                broken_resource = data.get('broken-resource', '')
-                if not resources_state.get(parent):
-                    resources_state[parent] = Resource(parent)
-                if 'error' in line:
-                    resource = resources_state[parent].add_error(error)
-                    resources_state[parent] = resource
-                else:
-                    resources_state[parent] = resources_state[parent].add_resource(broken_resource)
-                    # else:
-                    # print("%s" % line)
-
-    p.communicate()
-    timer.cancel()
-
-    print("\n\nWrapping for {} due to timeout ? {} \n\n".format(file_name, timeout['value']))
-    return resources_state
-
-
-def get_proper_data_from_stream(strieamed_line):
-    try:
-        return json.loads(strieamed_line)
-    except Exception as json_error:
-        logger.debug("Skipped line {} for resource processing due to {} ".format(strieamed_line, json_error))
-        return None
+    def submit(self, url):
+        """
+        Blocks while the queue is full.
+        """
+        self.urls.put(url)
+
+    def close(self):
+        """
+        Waits for the submitted urls to be checked and stops the workers.
+        """
+        for _ in self.threads:
+            self.urls.put(None)
+        for thread in self.threads:
+            thread.join()
+
+    def malformed_count(self):
+        return sum(worker.total_malformed_count() for worker in self.workers)
+
+    def abort(self):
+        """
+        Kills the browsers and drops the queued urls , pages being checked
+        are reported as crashed.
+        """
+        self.aborted = True
+        for worker in self.workers:
+            process = worker.process
+            if process is not None:
+                try:
+                    process.kill()
+                except OSError:
+                    pass
+
+    def _work(self, worker):
+        try:
+            while True:
+                url = self.urls.get()
+                if url is None:
+                    return
+                if self.aborted:
+                    continue
+                try:
+                    resource = worker.visit(url)
+                except Exception as ex:
+                    logger.error(u"Browser check of {} failed : {}".format(url, ex))
+                    resource = Resource(url)
+                    resource.status = u'check failed'
+                self.on_result(resource)
+        finally:
+            worker.stop()
+
+
+class ResourceIssueReport(object):
+    """
+    js_and_broken_resources.txt , written to by the browser threads as
+    pages with issues come in , and the browser profile of the pages.
+    """
+
+    def __init__(self, file_name="js_and_broken_resources.txt"):
+        self.output_file = open(file_name, 'w')
+        self.profile = BrowserProfile()
+        self.lock = Lock()
+        self.checked_count = 0
+        self.issue_count = 0
+
+    def write(self, resource):
+        with self.lock:
+            self.checked_count += 1
+            self.profile.add(resource)
+            if not resource.has_issues():
+                return
+            self.issue_count += 1
+            print(resource)
+            self.output_file.write(str(resource))
+            self.output_file.flush()
+
+    def close(self):
+        self.output_file.close()
+        self.profile.write()
+
+
+class BrowserCheckStage(object):
+    """
+    Feeds the pages a spider finalizes to a browser pool while the crawl
+    goes on. Runs on the IOLoop : at most queue_size pages are queued or
+    being checked , pages finalized beyond that wait in a backlog that the
+    crawl workers drain through wait_for_room() before they fetch their next
+    page , so a slow browser pool slows the crawl down instead of blocking
+    the IOLoop or buffering the whole site.
+    """
+
+    def __init__(self, io_loop, size=BROWSER_PROCESS_COUNT, queue_size=BROWSER_QUEUE_SIZE):
+        self.io_loop = io_loop
+        self.queue_size = queue_size
+        self.report = ResourceIssueReport()
+        self.pool = BrowserPool(self._on_result, size, queue_size)
+        self.backlog = deque()
+        self.pending = 0
+        self.submitted_count = 0
+        self.room_waiters = []
+        self.done_waiters = []
+        self.closed = False
+
+    def start(self):
+        self.pool.start()
+
+    def submit(self, url):
+        self.submitted_count += 1
+        if self.pending < self.queue_size:
+            self._hand_over(url)
+        else:
+            self.backlog.append(url)
+
+    def _hand_over(self, url):
+        self.pending += 1
+        # never blocks , pending keeps the pool queue from filling up
+        self.pool.submit(url)
+
+    def _on_result(self, resource):
+        self.report.write(resource)
+        self.io_loop.add_callback(self._page_checked)
+
+    def _page_checked(self):
+        self.pending -= 1
+        if self.backlog:
+            self._hand_over(self.backlog.popleft())
+        if not self.backlog:
+            self._resolve(self.room_waiters)
+        if not self.pending:
+            self._resolve(self.done_waiters)
+
+    def _resolve(self, waiters):
+        while waiters:
+            waiters.pop().set_result(None)
+
+    def _wait(self, waiters, ready):
+        future = Future()
+        if ready:
+            future.set_result(None)
+        else:
+            waiters.append(future)
+        return future
+
+    def wait_for_room(self):
+        return self._wait(self.room_waiters, not self.backlog)
+
+    def wait_for_checks(self):
+        return self._wait(self.done_waiters, not self.pending)
+
+    def close(self, abort=False):
+        if self.closed:
+            return
+        self.closed = True
+        if abort:
+            self.pool.abort()
+        self.pool.close()
+        self.report.close()
+
+    def summary(self):
+        return ("Browser checks : {} pages , {} with issues , written to js_and_broken_resources.txt , timings in "
+                "browser_profile.txt , {} unreadable browser messages\n".format(
+                    self.report.checked_count, self.report.issue_count, self.pool.malformed_count()))
 
 
 def detect_js_and_resource_issues(file_name):
-    try:
-        with open(file_name) as f:
-            content = f.readlines()
-
-        pool_size = 3 if multiprocessing.cpu_count() * 2 > 3 else multiprocessing.cpu_count() * 2
-        print("Breaking original url list file into {} files".format(pool_size))
-
-        prev_count = 0
-        offset = len(content) / pool_size
-        file_list = []
-        file_handles = []
-        for index in range(pool_size):
-            init_count = prev_count
-            prev_count += offset
-            list_to_print = content[init_count:prev_count]
-            temp = tempfile.NamedTemporaryFile(mode='w+t')
-            temp.writelines(list_to_print)
-            temp.seek(0)
-            file_list.append(temp.name)
-            file_handles.append(temp)
-            if prev_count >= len(content):
-                break
-
-        pool = multiprocessing.Pool(processes=pool_size)
-        result = pool.map(invoke_url_in_browser, sorted(file_list))
-
-        with open("js_and_broken_resources.txt", 'w') as output_file:
-            for resource_dict in result:
-                for parent, resource in resource_dict.iteritems():
-                    # print('{}\nErrors : \n{}\nBroken-Resources : \n{}'.format(parent, "\n".join(resource.error), "\n".join(resource.resource_issues)))
-                    # output_file.write('{}\nErrors : \n{}\nBroken-Resources : \n{}'.format(parent, "\n".join(resource.error), "\n".join(resource.resource_issues)))
-                    print(resource)
-                    output_file.write(str(resource))
-
-    finally:
-        [file_handle.close() for file_handle in file_handles]
-
-
-def kill_phantom(proc, timeout):
-    timeout["value"] = True
-    proc.kill()
+    with open(file_name) as url_file:
+        urls = [line.strip().decode('utf8') for line in url_file if line.strip()]
+    print("\n\nIdentifying the javascript and page loading errors for {} urls with {} browsers\n\n".format(
+        len(urls), BROWSER_PROCESS_COUNT))
+
+    report = ResourceIssueReport()
+    pool = BrowserPool(report.write)
+    pool.start()
+    for url in urls:
+        pool.submit(url)
+    pool.close()
+    report.close()
+    print("\nPage and resource timings written to browser_profile.txt\n")
+    if pool.malformed_count():
+        print("{} unreadable browser messages , see the log".format(pool.malformed_count()))
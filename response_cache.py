@@ -0,0 +1,71 @@
+import logging
+import sqlite3
+import time
+from collections import namedtuple
+
+from config import STATE_COMMIT_INTERVAL
+from util import decode_to_unicode
+
+
+__author__ = 'jayesh'
+
+logger = logging.getLogger(__name__)
+
+CachedResponse = namedtuple('CachedResponse', ['etag', 'last_modified', 'response_code', 'content_type', 'links',
+                                               'hardcoded_urls'])
+
+
+def _join(urls):
+    return u'\n'.join(sorted(urls))
+
+
+def _split(value):
+    return set(value.split(u'\n')) if value else set()
+
+
+class ResponseCache(object):
+    """
+    Validators and extracted links of html pages from earlier crawls, keyed
+    by canonical url, used to send conditional GET requests and to reuse the
+    links when the server answers 304 Not Modified.
+    """
+
+    def __init__(self, db_path, commit_interval=STATE_COMMIT_INTERVAL):
+        self.db_path = db_path
+        self.commit_interval = commit_interval
+        self.pending_writes = 0
+        self.connection = sqlite3.connect(db_path)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "url_key TEXT PRIMARY KEY, etag TEXT, last_modified TEXT, response_code INTEGER, content_type TEXT, "
+            "links TEXT, hardcoded_urls TEXT, fetched_at REAL)")
+        self.connection.commit()
+
+    def get(self, url_key):
+        row = self.connection.execute(
+            "SELECT etag, last_modified, response_code, content_type, links, hardcoded_urls FROM responses "
+            "WHERE url_key = ?", (decode_to_unicode(url_key),)).fetchone()
+        if row is None:
+            return None
+        etag, last_modified, response_code, content_type, links, hardcoded_urls = row
+        return CachedResponse(etag, last_modified, response_code, content_type, _split(links), _split(hardcoded_urls))
+
+    def store(self, url_key, etag, last_modified, response_code, content_type, links, hardcoded_urls):
+        self.connection.execute(
+            "INSERT OR REPLACE INTO responses (url_key, etag, last_modified, response_code, content_type, links, "
+            "hardcoded_urls, fetched_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (decode_to_unicode(url_key), decode_to_unicode(etag), decode_to_unicode(last_modified), response_code,
+             content_type, _join(links), _join(hardcoded_urls), time.time()))
+        self.pending_writes += 1
+        if self.pending_writes >= self.commit_interval:
+            self.commit()
+
+    def commit(self):
+        self.connection.commit()
+        self.pending_writes = 0
+
+    def close(self):
+        self.commit()
+        self.connection.close()
@@ -0,0 +1,136 @@
+import logging
+import zlib
+
+from lxml import etree
+from tornado.gen import coroutine
+from tornado.httpclient import HTTPRequest
+from toro import BoundedSemaphore
+
+from config import MAX_CONCURRENT_SITEMAP_REQUESTS, SITEMAP_TIMEOUT
+from util import decode_to_unicode, parse_w3c_datetime
+
+
+__author__ = 'jayesh'
+
+logger = logging.getLogger(__name__)
+
+GZIP_MAGIC = b'\x1f\x8b'
+SITEMAP_URL = 'url'
+SITEMAP_INDEX_ENTRY = 'sitemap'
+
+
+def _child_text(element, name):
+    for child in element.iterchildren(tag=etree.Element):
+        if etree.QName(child).localname == name:
+            return child.text.strip() if child.text else None
+    return None
+
+
+class SitemapParser(object):
+    """
+    Incremental sitemap parser, body chunks are fed as they are downloaded
+    and the (kind, loc, lastmod) entries of every completed <url> or
+    <sitemap> element are returned right away. Parsed elements are dropped
+    so memory stays flat however big the sitemap is. Gzipped sitemaps are
+    detected by their magic bytes and inflated on the fly.
+    """
+
+    def __init__(self, sitemap_url):
+        self.sitemap_url = sitemap_url
+        self.parser = etree.XMLPullParser(events=('end',), resolve_entities=False, huge_tree=True)
+        self.decompressor = None
+        self.started = False
+        self.failed = False
+
+    def feed(self, chunk):
+        if self.failed:
+            return []
+        try:
+            if not self.started:
+                self.started = True
+                if chunk.startswith(GZIP_MAGIC):
+                    self.decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            if self.decompressor is not None:
+                chunk = self.decompressor.decompress(chunk)
+            self.parser.feed(chunk)
+        except (etree.LxmlError, zlib.error) as ex:
+            logger.error(u"Error parsing sitemap {} : {}".format(self.sitemap_url, ex))
+            self.failed = True
+        return self._entries()
+
+    def close(self):
+        if not self.failed:
+            try:
+                if self.decompressor is not None:
+                    self.parser.feed(self.decompressor.flush())
+                self.parser.close()
+            except (etree.LxmlError, zlib.error) as ex:
+                logger.error(u"Error parsing sitemap {} : {}".format(self.sitemap_url, ex))
+                self.failed = True
+        return self._entries()
+
+    def _entries(self):
+        entries = []
+        for _, element in self.parser.read_events():
+            kind = etree.QName(element).localname
+            if kind not in (SITEMAP_URL, SITEMAP_INDEX_ENTRY):
+                continue
+            loc = _child_text(element, 'loc')
+            if loc:
+                last_modified = _child_text(element, 'lastmod')
+                entries.append((kind, decode_to_unicode(loc),
+                                parse_w3c_datetime(last_modified) if last_modified else None))
+            element.clear()
+            while element.getprevious() is not None:
+                del element.getparent()[0]
+        return entries
+
+
+class SitemapLoader(object):
+    """
+    Streams a sitemap through the shared http client and hands every url
+    to on_url(url, last_modified) as soon as it is parsed. The children of
+    a sitemap index are loaded concurrently, at most max_concurrent at a
+    time.
+    """
+
+    def __init__(self, http_client, on_url, max_concurrent=MAX_CONCURRENT_SITEMAP_REQUESTS):
+        self.http_client = http_client
+        self.on_url = on_url
+        self.slots = BoundedSemaphore(max_concurrent)
+        self.loaded_sitemaps = set()
+        self.url_count = 0
+
+    @coroutine
+    def load(self, sitemap_url):
+        if sitemap_url in self.loaded_sitemaps:
+            return
+        self.loaded_sitemaps.add(sitemap_url)
+
+        parser = SitemapParser(sitemap_url)
+        child_sitemaps = []
+
+        def process(entries):
+            for kind, loc, last_modified in entries:
+                if kind == SITEMAP_INDEX_ENTRY:
+                    child_sitemaps.append(loc)
+                else:
+                    self.url_count += 1
+                    self.on_url(loc, last_modified)
+
+        request = HTTPRequest(sitemap_url, request_timeout=SITEMAP_TIMEOUT, follow_redirects=True, max_redirects=10,
+                              streaming_callback=lambda chunk: process(parser.feed(chunk)))
+        yield self.slots.acquire()
+        try:
+            logger.debug(u"Loading sitemap {}".format(sitemap_url))
+            yield self.http_client.fetch(request)
+            process(parser.close())
+        except Exception as ex:
+            logger.error(u"Error adding sitemap urls from {} : {}".format(sitemap_url, ex))
+        finally:
+            self.slots.release()
+
+        # curl doesn't allow new requests from inside a transfer , so children start once the index is read ,
+        # after the slot is released since they need it themselves
+        if child_sitemaps:
+            yield [self.load(child_sitemap) for child_sitemap in child_sitemaps]
@@ -0,0 +1,207 @@
+import argparse
+import logging
+import math
+import random
+import time
+import zlib
+
+from tornado import gen
+from tornado.ioloop import IOLoop
+from tornado.web import Application, RequestHandler
+
+from config import BENCHMARK_PAGES, BENCHMARK_FANOUT, BENCHMARK_PAGE_SIZE, BENCHMARK_LATENCY_MEDIAN, \
+    BENCHMARK_LATENCY_SIGMA, BENCHMARK_ERROR_RATE, BENCHMARK_REDIRECT_RATE, BENCHMARK_SEED
+
+
+__author__ = 'jayesh'
+
+logger = logging.getLogger(__name__)
+
+BROKEN_LINK_CODES = (404, 500)
+FILLER = 'Lorem ipsum dolor sit amet , consectetur adipiscing elit. '
+
+
+class SyntheticSite(object):
+    """
+    Deterministic site model : the same parameters always give the same
+    pages , links , errors , redirects and response delays , so the server
+    and the benchmark checking the crawl results agree on what the site is.
+
+    Page i is /p/i ( / serves page 0 ) and links to page i + 1 , keeping
+    every page reachable , and to fanout - 1 random targets. A target is a
+    broken link ( /missing/j answering 404 or /error/j answering 500 ) with
+    probability error_rate , a redirect ( /r/j to /p/j ) with probability
+    redirect_rate and a page otherwise.
+    """
+
+    def __init__(self, pages=BENCHMARK_PAGES, fanout=BENCHMARK_FANOUT, page_size=BENCHMARK_PAGE_SIZE,
+                 latency_median=BENCHMARK_LATENCY_MEDIAN, latency_sigma=BENCHMARK_LATENCY_SIGMA,
+                 error_rate=BENCHMARK_ERROR_RATE, redirect_rate=BENCHMARK_REDIRECT_RATE, seed=BENCHMARK_SEED):
+        self.pages = pages
+        self.fanout = fanout
+        self.page_size = page_size
+        self.latency_median = latency_median
+        self.latency_sigma = latency_sigma
+        self.error_rate = error_rate
+        self.redirect_rate = redirect_rate
+        self.seed = seed
+
+    def links_of(self, index):
+        rng = random.Random(self.seed * 1000003 + index)
+        links = ['/p/{}'.format(index + 1)] if index + 1 < self.pages else []
+        for _ in xrange(self.fanout - 1):
+            draw = rng.random()
+            target = rng.randrange(self.pages)
+            if draw < self.error_rate:
+                code = rng.choice(BROKEN_LINK_CODES)
+                links.append('/{}/{}'.format('missing' if code == 404 else 'error', target))
+            elif draw < self.error_rate + self.redirect_rate:
+                links.append('/r/{}'.format(target))
+            else:
+                links.append('/p/{}'.format(target))
+        return links
+
+    def delay_of(self, path):
+        """
+        Response delay in seconds , log-normally distributed around the median.
+        """
+        if not self.latency_median:
+            return 0
+        rng = random.Random(zlib.crc32(path) ^ self.seed)
+        return rng.lognormvariate(math.log(self.latency_median / 1000.0), self.latency_sigma)
+
+    def page_body(self, index):
+        links = ''.join('<li><a href="{0}">{0}</a></li>'.format(link) for link in self.links_of(index))
+        head = '<html><head><title>Page {}</title></head><body><h1>Page {}</h1><ul>{}</ul><p>'.format(
+            index, index, links)
+        tail = '</p></body></html>'
+        filler_size = max(self.page_size - len(head) - len(tail), 0)
+        filler = (FILLER * (filler_size // len(FILLER) + 1))[:filler_size]
+        return head + filler + tail
+
+    def broken_links(self):
+        """
+        {path : response code} of every broken link on the site.
+        """
+        broken = dict()
+        for index in xrange(self.pages):
+            for link in self.links_of(index):
+                if link.startswith('/missing/'):
+                    broken[link] = 404
+                elif link.startswith('/error/'):
+                    broken[link] = 500
+        return broken
+
+    def expected_pages(self):
+        """
+        Distinct urls a complete crawl visits : the root , the pages , and the
+        redirect and broken links.
+        """
+        links = set()
+        for index in xrange(self.pages):
+            links.update(self.links_of(index))
+        links.update('/p/{}'.format(index) for index in xrange(self.pages))
+        return len(links) + 1
+
+    def describe(self):
+        return dict(pages=self.pages, fanout=self.fanout, page_size=self.page_size,
+                    latency_median=self.latency_median, latency_sigma=self.latency_sigma,
+                    error_rate=self.error_rate, redirect_rate=self.redirect_rate, seed=self.seed)
+
+
+class _SiteHandler(RequestHandler):
+    def initialize(self, site):
+        self.site = site
+
+    @gen.coroutine
+    def _delay(self):
+        delay = self.site.delay_of(self.request.path)
+        if delay:
+            yield gen.Task(IOLoop.current().add_timeout, time.time() + delay)
+
+
+class PageHandler(_SiteHandler):
+    @gen.coroutine
+    def get(self, index=0):
+        index = int(index)
+        yield self._delay()
+        if index >= self.site.pages:
+            self.set_status(404)
+            return
+        self.write(self.site.page_body(index))
+
+    @gen.coroutine
+    def head(self, index=0):
+        yield self._delay()
+        if int(index) >= self.site.pages:
+            self.set_status(404)
+        self.set_header('Content-Type', 'text/html; charset=UTF-8')
+
+
+class BrokenHandler(_SiteHandler):
+    @gen.coroutine
+    def get(self, kind, index):
+        yield self._delay()
+        self.set_status(404 if kind == 'missing' else 500)
+        self.write('<html><body>{}</body></html>'.format(kind))
+
+    head = get
+
+
+class RedirectHandler(_SiteHandler):
+    @gen.coroutine
+    def get(self, index):
+        yield self._delay()
+        self.redirect('/p/{}'.format(index), permanent=True)
+
+    head = get
+
+
+class SitemapHandler(_SiteHandler):
+    def get(self):
+        base = '{}://{}'.format(self.request.protocol, self.request.host)
+        self.set_header('Content-Type', 'application/xml')
+        self.write('<?xml version="1.0" encoding="UTF-8"?>'
+                   '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">')
+        for index in xrange(self.site.pages):
+            self.write('<url><loc>{}/p/{}</loc></url>'.format(base, index))
+        self.write('</urlset>')
+
+
+def create_application(site):
+    options = dict(site=site)
+    return Application([(r'/', PageHandler, options),
+                        (r'/p/(\d+)', PageHandler, options),
+                        (r'/(missing|error)/(\d+)', BrokenHandler, options),
+                        (r'/r/(\d+)', RedirectHandler, options),
+                        (r'/sitemap.xml', SitemapHandler, options)])
+
+
+def add_site_arguments(parser):
+    parser.add_argument("--pages", type=int, default=BENCHMARK_PAGES, help="pages of the site")
+    parser.add_argument("--fanout", type=int, default=BENCHMARK_FANOUT, help="links per page")
+    parser.add_argument("--page-size", dest="page_size", type=int, default=BENCHMARK_PAGE_SIZE,
+                        help="bytes per page")
+    parser.add_argument("--latency-median", dest="latency_median", type=float, default=BENCHMARK_LATENCY_MEDIAN,
+                        help="median response delay in ms , 0 for none")
+    parser.add_argument("--latency-sigma", dest="latency_sigma", type=float, default=BENCHMARK_LATENCY_SIGMA,
+                        help="sigma of the log-normal response delay")
+    parser.add_argument("--error-rate", dest="error_rate", type=float, default=BENCHMARK_ERROR_RATE,
+                        help="share of links that are broken")
+    parser.add_argument("--redirect-rate", dest="redirect_rate", type=float, default=BENCHMARK_REDIRECT_RATE,
+                        help="share of links that redirect")
+    parser.add_argument("--seed", type=int, default=BENCHMARK_SEED)
+
+
+def site_from_arguments(args):
+    return SyntheticSite(args.pages, args.fanout, args.page_size, args.latency_median, args.latency_sigma,
+                         args.error_rate, args.redirect_rate, args.seed)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Serves a deterministic synthetic site to crawl')
+    parser.add_argument("--port", type=int, default=8000)
+    add_site_arguments(parser)
+    args = parser.parse_args()
+    create_application(site_from_arguments(args)).listen(args.port, address='127.0.0.1')
+    IOLoop.instance().start()
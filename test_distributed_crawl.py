@@ -0,0 +1,325 @@
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+import unittest
+from collections import Counter, deque
+
+from tornado import gen
+from tornado.concurrent import Future
+from tornado.gen import coroutine
+from tornado.ioloop import IOLoop
+
+import distributed_crawl
+from crawl_graph import CRAWL_GRAPH_FILE, CrawlGraphWriter, read_crawl_graph
+from crawl_state import PageRecord
+from distributed_crawl import Coordinator, Partition, LINKS, partition_of
+
+
+__author__ = 'jayesh'
+
+START_URL = u'http://h0.example.com/'
+HOSTS = 6
+PAGES_PER_HOST = 40
+LINKS_PER_PAGE = 5
+# seconds the whole distributed crawl gets before the test fails
+CRAWL_TIMEOUT = 30
+
+
+def create_site(seed=1):
+    """
+    url -> links of a small site spread over HOSTS hosts , some links point
+    to pages without links of their own.
+    """
+    rng = random.Random(seed)
+    urls = [START_URL] + [u'http://h{}.example.com/p/{}'.format(host, page)
+                          for host in xrange(HOSTS) for page in xrange(PAGES_PER_HOST)]
+    site = dict()
+    for url in urls:
+        site[url] = [rng.choice(urls) for _ in xrange(LINKS_PER_PAGE)] + \
+                    [u'http://h{}.example.com/leaf/{}'.format(rng.randrange(HOSTS), rng.randrange(100))]
+    return site
+
+
+class MemoryChannel(object):
+    """
+    In-memory stand-in for StreamChannel , messages go through json as on
+    the wire and reach the other end in order after a small random delay.
+    Every message sent is kept in log , in_transit counts the messages not
+    delivered yet on both ends.
+    """
+
+    def __init__(self, rng, in_transit):
+        self.rng = rng
+        self.in_transit = in_transit
+        self.peer = None
+        self.on_message = None
+        self.pending = deque()
+        self.readers = deque()
+        self.last_delivery = 0
+        self.log = []
+
+    @classmethod
+    def pair(cls, rng):
+        in_transit = Counter()
+        first, second = cls(rng, in_transit), cls(rng, in_transit)
+        first.peer, second.peer = second, first
+        return first, second
+
+    def send(self, message):
+        self.log.append(message)
+        data = json.dumps(message)
+        # strictly increasing deadlines keep the order of the messages
+        self.last_delivery = max(self.last_delivery + 1e-6, time.time() + self.rng.uniform(0, 0.005))
+        self.in_transit['messages'] += 1
+        IOLoop.current().add_timeout(self.last_delivery, lambda: self.peer._deliver(json.loads(data)))
+        sent = Future()
+        sent.set_result(None)
+        return sent
+
+    def _deliver(self, message):
+        self.in_transit['messages'] -= 1
+        if self.readers:
+            self.readers.popleft().set_result(message)
+        elif self.on_message is not None:
+            self.on_message(message)
+        else:
+            self.pending.append(message)
+
+    def read(self):
+        message = Future()
+        if self.pending:
+            message.set_result(self.pending.popleft())
+        else:
+            self.readers.append(message)
+        return message
+
+    def listen(self, on_message, on_close=None):
+        self.on_message = on_message
+        while self.pending:
+            on_message(self.pending.popleft())
+
+    def close(self):
+        pass
+
+
+class FakeSpider(object):
+    """
+    The parts of TornadoSpider a Partition drives : links it doesn't own are
+    forwarded , the pages it owns are visited once from the site dict and
+    written to its crawl graph.
+    """
+
+    def __init__(self, site, graph_dir, partition=None):
+        self.site = site
+        self.partition = partition
+        self.scheduler = self
+        self.closed = False
+        self.queue = deque()
+        self.queued = set()
+        self.visited = []
+        self.graph_writer = CrawlGraphWriter(graph_dir)
+        if partition:
+            partition.start(self)
+
+    def is_idle(self):
+        return not self.queue
+
+    def stop(self):
+        self.closed = True
+
+    def _queue_link(self, url, parent_page):
+        if self.partition and not self.partition.owns(url):
+            self.partition.forward(url, parent_page)
+            return False
+        if url in self.queued:
+            return False
+        self.queued.add(url)
+        self.queue.append(PageRecord(url, parent_page, 200, u'text/html', internal=True))
+        return True
+
+    def summary(self):
+        return {'fetch_stats': {'get': len(self.visited), 'links': sum(len(self.site.get(url, []))
+                                                                       for url in self.visited)},
+                'connection_stats': {'requests': len(self.visited)}, 'visited': len(self.visited)}
+
+    @coroutine
+    def crawl(self):
+        if not self.partition or self.partition.owns(START_URL):
+            self._queue_link(START_URL, None)
+        while True:
+            while self.queue and not self.closed:
+                page = self.queue.popleft()
+                self.visited.append(page.url)
+                links = self.site.get(page.url, [])
+                self.graph_writer.write_page(page, links)
+                for link in links:
+                    self._queue_link(link, page)
+                yield gen.moment
+            if not self.partition or self.closed:
+                break
+            yield self.partition.wait_for_work()
+        self.graph_writer.close()
+        if self.partition:
+            yield self.partition.finish(self.summary(), self.graph_writer.graph_file)
+
+
+class DistributedCrawlTest(unittest.TestCase):
+    def setUp(self):
+        self.settings = dict((name, getattr(distributed_crawl, name)) for name in
+                             ('PARTITION_BATCH_SIZE', 'PARTITION_FLUSH_INTERVAL', 'PARTITION_PROBE_INTERVAL'))
+        # small batches and short intervals , so batches are split and in transit when the workers go idle
+        distributed_crawl.PARTITION_BATCH_SIZE = 3
+        distributed_crawl.PARTITION_FLUSH_INTERVAL = 5
+        distributed_crawl.PARTITION_PROBE_INTERVAL = 10
+        self.work_dir = tempfile.mkdtemp(prefix='distributed_crawl_test')
+        self.previous_dir = os.getcwd()
+        os.chdir(self.work_dir)
+        self.io_loop = IOLoop()
+        self.io_loop.make_current()
+        self.io_loop.install()
+
+    def tearDown(self):
+        IOLoop.clear_current()
+        IOLoop.clear_instance()
+        self.io_loop.close(all_fds=True)
+        os.chdir(self.previous_dir)
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+        for name, value in self.settings.items():
+            setattr(distributed_crawl, name, value)
+
+    def _crawl_single(self, site):
+        spider = FakeSpider(site, tempfile.mkdtemp(dir=self.work_dir))
+        self.io_loop.run_sync(spider.crawl)
+        return spider
+
+    def _crawl_distributed(self, site, partition_count, partition_key, seed=1):
+        rng = random.Random(seed)
+        pairs = [MemoryChannel.pair(rng) for _ in xrange(partition_count)]
+        coordinator = Coordinator([coordinator_end for coordinator_end, _ in pairs], START_URL, None, 'get-only',
+                                  report_echo=False, link_graph=False)
+        spiders = []
+        stops = []
+
+        def stop():
+            # ground truth when the coordinator decides the crawl is over
+            stops.append(dict(sent=sum(spider.partition.sent for spider in spiders),
+                              received=sum(spider.partition.received for spider in spiders),
+                              idle=all(spider.is_idle() for spider in spiders),
+                              in_transit=sum(end.in_transit['messages'] for end, _ in pairs)))
+            original_stop()
+
+        original_stop = coordinator.stop
+        coordinator.stop = stop
+
+        @coroutine
+        def start_worker(channel):
+            _, index, count, start_url, sitemap_url = yield channel.read()
+            self.assertEqual((count, start_url), (partition_count, START_URL))
+            spider = FakeSpider(site, tempfile.mkdtemp(dir=self.work_dir),
+                                Partition(index, count, channel, partition_key))
+            spiders.append(spider)
+            yield spider.crawl()
+
+        coordinator.start()
+        for _, worker_end in pairs:
+            start_worker(worker_end)
+        timeout = self.io_loop.add_timeout(time.time() + CRAWL_TIMEOUT, self.io_loop.stop)
+        self.io_loop.start()
+        self.io_loop.remove_timeout(timeout)
+        self.assertEqual(len(coordinator.summaries), partition_count, "the distributed crawl didn't finish")
+        return coordinator, spiders, stops
+
+    def _check_distributed_crawl(self, partition_count, partition_key):
+        site = create_site()
+        single = self._crawl_single(site)
+        coordinator, spiders, stops = self._crawl_distributed(site, partition_count, partition_key)
+
+        # every url is visited once , by the partition owning it
+        visited = [url for spider in spiders for url in spider.visited]
+        self.assertEqual(len(visited), len(set(visited)))
+        for spider in spiders:
+            for url in spider.visited:
+                self.assertEqual(partition_of(url, partition_count, partition_key), spider.partition.index)
+        # a partition forwards a url once , to its owner
+        for spider in spiders:
+            forwarded = [(owner, url) for message in spider.partition.channel.log if message[0] == LINKS
+                         for owner in [message[1]] for url, _ in message[2]]
+            self.assertEqual(len(forwarded), len(set(forwarded)))
+            for owner, url in forwarded:
+                self.assertNotEqual(owner, spider.partition.index)
+                self.assertEqual(owner, partition_of(url, partition_count, partition_key))
+
+        # stopped once , when every batch sent had been received and nothing was left to crawl
+        self.assertEqual(len(stops), 1)
+        self.assertEqual(stops[0]['sent'], stops[0]['received'])
+        if partition_count > 1:
+            self.assertTrue(stops[0]['sent'])
+        self.assertTrue(stops[0]['idle'])
+        self.assertEqual(stops[0]['in_transit'], 0)
+
+        # the merged results are those of a single process crawl
+        self.assertEqual(sorted(visited), sorted(single.visited))
+        merged = dict((record.url, sorted(data['links'])) for record, data in read_crawl_graph(CRAWL_GRAPH_FILE))
+        self.assertEqual(merged, dict((url, sorted(site.get(url, []))) for url in single.visited))
+        fetch_stats, connection_stats = coordinator.merged_stats()
+        summary = single.summary()
+        self.assertEqual(fetch_stats, Counter(summary['fetch_stats']))
+        self.assertEqual(connection_stats, Counter(summary['connection_stats']))
+        self.assertEqual(sum(summary['visited'] for summary in coordinator.summaries.values()),
+                         len(single.visited))
+
+    def test_host_partitions(self):
+        self._check_distributed_crawl(3, 'host')
+
+    def test_url_partitions(self):
+        self._check_distributed_crawl(4, 'url')
+
+    def test_single_partition(self):
+        self._check_distributed_crawl(1, 'host')
+
+
+class TerminationTest(unittest.TestCase):
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp(prefix='distributed_crawl_test')
+        self.previous_dir = os.getcwd()
+        os.chdir(self.work_dir)
+        rng = random.Random(1)
+        self.coordinator = Coordinator([MemoryChannel.pair(rng)[0] for _ in xrange(2)], START_URL, None,
+                                       'get-only', report_echo=False, link_graph=False)
+        self.stopped = []
+        self.coordinator.stop = lambda: self.stopped.append(True)
+
+    def tearDown(self):
+        os.chdir(self.previous_dir)
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+
+    def _probe(self, *replies):
+        self.coordinator.replies = dict(enumerate(replies))
+        self.coordinator._check_termination()
+        return bool(self.stopped)
+
+    def test_stops_after_two_balanced_probes(self):
+        self.assertFalse(self._probe((True, 2, 1), (True, 1, 2)))
+        self.assertTrue(self._probe((True, 2, 1), (True, 1, 2)))
+
+    def test_unbalanced_counts_keep_the_crawl_going(self):
+        # a batch is in transit
+        for _ in xrange(3):
+            self.assertFalse(self._probe((True, 3, 1), (True, 1, 2)))
+
+    def test_counts_must_not_change_between_probes(self):
+        self.assertFalse(self._probe((True, 1, 1), (True, 1, 1)))
+        self.assertFalse(self._probe((True, 2, 1), (True, 1, 2)))
+        self.assertTrue(self._probe((True, 2, 1), (True, 1, 2)))
+
+    def test_busy_partition_keeps_the_crawl_going(self):
+        self.assertFalse(self._probe((True, 1, 1), (False, 1, 1)))
+        self.assertFalse(self._probe((True, 1, 1), (True, 1, 1)))
+        self.assertTrue(self._probe((True, 1, 1), (True, 1, 1)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,12 +1,19 @@
 import logging
+import posixpath
+import time
 import urlparse
 
-from lxml import html
+import pycurl
+from tornado import httputil
+from tornado.curl_httpclient import _curl_header_callback
+from tornado.escape import native_str
 from tornado.gen import coroutine, Return
-from tornado.httpclient import AsyncHTTPClient, HTTPRequest, HTTPError
+from tornado.httpclient import HTTPRequest, HTTPError
 
-from config import PAGE_TIMEOUT
-from util import decode_to_unicode, obtain_domain_with_subdomain_for_page
+from config import PAGE_TIMEOUT, BACKOFF_STATUS_CODES, MAX_RETRIES_PER_PAGE, NON_HTML_EXTENSIONS, \
+    CHECK_PAGE_RESOURCES
+from link_parser import format_link, StreamingLinkExtractor
+from util import decode_to_unicode, parse_retry_after
 from web_page import WebPage
 
 
@@ -20,32 +27,83 @@ tornado_logger = logging.getLogger('tornado.general')
 tornado_logger.setLevel(logging.DEBUG)
 tornado_logger.addHandler(logging.FileHandler('tornado-requests.log', mode='w'))
 
+FETCH_HEAD_THEN_GET = 'head-then-get'
+FETCH_GET_ONLY = 'get-only'
+FETCH_HEURISTIC = 'heuristic'
+FETCH_STRATEGIES = [FETCH_HEAD_THEN_GET, FETCH_GET_ONLY, FETCH_HEURISTIC]
+
+
+def format_fetch_stats(fetch_strategy, fetch_stats):
+    return ("Fetch strategy {} : HEAD requests {} , GET requests {} , HEAD requests saved {} , "
+            "GET bodies aborted {}\n".format(fetch_strategy, fetch_stats['head_requests'], fetch_stats['get_requests'],
+                                             fetch_stats['head_requests_saved'], fetch_stats['bodies_aborted']))
+
 
 class TornadoClientPage(WebPage):
+    __slots__ = ('spider', 'aborted_response', 'link_extractor')
+
     def process(self, spider):
         logger.debug("Called {} for {}".format('process', self.encoded_url))
         self.spider = spider
+        self.aborted_response = None
+        self.link_extractor = None
+
+    @coroutine
+    def fetch(self):
+        if self._fetch_strategy() == FETCH_GET_ONLY:
+            response = yield self._make_get_request(html_only=True)
+            raise Return(self._process_get_only_response(response))
+
+        response = yield self.make_head_request()
+        get_response = yield self._process_head_response(response)
+        raise Return(get_response)
+
+    def _fetch_strategy(self):
+        strategy = self.spider.fetch_strategy
+        if strategy == FETCH_HEAD_THEN_GET or self.check_only or not self.is_page_internal():
+            return FETCH_HEAD_THEN_GET
+        if strategy == FETCH_HEURISTIC:
+            extension = posixpath.splitext(urlparse.urlsplit(self.url).path)[1].lower()
+            strategy = FETCH_HEAD_THEN_GET if extension in NON_HTML_EXTENSIONS else FETCH_GET_ONLY
+            self.spider.fetch_stats['heuristic_' + strategy] += 1
+        return strategy
 
     @coroutine
     def make_head_request(self):
         logger.debug("Called %s for %s " % ('make_head_request', self.encoded_url))
+        self.spider.fetch_stats['head_requests'] += 1
         request = HTTPRequest(method='HEAD', url=self.url, request_timeout=PAGE_TIMEOUT, follow_redirects=True,
                               headers={"User-Agent": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/535.1 "
                                                      "(KHTML, like Gecko) Chrome/13.0.782.220 Safari/535.1"},
                               max_redirects=10)
         try:
-            response = yield AsyncHTTPClient().fetch(request)
+            response = yield self.spider.http_client.fetch(request)
 
         except HTTPError as ex:
             logger.debug(
                 u"Error processing head request for : %s with error : %s  " % (self.encoded_url, str(ex.message)))
-            self.response_code = ex.code
-            self.failure_message = decode_to_unicode(ex.message)
-            self.finalize_process(self.spider)
+            self._handle_fetch_error(ex)
             raise Return(None)
 
         raise Return(response)
 
+    def _handle_fetch_error(self, ex):
+        response = getattr(ex, 'response', None)
+        retry_after = parse_retry_after(response.headers.get('Retry-After')) if response else None
+        self._handle_failure(getattr(ex, 'code', -1), ex.message, retry_after)
+
+    def _handle_failure(self, response_code, message, retry_after=None):
+        self.response_code = response_code
+        self.failure_message = decode_to_unicode(message)
+        self.retry_after = retry_after
+
+        if self.response_code in BACKOFF_STATUS_CODES and self.retry_count < MAX_RETRIES_PER_PAGE:
+            logger.debug(u"Retry requested for {} after response code {}".format(self.encoded_url,
+                                                                                 self.response_code))
+            self.retry_requested = True
+        else:
+            self.finalize_process(self.spider)
+
     @coroutine
     def _process_head_response(self, response):
         if response:
@@ -54,7 +112,7 @@ class TornadoClientPage(WebPage):
             self.response_code = response.code
             self.content_type = u"".join(response.headers.get('Content-Type', ''))
             effective_url = response.effective_url if response.effective_url else self.url
-            if self.is_page_internal(effective_url) and u'text/html' in self.content_type:
+            if self.is_page_internal(effective_url) and u'text/html' in self.content_type and not self.check_only:
                 get_response = yield self._make_get_request()
                 raise Return(get_response)
             else:
@@ -64,25 +122,118 @@ class TornadoClientPage(WebPage):
 
 
     @coroutine
-    def _make_get_request(self):
+    def _make_get_request(self, html_only=False):
         logger.debug(u"Called {} for {} ".format('_make_get_request', self.encoded_url))
+        self.spider.fetch_stats['get_requests'] += 1
+
+        headers = {"User-Agent": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/535.1 "
+                                 "(KHTML, like Gecko) Chrome/13.0.782.220 Safari/535.1"}
+        cached = self.spider.response_cache.get(self.key) if self.spider.response_cache else None
+        if cached:
+            if cached.etag:
+                headers["If-None-Match"] = cached.etag
+            if cached.last_modified:
+                headers["If-Modified-Since"] = cached.last_modified
+
+        if self.spider.link_extractor_type == 'streaming':
+            self.link_extractor = StreamingLinkExtractor(self.url)
 
         request = HTTPRequest(method='GET', url=self.url, request_timeout=PAGE_TIMEOUT, follow_redirects=True,
-                              headers={"User-Agent": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/535.1 "
-                                                     "(KHTML, like Gecko) Chrome/13.0.782.220 Safari/535.1"},
-                              max_redirects=10)
+                              headers=headers, max_redirects=10,
+                              prepare_curl_callback=self._abort_non_html_body if html_only else None,
+                              streaming_callback=self.link_extractor.feed if self.link_extractor else None)
         try:
-            response = yield AsyncHTTPClient().fetch(request)
+            response = yield self.spider.http_client.fetch(request)
         except Exception as ex:
+            if self.aborted_response:
+                self._process_aborted_response()
+                raise Return(None)
+            if cached and getattr(ex, 'code', None) == 304:
+                if html_only:
+                    self.spider.fetch_stats['head_requests_saved'] += 1
+                self._process_not_modified_response(cached)
+                raise Return(None)
             logger.debug(
                 u"Error processing get request for : %s with error : %s  " % (self.encoded_url, str(ex.message)))
-            self.response_code = ex.code
-            self.failure_message = decode_to_unicode(ex.message)
-            self.finalize_process(self.spider)
+            self._handle_fetch_error(ex)
             raise Return(None)
 
         raise Return(response)
 
+    def _process_not_modified_response(self, cached):
+        logger.debug(u"Reusing cached links for not modified page {}".format(self.encoded_url))
+        self.spider.fetch_stats['not_modified'] += 1
+        self.response_code = cached.response_code
+        self.content_type = cached.content_type
+        self.links.update(cached.links)
+        self.hardcoded_urls.update(cached.hardcoded_urls)
+        self.finalize_process(self.spider)
+
+    def _cache_response(self, response):
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+        if self.spider.response_cache and (etag or last_modified):
+            self.spider.response_cache.store(self.key, etag, last_modified, self.response_code, self.content_type,
+                                             self.links, self.hardcoded_urls)
+
+    def _abort_non_html_body(self, curl):
+        """
+        Replaces the curl write function so the transfer is aborted as soon as
+        the final response turns out to be an error or not html.
+        """
+        sink = curl.info['request'].streaming_callback or curl.info['buffer'].write
+        headers = curl.info['headers']
+        status = {'code': 0}
+
+        # curl doesn't allow getinfo while the transfer runs, so the status line is picked up here
+        def header(line):
+            line = native_str(line)
+            if line.startswith('HTTP/'):
+                try:
+                    status['code'] = httputil.parse_response_start_line(line.strip()).code
+                except httputil.HTTPInputError:
+                    pass
+            _curl_header_callback(headers, line)
+
+        def write(chunk):
+            code = status['code']
+            if 300 <= code < 400:
+                return None
+            content_type = headers.get('Content-Type', '')
+            if code >= 400 or 'text/html' not in content_type:
+                self.aborted_response = (code, decode_to_unicode(content_type), headers.get('X-Http-Reason', ''),
+                                         headers.get('Retry-After'))
+                return 0
+            sink(chunk)
+
+        curl.setopt(pycurl.HEADERFUNCTION, header)
+        curl.setopt(pycurl.WRITEFUNCTION, write)
+
+    def _process_aborted_response(self):
+        code, content_type, reason, retry_after = self.aborted_response
+        logger.debug(u"Aborted get request for {} with code {} and content type {}".format(self.encoded_url, code,
+                                                                                           content_type))
+        self.spider.fetch_stats['bodies_aborted'] += 1
+        self.content_type = content_type
+        if code >= 400:
+            self._handle_failure(code, u"HTTP {}: {}".format(code, reason), parse_retry_after(retry_after))
+        else:
+            self.response_code = code
+            self.finalize_process(self.spider)
+
+    def _process_get_only_response(self, response):
+        if not response:
+            return None
+        self.spider.fetch_stats['head_requests_saved'] += 1
+        self.response_code = response.code
+        self.content_type = u"".join(response.headers.get('Content-Type', ''))
+        effective_url = response.effective_url if response.effective_url else self.url
+        if self.is_page_internal(effective_url):
+            return response
+        self.finalize_process(self.spider)
+        return None
+
+    @coroutine
     def process_get_response(self, response):
         logger.debug(u"Called {} for {} ".format('process_get_response', self.encoded_url))
 
@@ -91,37 +242,32 @@ class TornadoClientPage(WebPage):
                          % (self.encoded_url, response.error, response.reason))
             self.failure_message = response.reason
         else:
-            html_source = response.body
-            html_source = decode_to_unicode(html_source)
             if self.is_page_internal():
-                dom = html.fromstring(html_source)
-                # logger.debug("obtained dom object for {}".format(encoded_url))
+                if self.link_extractor:
+                    extracted_links, resources = self.link_extractor.close()
+                    parse_time = self.link_extractor.parse_time
+                else:
+                    started = time.time()
+                    extracted_links, resources = yield self.spider.link_parser.parse(self.url, response.body)
+                    # includes the wait for a parser slot , which is what slows the page down
+                    parse_time = time.time() - started
+                self.spider.metrics.observe('parse', parse_time)
 
-                link_count = 0
-                for href_value in dom.xpath('//a/@href'):
-                    href_value = decode_to_unicode(href_value)
+                for href_value, link in extracted_links:
                     logger.debug(u"Entering for loop for for {} with href {}".format(self.encoded_url, href_value))
                     self._process_hardcoded_url(href_value)
-                    link = self._format_link(href_value)
                     logger.debug(u"obtained link  object{} for {}".format(link, self.encoded_url))
-
                     if link:
-                        parsed_link = obtain_domain_with_subdomain_for_page(link)
-
-                        if parsed_link not in self.domains_to_skip:
-                            link_page = TornadoClientPage(link, self, self.base_site, self.base_domain,
-                                                          self.domains_to_skip)
-                            self.links.add(link_page)
-                            link_page.parent = self
-                            link_count += 1
+                        self._add_link(link)
+                if CHECK_PAGE_RESOURCES:
+                    for resource in resources:
+                        self._add_link(resource)
+                self._cache_response(response)
         self.finalize_process(self.spider)
 
+    def _add_link(self, link):
+        if not self.host_classifier.is_skipped(link, check_segments=False):
+            self.links.add(link)
+
     def _format_link(self, href_value):
-        href_value = decode_to_unicode(href_value.strip())
-        if href_value.startswith('#'):
-            link = self.url
-        else:
-            href_value = href_value.replace("..", "") if href_value.startswith("..") else href_value
-            link = urlparse.urljoin(self.url, href_value, allow_fragments=False)
-            link = link if 'javascript:void' not in href_value and not href_value.startswith('mailto') else None
-        return decode_to_unicode(link)
+        return format_link(self.url, href_value)
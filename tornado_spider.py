@@ -1,20 +1,35 @@
 import argparse
 import logging
+import os
+import signal
 import sys
 import time
+from collections import Counter
 
-from lxml import objectify
 from tornado.gen import coroutine
-from tornado.httpclient import HTTPClient
 from tornado.ioloop import IOLoop
-from toro import JoinableQueue, BoundedSemaphore, Lock
 
 from config import DOMAINS_TO_BE_SKIPPED, START_URL, \
-    IMPLEMENTATION_CLIENT, MAX_CONCURRENT_REQUESTS_PER_SERVER
-from resource_issue_detector import detect_js_and_resource_issues
-from tornado_client_page import TornadoClientPage
-from util import print_pages_with_errors, print_pages_with_hardcoded_links, print_pages_to_file, extract_domain, \
-    extract_base_site, decode_to_unicode
+    IMPLEMENTATION_CLIENT, MAX_CONCURRENT_REQUESTS_PER_SERVER, FRONTIER_BATCH_SIZE, FRONTIER_LOW_WATERMARK, \
+    SEEN_SET_MODE, FETCH_STRATEGY, PARSER_POOL_TYPE, LINK_EXTRACTOR, REPORT_FORMAT, REPORT_ECHO, \
+    LINK_GRAPH
+from crawl_graph import CrawlGraphWriter, IncrementalCrawl
+from crawl_metrics import CrawlMetrics, MetricsReporter
+from crawl_report import CrawlReport, REPORT_FORMATS
+from crawl_state import CrawlState, PageRecord, VISITED
+from distributed_crawl import run_local, run_coordinator, run_remote_worker, partition_dir
+from frontier import FrontierEntry, create_seen_set
+from host_info import host_cache_stats
+from host_scheduler import HostScheduler
+from http_client import create_http_client, format_connection_stats
+from link_graph import LinkGraph
+from link_parser import LinkParserPool, PARSER_POOL_TYPES, LINK_EXTRACTORS
+from resource_issue_detector import detect_js_and_resource_issues, BrowserCheckStage
+from response_cache import ResponseCache
+from sitemap_loader import SitemapLoader
+from tornado_client_page import TornadoClientPage, FETCH_STRATEGIES, format_fetch_stats
+from url_canonicalizer import canonicalize_url
+from util import extract_domain, extract_base_site, decode_to_unicode, is_html_page
 from web_page import WebPage
 
 
@@ -34,155 +49,300 @@ def _get_client_page(*args):
 
 
 class TornadoSpider:
-    def __init__(self, start_url, sitemap_url=None, max_concurrent_connections=MAX_CONCURRENT_REQUESTS_PER_SERVER):
-
-        self.visited_urls = set()
+    def __init__(self, start_url, sitemap_url=None, max_concurrent_connections=MAX_CONCURRENT_REQUESTS_PER_SERVER,
+                 state_dir=None, seen_set_mode=SEEN_SET_MODE, fetch_strategy=FETCH_STRATEGY, response_cache=None,
+                 since=None, parser_pool_type=PARSER_POOL_TYPE, link_extractor_type=LINK_EXTRACTOR,
+                 partition=None, check_pages=False, report_format=REPORT_FORMAT, report_echo=REPORT_ECHO,
+                 metrics_port=None, link_graph=LINK_GRAPH):
+
+        # canonical keys ( their fingerprints unless the seen set is exact , a bloom filter could skip a page
+        # twice ) , the pages themselves only live in the report buckets they fall in
+        self.visited_keys = create_seen_set('exact' if seen_set_mode == 'exact' else 'fingerprint')
         self.intermediate_urls = set()
         self.base_domain = extract_domain(start_url)
         self.base_site = extract_base_site(start_url)
         self.base_page = _get_client_page(start_url, None, start_url, self.base_domain, DOMAINS_TO_BE_SKIPPED)
-        self.non_visited_urls = {self.base_page}
-        self.added_count = 1
-        self.idle_ping = 0
-        self.start_idle_counter = False
+        self.seen = create_seen_set(seen_set_mode)
+        self.added_count = 0
         self.sitemap_url = u'{}/sitemap.xml'.format(self.base_site) if not sitemap_url else sitemap_url
         self.max_concurrent_connections = max_concurrent_connections
-
-        self.page_queue = JoinableQueue()
-        self.semaphore = BoundedSemaphore(self.max_concurrent_connections)
+        self.fetch_strategy = fetch_strategy
+        self.fetch_stats = Counter()
+        self.response_cache = ResponseCache(response_cache) if response_cache else None
+        self.link_parser = LinkParserPool(parser_pool_type)
+        self.link_extractor_type = link_extractor_type
+
+        self.scheduler = HostScheduler(self.max_concurrent_connections)
+        self.http_client = create_http_client(self.max_concurrent_connections)
+        self.metrics = CrawlMetrics()
+        self.http_client.metrics = self.metrics
+        self.metrics.add_gauge('queue_depth', 'Pages queued in the scheduler.', lambda: self.scheduler.qsize())
+        self.metrics.add_gauge('in_flight', 'Pages being fetched.', lambda: self.scheduler.in_flight)
+        self.metrics.add_gauge('hosts', 'Hosts seen by the scheduler.', lambda: len(self.scheduler.hosts))
+        self.metrics.add_gauge('parses_pending', 'Pages waiting for or in the parser pool.',
+                               lambda: self.link_parser.pending)
+        self.metrics_reporter = MetricsReporter(self.metrics, metrics_port)
         self.start = time.time()
         self.skip_count = 0
-
+        self.visited_count = 0
+        self.state = CrawlState(state_dir) if state_dir else None
+        if self.state:
+            self.visited_count = self.state.count(VISITED)
+            self.added_count = self.state.count()
+        self.incremental = IncrementalCrawl(since) if since else None
+        self.graph_writer = CrawlGraphWriter(append=self.visited_count > 0)
+        self.link_graph = LinkGraph(self.base_page.url) if link_graph else None
+        if self.link_graph is not None and self.visited_count and os.path.exists(self.graph_writer.temp_file):
+            # links of the pages visited before the crawl was interrupted , the writer copies back the graph of a
+            # crawl that drained and moved it in place
+            self.link_graph.add_crawl_graph(self.graph_writer.temp_file)
+        self.report = CrawlReport(report_format, report_echo, self.link_graph)
+        if self.visited_count:
+            # pages visited before the crawl was interrupted
+            for record in self.state.visited_pages():
+                self.report.add(record)
+        self.partition = partition
+        if self.partition:
+            self.partition.start(self)
+        # pages are checked in the browsers while the crawl goes on
+        self.browser_checks = BrowserCheckStage(IOLoop.instance()) if check_pages else None
 
     @coroutine
     def initiate_crawl(self):
-        self.non_visited_urls.add(self.base_page)
-        self.add_sitemap_urls(self.base_page)
-        self.page_queue.put(self.base_page)
-        self._crawl_web_page()
-        yield self.page_queue.join()
+        self.metrics_reporter.start()
+        if self.browser_checks:
+            self.browser_checks.start()
+        if not self.partition or self.partition.owns(self.base_page.url):
+            self._queue_entry(self.base_page)
+        sitemap_loading = self.add_sitemap_urls(self.base_page)
+        if self.incremental:
+            # sitemap lastmod decides which known pages get their links followed , needed before crawling
+            yield sitemap_loading
+            for record in self.incremental.broken_pages:
+                self._queue_link(record.url, record.parent)
+        if self.state:
+            self._refill_frontier()
+        workers = [self._crawl_web_page() for _ in xrange(self.max_concurrent_connections)]
+        yield sitemap_loading
+        while True:
+            yield self.scheduler.join()
+            # pages queued in the state db only reach the scheduler through refills
+            if self.state and not self.scheduler.closed:
+                self._refill_frontier()
+            if not self.scheduler.is_idle():
+                continue
+            if not self.partition or self.scheduler.closed:
+                break
+            # other partitions may still forward links until the coordinator stops the crawl
+            yield self.partition.wait_for_work()
+        self.scheduler.close()
+        yield workers
+        yield self.wrap_up()
 
     @coroutine
     def _crawl_web_page(self):
         while True:
-            if len(self.intermediate_urls) < 5 and self.start_idle_counter:
-                print("Unprocessed urls : ")
-                for page in self.intermediate_urls:
-                    print(u'>>>>>> %s ' % page.encoded_url)
-            # print("Available Semaphore %s" % self.semaphore.counter)
-            yield self.semaphore.acquire()
-            # print("0.Issued Semaphore %s  " % (self.semaphore.counter+1))
-            self._fetch_page(self.semaphore.counter + 1)
-            if len(self.intermediate_urls) < 5 and self.start_idle_counter:
-                print("Unprocessed urls : ")
-                for page in self.intermediate_urls:
-                    print(u'>> %s ' % page.encoded_url)
-                self.wrap_up()
+            entry = yield self.scheduler.get()
+            if entry is None:
+                return
+            yield self._fetch_page(entry)
+            if self.browser_checks:
+                yield self.browser_checks.wait_for_room()
+
+    def stop(self):
+        """
+        Stops handing out pages, the crawl wraps up once the pages in flight
+        are done. Pages still queued stay queued in the state db, if any.
+        """
+        if self.scheduler.closed:
+            return
+        if self.scheduler.in_flight:
+            print("Stopping , waiting for {} pages in flight ( interrupt again to abort )".format(
+                self.scheduler.in_flight))
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+        self.scheduler.close()
+
+    def _page_for(self, entry):
+        page = entry if isinstance(entry, WebPage) else \
+            _get_client_page(entry.url, entry.parent, self.base_site, self.base_domain, DOMAINS_TO_BE_SKIPPED)
+        if self.incremental:
+            page.check_only = not self.incremental.should_follow_links(page.key)
+        return page
 
     @coroutine
-    def _fetch_page(self, semaphore_count):
+    def _fetch_page(self, entry):
+        page = self._page_for(entry)
         try:
-            page = yield self.page_queue.get()
-            if page in self.visited_urls or page in self.intermediate_urls:
+            if page.key in self.visited_keys or page in self.intermediate_urls:
                 return
             if page.skip_page():
                 self.skip_count += 1
+                if self.state:
+                    self.state.mark_skipped(page)
                 logger.debug("Skipped {} " % page.url)
                 return
 
             logger.debug(
-                u"1.Sempahore in use> %s int.count %s for %s" % (semaphore_count, len(self.intermediate_urls),
-                                                                 page.encoded_url))
+                u"1.Requests in flight> %s int.count %s for %s" % (self.scheduler.in_flight,
+                                                                   len(self.intermediate_urls), page.encoded_url))
             self.intermediate_urls.add(page)
             page.process(self)
-            response = yield page.make_head_request()
-            get_response = yield page._process_head_response(response)
+            get_response = yield page.fetch()
             if get_response:
-                page.process_get_response(get_response)
-            print(
-                u"Total urls added :  {} , Total urls visited : {} , Total urls in process : {} Skipped : {},"
-                u" semaphore used : {} " \
-                .format(self.added_count, len(self.visited_urls), len(self.intermediate_urls), self.skip_count,
-                        semaphore_count))
-
+                yield page.process_get_response(get_response)
             logger.debug(
                 u"Total urls added :  {} , Total urls visited : {} , Total urls in process : {} Skipped : {}, "
-                u"semaphore {}"
-                .format(self.added_count, len(self.visited_urls), len(self.intermediate_urls), self.skip_count,
-                        self.semaphore.counter))
+                u"in flight {} , hosts : {}"
+                .format(self.added_count, self.visited_count, len(self.intermediate_urls), self.skip_count,
+                        self.scheduler.in_flight, len(self.scheduler.hosts)))
         except Exception as ex:
             logger.debug(ex)
         finally:
-            self.page_queue.task_done()
-            self.semaphore.release()
+            retry = page.retry_requested
+            if retry:
+                self.intermediate_urls.discard(page)
+                page.retry_requested = False
+                page.retry_count += 1
+            if self.state:
+                self._refill_frontier()
+            self.scheduler.task_done(page, page.retry_after, requeue=retry)
             logger.debug(
-                u"2.Sempahore returned>> %s  available %s after %s" % (semaphore_count, self.semaphore.counter,
-                                                                       page.encoded_url))
-
-    def _filter_visited_links(self, page):
-        return page not in self.visited_urls and page not in self.intermediate_urls and page not in self.non_visited_urls
+                u"2.Request finished>> in flight %s after %s" % (self.scheduler.in_flight, page.encoded_url))
 
+    @coroutine
     def add_sitemap_urls(self, parent_page):
+        if self.partition and not self.partition.is_leader:
+            return
         logger.debug("Adding sitemap urls as well for processing")
-        http_client = HTTPClient()
-        try:
-            response = http_client.fetch(self.sitemap_url)
-            val = bytes(response.body)
-            root = objectify.fromstring(val)
-
-            for url_element in root.url:
-                page = _get_client_page(decode_to_unicode(url_element.loc.text), parent_page, self.base_site,
-                                        self.base_domain, DOMAINS_TO_BE_SKIPPED)
-                if page not in self.visited_urls and page not in self.non_visited_urls \
-                        and page not in self.intermediate_urls:
-                    print(u"Added {}".format(url_element.loc))
-                    self.non_visited_urls.add(page)
-                    self.added_count += 1
-                    self.page_queue.put(page)
-
-        except Exception as e:
-            logger.error(u"Error adding sitemap urls from %s " % self.sitemap_url)
-        finally:
-            http_client.close()
-
-    def _get_unique_non_visited_links(self, page):
-        l = Lock()
-        l.acquire()
-        filtered_links = set(filter(self._filter_visited_links, page.links))
-        l.release()
-        return filtered_links
+        loader = SitemapLoader(self.http_client, lambda url, last_modified:
+                               self._add_sitemap_url(url, last_modified, parent_page))
+        yield loader.load(self.sitemap_url)
+        logger.debug(u"Read {} urls from {} sitemaps".format(loader.url_count, len(loader.loaded_sitemaps)))
+
+    def _add_sitemap_url(self, url, last_modified, parent_page):
+        if self.incremental:
+            key = canonicalize_url(url)
+            if not self.incremental.is_changed(key, last_modified):
+                return
+            self.incremental.mark_changed(key)
+        if self._queue_link(url, parent_page):
+            print(u"Added {}".format(url))
+            if self.state:
+                self._refill_frontier()
+
+    def _queue_link(self, url, parent_page, key=None):
+        if self.partition and not self.partition.owns(url):
+            self.partition.forward(url, parent_page)
+            return False
+        return self._queue_entry(FrontierEntry(url, key or canonicalize_url(url), parent_page))
+
+    def _queue_entry(self, entry):
+        if self.state:
+            if not self.state.add_page(entry):
+                return False
+        else:
+            if not self.seen.add(entry.key):
+                return False
+            self.scheduler.put(entry)
+        self.added_count += 1
+        return True
+
+    def _refill_frontier(self):
+        if self.scheduler.qsize() >= FRONTIER_LOW_WATERMARK:
+            return
+        for url_key, url, parent_url in self.state.load_queued(FRONTIER_BATCH_SIZE):
+            parent = PageRecord(parent_url) if parent_url else None
+            self.scheduler.put(FrontierEntry(url, url_key, parent))
 
     def process_web_page(self, web_page):
         logger.debug(u"Called {} for {}".format('process_web_page', unicode(web_page.url).encode("utf-8")))
         logger.debug(u"Removing %s " % web_page.url)
-        self.visited_urls.add(web_page)
-        self.non_visited_urls.discard(web_page)
+        self.visited_count += 1
         self.intermediate_urls.discard(web_page)
-        unique_pages = self._get_unique_non_visited_links(web_page)
-
-        for page in unique_pages:
-            if page not in self.non_visited_urls:
-                self.non_visited_urls.add(page)
-                self.page_queue.put(page)
-                self.added_count += 1
-                logger.debug("Added link-url %s " % page.encoded_url)
-
-        self.start_idle_counter = True
+        if self.state:
+            self.state.mark_visited(web_page)
+        else:
+            self.visited_keys.add(web_page.key)
+        if web_page.check_only:
+            # only the status was fetched , the page is reported with its previous links once the crawl is done
+            self.incremental.mark_checked(web_page)
+            self.metrics.record_page(web_page.host_classifier.classify(web_page.url).host, web_page.response_code)
+            return
+
+        self.graph_writer.write_page(web_page, web_page.links)
+        links = [(link, canonicalize_url(link)) for link in web_page.links]
+        if self.link_graph is not None:
+            self.link_graph.add_page(web_page.url, links, web_page.key)
+        self.report.add(web_page)
+        self.metrics.record_page(web_page.host_classifier.classify(web_page.url).host, web_page.response_code)
+        if self.browser_checks and is_html_page(web_page):
+            self.browser_checks.submit(web_page.url)
+        if self.incremental:
+            self.incremental.rechecked_keys.add(web_page.key)
+
+        for link, key in links:
+            if self._queue_link(link, web_page, key):
+                logger.debug(u"Added link-url %s " % link)
+        web_page.links.clear()
 
+    @coroutine
     def wrap_up(self):
+        if self.state:
+            self.state.commit()
+        if self.response_cache:
+            self.response_cache.commit()
+        self.link_parser.shutdown()
+        self.metrics_reporter.stop()
         self.print_stats()
+        if self.browser_checks:
+            if self.browser_checks.pending:
+                print("Waiting for the browser checks of {} pages".format(self.browser_checks.pending))
+            yield self.browser_checks.wait_for_checks()
+            self.browser_checks.close()
+            print(self.browser_checks.summary())
+        if self.partition:
+            yield self.partition.finish({'fetch_stats': dict(self.fetch_stats),
+                                         'connection_stats': dict(self.http_client.stats),
+                                         'visited': self.visited_count})
         IOLoop.instance().stop()
-        print('Done crawling in %d seconds, fetched %s URLs.' % (time.time() - self.start, len(self.visited_urls)))
+        print('Done crawling in %d seconds, fetched %s URLs.' % (time.time() - self.start, self.visited_count))
+
+    def close(self):
+        if self.browser_checks:
+            # an interrupted crawl doesn't wait for the pages still queued
+            self.browser_checks.close(abort=True)
+        self.http_client.close()
+        if self.state:
+            self.state.close()
+        if self.response_cache:
+            self.response_cache.close()
 
     def print_stats(self):
-        print_pages_with_errors(True, self.visited_urls, "broken_external_links.txt")
-        print_pages_with_errors(False, self.visited_urls, "broken_internal_links.txt")
-        print_pages_with_hardcoded_links(self.visited_urls, "hardcoded_url_links.txt")
-
-        print("\nTotal pages visited : {}\n".format(len(self.visited_urls)))
-
-        print_pages_to_file("all_internal_pages.txt", False, self.visited_urls)
-        print_pages_to_file("all_external_pages.txt", True, self.visited_urls)
+        if self.incremental:
+            print("\nRe-checked {} pages changed since the previous run , the status of {} more\n".format(
+                len(self.incremental.rechecked_keys), len(self.incremental.checked_pages)))
+            for record, data, line in self.incremental.carried_over_pages():
+                self.report.add(record)
+                self.graph_writer.write_line(line)
+                if self.link_graph is not None:
+                    self.link_graph.add_page_urls(record.url, data.get('links', []))
+                if self.browser_checks and is_html_page(record):
+                    self.browser_checks.submit(record.url)
+        self.graph_writer.close()
+        if self.link_graph is not None:
+            self.link_graph.save()
+        self.report.write()
+
+        print(format_fetch_stats(self.fetch_strategy, self.fetch_stats))
+        print(format_connection_stats(self.http_client.stats))
+        print(self.metrics.summary_line() + '\n')
+        if self.link_graph is not None:
+            print(self.link_graph.summary())
+        for name, stats in sorted(host_cache_stats().items()):
+            print("Host cache {} : {} hosts , {} lookups , hit rate {:.1%}".format(
+                name, stats['size'], stats['hits'] + stats['misses'], stats['hit_rate']))
+        if self.response_cache:
+            print("Pages not modified since the last crawl : {}\n".format(self.fetch_stats['not_modified']))
 
 
 def process_parameters():
@@ -193,8 +353,44 @@ def process_parameters():
     parser.add_argument('--jserrors', dest='testjs', action='store_true')
     parser.add_argument('--no-jserrors', dest='testjs', action='store_false')
     parser.add_argument('--process-exisitng-urls', dest='process_file', action='store')
-    parser.set_defaults(testjs=False)
-    return parser.parse_args()
+    parser.add_argument("--state-dir", dest="state_dir",
+                        help="directory to keep the crawl frontier in, an interrupted crawl is resumed from it")
+    parser.add_argument("--seen-set", dest="seen_set", choices=['exact', 'fingerprint', 'bloom'],
+                        default=SEEN_SET_MODE, help="how already seen urls are remembered")
+    parser.add_argument("--fetch-strategy", dest="fetch_strategy", choices=FETCH_STRATEGIES, default=FETCH_STRATEGY,
+                        help="how internal pages are fetched")
+    parser.add_argument("--response-cache", dest="response_cache",
+                        help="file caching ETag / Last-Modified and links of pages for conditional requests")
+    parser.add_argument("--since", dest="since",
+                        help="directory ( or crawl_graph.jsonl ) of a previous run , only pages changed since then "
+                             "are crawled")
+    parser.add_argument("--parser-pool", dest="parser_pool", choices=PARSER_POOL_TYPES, default=PARSER_POOL_TYPE,
+                        help="where html pages are parsed for links")
+    parser.add_argument("--link-extractor", dest="link_extractor", choices=LINK_EXTRACTORS, default=LINK_EXTRACTOR,
+                        help="parse pages into a tree after download or stream the body through the parser")
+    parser.add_argument("--partitions", dest="partitions", type=int,
+                        help="crawl with this many worker processes , urls are partitioned between them")
+    parser.add_argument("--listen", dest="listen", type=int,
+                        help="with --partitions , wait on this port for workers started elsewhere with --join")
+    parser.add_argument("--join", dest="join", help="host:port of a coordinator to crawl a partition for")
+    parser.add_argument("--report-format", dest="report_format", choices=REPORT_FORMATS, default=REPORT_FORMAT,
+                        help="format of the broken and hardcoded link reports")
+    parser.add_argument('--report-echo', dest='report_echo', action='store_true',
+                        help="print the reports to the console as well")
+    parser.add_argument('--no-report-echo', dest='report_echo', action='store_false')
+    parser.add_argument('--link-graph', dest='link_graph', action='store_true',
+                        help="keep every link in link_graph.bin and list every referrer of a broken page")
+    parser.add_argument('--no-link-graph', dest='link_graph', action='store_false')
+    parser.add_argument("--metrics-port", dest="metrics_port", type=int,
+                        help="serve prometheus metrics on this local port ( partition N of a distributed crawl "
+                             "uses port + N )")
+    parser.set_defaults(testjs=False, report_echo=REPORT_ECHO, link_graph=LINK_GRAPH)
+    args = parser.parse_args()
+    if (args.partitions or args.join) and args.since:
+        parser.error("--since is not supported for distributed crawls")
+    if args.listen and not args.partitions:
+        parser.error("--listen needs --partitions")
+    return args
 
 
 if __name__ == "__main__":
@@ -223,9 +419,46 @@ if __name__ == "__main__":
         detect_js_and_resource_issues(url_list_file)
         sys.exit(0)
 
-    scrapper = TornadoSpider(base_url, sitemap_url)
-    future = scrapper.initiate_crawl()
-    IOLoop.instance().start()
-
-    if enable_js_tests:
-        detect_js_and_resource_issues("all_internal_pages.txt")
+    if args.partitions or args.join:
+        # paths are resolved before the workers move into their partition directories
+        state_dir = os.path.abspath(args.state_dir) if args.state_dir else None
+        response_cache = os.path.abspath(args.response_cache) if args.response_cache else None
+
+        def create_partition_spider(start_url, partition_sitemap_url, partition):
+            suffix = partition_dir(partition.index)
+            return TornadoSpider(start_url, partition_sitemap_url,
+                                 state_dir=os.path.join(state_dir, suffix) if state_dir else None,
+                                 seen_set_mode=args.seen_set, fetch_strategy=args.fetch_strategy,
+                                 response_cache='{}.{}'.format(response_cache, suffix) if response_cache else None,
+                                 parser_pool_type=args.parser_pool, link_extractor_type=args.link_extractor,
+                                 partition=partition, report_format=args.report_format,
+                                 report_echo=args.report_echo,
+                                 metrics_port=args.metrics_port + partition.index if args.metrics_port else None,
+                                 link_graph=False)
+
+        if args.join:
+            run_remote_worker(args.join, create_partition_spider)
+        elif args.listen:
+            run_coordinator(args.listen, args.partitions, base_url, sitemap_url, args.fetch_strategy,
+                            args.report_format, args.report_echo, args.link_graph)
+        else:
+            run_local(args.partitions, base_url, sitemap_url, args.fetch_strategy, create_partition_spider,
+                      args.report_format, args.report_echo, args.link_graph)
+
+        # partitions may run on other machines , their pages are checked from the merged report once crawled
+        if enable_js_tests and not args.join:
+            detect_js_and_resource_issues("all_internal_pages.txt")
+    else:
+        scrapper = TornadoSpider(base_url, sitemap_url, state_dir=args.state_dir, seen_set_mode=args.seen_set,
+                                 fetch_strategy=args.fetch_strategy, response_cache=args.response_cache,
+                                 since=args.since, parser_pool_type=args.parser_pool,
+                                 link_extractor_type=args.link_extractor, check_pages=enable_js_tests,
+                                 report_format=args.report_format, report_echo=args.report_echo,
+                                 metrics_port=args.metrics_port, link_graph=args.link_graph)
+        signal.signal(signal.SIGINT,
+                      lambda signum, frame: IOLoop.instance().add_callback_from_signal(scrapper.stop))
+        future = scrapper.initiate_crawl()
+        try:
+            IOLoop.instance().start()
+        finally:
+            scrapper.close()
@@ -0,0 +1,101 @@
+import re
+import urllib
+import urlparse
+from fnmatch import fnmatch
+
+from config import CANONICAL_MERGE_HTTP_HTTPS, CANONICAL_SORT_QUERY_PARAMETERS, CANONICAL_QUERY_PARAMETERS_TO_DROP
+
+
+__author__ = 'jayesh'
+
+DEFAULT_PORTS = {'http': '80', 'https': '443'}
+UNRESERVED_CHARACTERS = frozenset('ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-._~')
+PERCENT_ESCAPE = re.compile(r'%([0-9a-fA-F]{2})')
+
+
+def _normalize_escape(match):
+    character = chr(int(match.group(1), 16))
+    if character in UNRESERVED_CHARACTERS:
+        return character
+    return '%' + match.group(1).upper()
+
+
+def _normalize_escapes(value):
+    return PERCENT_ESCAPE.sub(_normalize_escape, value)
+
+
+def _remove_dot_segments(path):
+    if '.' not in path:
+        return path
+    output = []
+    for segment in path.split('/'):
+        if segment == '..':
+            if len(output) > 1:
+                output.pop()
+        elif segment != '.':
+            output.append(segment)
+    if path.endswith(('/.', '/..')):
+        output.append('')
+    return '/'.join(output)
+
+
+def _normalize_netloc(scheme, netloc):
+    userinfo, at, host_port = netloc.rpartition('@')
+    if host_port.startswith('['):
+        closing = host_port.find(']')
+        host, port = host_port[:closing + 1], host_port[closing + 2:]
+    else:
+        host, _, port = host_port.partition(':')
+    host = host.lower().rstrip('.')
+    if port and port != DEFAULT_PORTS.get(scheme):
+        host = '{}:{}'.format(host, port)
+    return userinfo + at + host
+
+
+def _is_dropped_parameter(name):
+    for pattern in CANONICAL_QUERY_PARAMETERS_TO_DROP:
+        if fnmatch(name, pattern):
+            return True
+    return False
+
+
+def _normalize_query(query):
+    if not query:
+        return query
+    parameters = [parameter for parameter in query.split('&') if parameter]
+    if CANONICAL_QUERY_PARAMETERS_TO_DROP:
+        parameters = [parameter for parameter in parameters
+                      if not _is_dropped_parameter(urllib.unquote_plus(parameter.partition('=')[0]))]
+    if CANONICAL_SORT_QUERY_PARAMETERS:
+        parameters.sort()
+    return '&'.join(parameters)
+
+
+def canonicalize_url(url):
+    """
+    Returns the interned dedup key for url: lower cased scheme and host,
+    default port dropped, dot segments and percent escapes normalized,
+    trailing slash and fragment removed and query parameters filtered and
+    sorted as configured.
+    """
+    if isinstance(url, unicode):
+        url = url.encode('utf-8')
+    url = url.strip()
+    try:
+        scheme, netloc, path, query, _ = urlparse.urlsplit(url)
+    except ValueError:
+        return intern(url)
+
+    scheme = scheme.lower()
+    netloc = _normalize_netloc(scheme, netloc)
+    if CANONICAL_MERGE_HTTP_HTTPS and scheme == 'https':
+        scheme = 'http'
+    path = _remove_dot_segments(_normalize_escapes(path))
+    if path.endswith('/'):
+        path = path[:-1]
+    query = _normalize_query(_normalize_escapes(query))
+
+    key = '{}://{}{}'.format(scheme, netloc, path) if scheme else netloc + path
+    if query:
+        key = '{}?{}'.format(key, query)
+    return intern(key)
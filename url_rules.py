@@ -0,0 +1,178 @@
+import logging
+import re
+
+from config import DOMAINS_TO_BE_SKIPPED, URL_SEGMENTS_TO_SKIP, DOMAINS_TO_BE_ALLOWED, URL_SEGMENTS_TO_ALLOW
+
+
+__author__ = 'jayesh'
+
+logger = logging.getLogger(__name__)
+
+REGEX_RULE_PREFIX = 're:'
+_DOMAIN_AND_SUBDOMAINS = '.'
+_SUBDOMAINS_ONLY = '*'
+
+
+def hostname_of(netloc):
+    """
+    Host part of a network location , without credentials and port.
+    """
+    host = netloc.rpartition('@')[2]
+    if host.startswith('['):
+        return host[:host.find(']') + 1]
+    return host.partition(':')[0].lower()
+
+
+def _glob_to_regex(pattern):
+    return ''.join('.*' if char == '*' else '.' if char == '?' else re.escape(char) for char in pattern)
+
+
+def _literals_to_regex(literals):
+    """
+    Single regex for a list of literals with the common prefixes factored
+    out, the regex engine then walks it like a trie instead of trying every
+    literal at every position.
+    """
+    trie = dict()
+    for literal in literals:
+        node = trie
+        for char in literal:
+            node = node.setdefault(char, dict())
+        node[''] = True
+    return _trie_node_to_regex(trie)
+
+
+def _trie_node_to_regex(node):
+    alternatives = [re.escape(char) + _trie_node_to_regex(child) for char, child in sorted(node.items()) if char]
+    if not alternatives:
+        return ''
+    optional = '' in node
+    if len(alternatives) == 1 and not optional:
+        return alternatives[0]
+    return '(?:{}){}'.format('|'.join(alternatives), '?' if optional else '')
+
+
+def _compile(patterns, anchored):
+    if not patterns:
+        return None
+    combined = '|'.join('(?:{})'.format(pattern) for pattern in patterns)
+    return re.compile('^(?:{})$'.format(combined) if anchored else combined, re.IGNORECASE if anchored else 0)
+
+
+class HostRules(object):
+    """
+    Host rules compiled once : exact hosts go in a set, '.example.com'
+    ( example.com and its sub domains ) and '*.example.com' ( sub domains
+    only ) in a trie of reversed labels, glob and 're:' patterns in one
+    combined regex. Matching costs one set lookup, one walk over the labels
+    of the host and at most one regex match however many rules there are.
+    """
+
+    def __init__(self, rules):
+        self.exact_hosts = set()
+        self.suffix_trie = dict()
+        self.suffix_count = 0
+        patterns = []
+        for rule in rules:
+            rule = rule.strip()
+            if not rule:
+                continue
+            if rule.startswith(REGEX_RULE_PREFIX):
+                patterns.append(rule[len(REGEX_RULE_PREFIX):])
+            elif rule.startswith('*.') and '*' not in rule[2:] and '?' not in rule:
+                self._add_suffix(rule[2:], _SUBDOMAINS_ONLY)
+            elif '*' in rule or '?' in rule:
+                patterns.append(_glob_to_regex(rule.lower()))
+            elif rule.startswith('.'):
+                self._add_suffix(rule[1:], _DOMAIN_AND_SUBDOMAINS)
+            else:
+                self.exact_hosts.add(rule.lower())
+        self.pattern = _compile(patterns, anchored=True)
+        self.rule_count = len(self.exact_hosts) + self.suffix_count + len(patterns)
+
+    def _add_suffix(self, domain, kind):
+        node = self.suffix_trie
+        for label in reversed(domain.lower().split('.')):
+            node = node.setdefault(label, dict())
+        node[kind] = True
+        self.suffix_count += 1
+
+    def _matches_suffix(self, host):
+        node = self.suffix_trie
+        labels = host.split('.')
+        for index in xrange(len(labels) - 1, -1, -1):
+            node = node.get(labels[index])
+            if node is None:
+                return False
+            if _DOMAIN_AND_SUBDOMAINS in node or (index > 0 and _SUBDOMAINS_ONLY in node):
+                return True
+        return False
+
+    def matches(self, host):
+        if host in self.exact_hosts:
+            return True
+        if self.suffix_trie and self._matches_suffix(host):
+            return True
+        return self.pattern is not None and self.pattern.match(host) is not None
+
+    def __len__(self):
+        return self.rule_count
+
+
+class SegmentRules(object):
+    """
+    Url segment rules ( plain substrings , glob or 're:' patterns ) compiled
+    into a single regex searched once over the url.
+    """
+
+    def __init__(self, rules):
+        literals = []
+        patterns = []
+        for rule in rules:
+            if not rule:
+                continue
+            if rule.startswith(REGEX_RULE_PREFIX):
+                patterns.append(rule[len(REGEX_RULE_PREFIX):])
+            elif '*' in rule or '?' in rule:
+                patterns.append(_glob_to_regex(rule))
+            else:
+                literals.append(rule)
+        if literals:
+            patterns.insert(0, _literals_to_regex(literals))
+        self.pattern = _compile(patterns, anchored=False)
+        self.rule_count = len(literals) + len(patterns) - (1 if literals else 0)
+
+    def matches(self, url):
+        return self.pattern is not None and self.pattern.search(url) is not None
+
+    def __len__(self):
+        return self.rule_count
+
+
+class SkipRules(object):
+    """
+    Decides whether a url is crawled. Allow rules take precedence over the
+    skip rules , so a sub domain or a section of a skipped domain can still
+    be crawled.
+    """
+
+    def __init__(self, domains_to_skip=DOMAINS_TO_BE_SKIPPED, segments_to_skip=URL_SEGMENTS_TO_SKIP,
+                 domains_to_allow=DOMAINS_TO_BE_ALLOWED, segments_to_allow=URL_SEGMENTS_TO_ALLOW):
+        self.skipped_hosts = HostRules(domains_to_skip)
+        self.skipped_segments = SegmentRules(segments_to_skip)
+        self.allowed_hosts = HostRules(domains_to_allow)
+        self.allowed_segments = SegmentRules(segments_to_allow)
+        logger.debug("Compiled {} host and {} segment skip rules , {} host and {} segment allow rules".format(
+            len(self.skipped_hosts), len(self.skipped_segments), len(self.allowed_hosts),
+            len(self.allowed_segments)))
+
+    def is_skipped(self, url, host_skipped, host_allowed, check_segments=True):
+        """
+        host_skipped / host_allowed are the host rule results , cached per
+        host by the caller. Segment rules are only checked when asked.
+        """
+        if host_allowed:
+            return False
+        if not host_skipped and not (check_segments and self.skipped_segments.matches(url)):
+            return False
+        return not self.allowed_segments.matches(url)
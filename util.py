@@ -1,8 +1,11 @@
+import calendar
 import logging
-
-from tldextract import extract
+import re
+import time
+from email.utils import parsedate_tz, mktime_tz
 
 from config import ERROR_CODES
+from host_info import tld_extract, registered_domain_of, domain_with_subdomain_of
 
 
 __author__ = 'jayesh'
@@ -21,7 +24,7 @@ def is_url_redirected_to_external_site(url, redirect_location, base_domain):
 
 
 def extract_base_site(url):
-    extracted = extract(url)
+    extracted = tld_extract(url)
     if extracted.domain.endswith("."):
         return extracted.domain[:-1]
     site = u"http://{}.{}.{}".format(extracted.subdomain, extracted.domain, extracted.tld)
@@ -29,18 +32,21 @@ def extract_base_site(url):
 
 
 def extract_domain(url):
-    extracted = extract(url)
-    domain = u'{}.{}'.format(extracted.domain, extracted.tld)
-    if domain.endswith("."):
-        return decode_to_unicode(domain[:-1])
-    return domain
+    return decode_to_unicode(registered_domain_of(tld_extract(url)))
+
+
+def is_html_page(page, external=False):
+    """
+    Pages listed in all_internal_pages.txt / all_external_pages.txt , html
+    pages fetched without an error.
+    """
+    return page.is_page_internal() != external and page.response_code not in ERROR_CODES \
+        and 'text/html' in page.content_type
 
 
 def print_pages_to_file(file_name, identify_external, page_set, filter_function=None):
     if not filter_function:
-        filter_function = lambda wp: wp.is_page_internal() != identify_external \
-                                     and wp.response_code not in ERROR_CODES \
-                                     and 'text/html' in wp.content_type
+        filter_function = lambda wp: is_html_page(wp, identify_external)
     list_to_print = sorted(filter(filter_function, page_set))
     with open(file_name, 'w') as output_file:
         for page in list_to_print:
@@ -97,9 +103,41 @@ def decode_to_unicode(value):
 
 
 def obtain_domain_with_subdomain_for_page(url):
-    link_info = extract(url)
-    parsed_link = u"{}.{}.{}".format(link_info.subdomain, link_info.domain, link_info.suffix)
-    if not link_info.subdomain:
-        parsed_link = u"{}.{}".format(link_info.domain, link_info.suffix)
+    return domain_with_subdomain_of(tld_extract(url))
 
-    return parsed_link
\ No newline at end of file
+
+def parse_retry_after(value):
+    """
+    Returns the delay in seconds requested by a Retry-After header, which is
+    either a number of seconds or a HTTP date, None when it can't be parsed.
+    """
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return int(value)
+    parsed_date = parsedate_tz(value)
+    if parsed_date is None:
+        return None
+    return max(mktime_tz(parsed_date) - time.time(), 0)
+
+
+W3C_DATETIME = re.compile(r'^(\d{4})-(\d{2})-(\d{2})'
+                          r'(?:T(\d{2}):(\d{2})(?::(\d{2})(?:\.\d+)?)?(Z|[+-]\d{2}:\d{2})?)?$')
+
+
+def parse_w3c_datetime(value):
+    """
+    Returns the epoch time of a sitemap lastmod value ( W3C datetime ), None
+    when it can't be parsed.
+    """
+    match = W3C_DATETIME.match(value.strip()) if value else None
+    if not match:
+        return None
+    year, month, day, hour, minute, second, zone = match.groups()
+    timestamp = calendar.timegm((int(year), int(month), int(day), int(hour or 0), int(minute or 0),
+                                 int(second or 0), 0, 0, 0))
+    if zone and zone != 'Z':
+        offset = int(zone[1:3]) * 3600 + int(zone[4:6]) * 60
+        timestamp -= offset if zone[0] == '+' else -offset
+    return timestamp
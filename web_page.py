@@ -1,10 +1,9 @@
 import logging
 
-from tornado.httpclient import AsyncHTTPClient
-from tldextract import extract
-
-from config import DEFAULT_LOGGER_LEVEL, HARD_CODED_LINKS, HARD_CODED_LINK_EXCLUSIONS, URL_SEGMENTS_TO_SKIP
-from util import extract_domain, decode_to_unicode, obtain_domain_with_subdomain_for_page
+from config import DEFAULT_LOGGER_LEVEL, HARD_CODED_LINKS
+from host_info import get_host_classifier
+from url_canonicalizer import canonicalize_url
+from util import decode_to_unicode
 
 
 logging.basicConfig(filemode='w', filename='default.log', level=DEFAULT_LOGGER_LEVEL)
@@ -14,9 +13,15 @@ logger.addHandler(logging.FileHandler('page.log', mode='w'))
 
 
 class WebPage(object):
+    __slots__ = ('url', 'encoded_url', 'key', 'base_domain', 'response_code', 'errors', 'links', 'visited', 'parent',
+                 'base_site', 'content_type', 'domains_to_skip', 'redirect_location', 'hardcoded_urls',
+                 'failure_message', 'retry_after', 'retry_count', 'retry_requested', 'check_only',
+                 'host_classifier')
+
     def __init__(self, url, parent, base_site, base_domain, domains_to_skip):
         self.url = decode_to_unicode(url) if url is not None else decode_to_unicode('')
         self.encoded_url = decode_to_unicode(self.url)
+        self.key = canonicalize_url(self.url)
         self.base_domain = base_domain
         self.response_code = -1
         self.errors = []
@@ -29,40 +34,26 @@ class WebPage(object):
         self.redirect_location = decode_to_unicode('')
         self.hardcoded_urls = set()
         self.failure_message = decode_to_unicode('')
-        AsyncHTTPClient.configure("tornado.curl_httpclient.CurlAsyncHTTPClient")
+        self.retry_after = None
+        self.retry_count = 0
+        self.retry_requested = False
+        self.check_only = False
+        self.host_classifier = get_host_classifier(base_domain, domains_to_skip)
 
     def is_page_internal(self, url=None):
         if not url:
             url = self.url
-
-        if self.base_domain not in extract_domain(url):
-            return False
-        return True
+        return self.host_classifier.classify(url).internal
 
     def skip_page(self):
-        parsed_link = obtain_domain_with_subdomain_for_page(self.url)
-
-        for skipped_domain in self.domains_to_skip:
-            if parsed_link == skipped_domain:
-                return True
-
-        for segment_to_skip in URL_SEGMENTS_TO_SKIP:
-            if segment_to_skip in self.url:
-                return True
-
-        return False
+        return self.host_classifier.is_skipped(self.url)
 
     def _process_hardcoded_url(self, href_link):
         if href_link.startswith(u'http://') or href_link.startswith(u'https://'):
-            link_info = extract(href_link)
-            parsed_link = u"{}.{}.{}".format(link_info.subdomain, link_info.domain, link_info.suffix)
             if 'all' in HARD_CODED_LINKS:
                 self.hardcoded_urls.add(href_link)
-            else:
-                if parsed_link in HARD_CODED_LINKS:
-                    for hard_coded_exclusion in HARD_CODED_LINK_EXCLUSIONS:
-                        if not hard_coded_exclusion in href_link:
-                            self.hardcoded_urls.add(href_link)
+            elif self.host_classifier.is_hardcoded(href_link):
+                self.hardcoded_urls.add(href_link)
 
     def process(self, spider):
         raise NotImplementedError("implement client specific process")
@@ -72,18 +63,13 @@ class WebPage(object):
         spider.process_web_page(self)
 
     def __hash__(self):
-        url = self.url
-        url = url[:-1] if url.endswith('/') else url
-        return hash(url.replace("https", 'http'))
+        return hash(self.key)
 
     def __eq__(self, other):
-        url = self.url
-        url = url[:-1] if url.endswith('/') else url
-
-        other_url = other.url
-        other_url = other_url[:-1] if other_url.endswith('/') else other_url
+        return isinstance(other, WebPage) and self.key == other.key
 
-        return url.replace("https", 'http') == other_url.replace("https", 'http')
+    def __ne__(self, other):
+        return not self.__eq__(other)
 
     def __str__(self):
         return "Url: {}," \